@@ -0,0 +1,104 @@
+"""
+Simulation of the adaptive perf test iteration count.
+
+Draws the iteration averages of a metric from normal distributions with the
+given coefficients of variation and counts how many iterations the
+ConfidenceTracker stopping rule of an adaptive perf RecipeConf needs and
+how often the true mean ends up outside of the final confidence interval.
+Run from the repository root:
+
+    python -m benchmarks.adaptive_iterations --cv 0.5 2 5 --target 2
+
+With 95% confidence, 3 to 20 iterations and 2000 runs:
+
+      cv %   mean iter  reached %   missed %
+       0.5        3.71      100.0        5.2
+         2       14.82       75.2        9.8
+         5       19.82        1.1        5.7
+
+and with --corrected:
+
+       0.5        6.51      100.0        0.5
+         2       19.84        2.6        0.4
+         5       19.98        0.1        0.1
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import random
+from statistics import fmean
+from lnst.RecipeCommon.Perf.Confidence import ConfidenceTracker
+from lnst.RecipeCommon.Perf.Measurements.Results import CPUMeasurementResults
+from lnst.RecipeCommon.Perf.Results import PerfInterval
+
+MEAN = 1000.0
+
+
+class BenchmarkMeasurement(object):
+    pass
+
+
+def iteration_result(measurement, average):
+    result = CPUMeasurementResults(measurement, True, "host1", "cpu0")
+    result.utilization = PerfInterval(average, 1, "time units", 0)
+    return result
+
+
+def simulate(cv, args, rng):
+    measurement = BenchmarkMeasurement()
+    checks = 1
+    if args.corrected:
+        checks = args.max_iterations - args.min_iterations + 1
+    tracker = ConfidenceTracker(args.target, args.confidence, checks)
+    averages = []
+    for i in range(args.max_iterations):
+        averages.append(rng.gauss(MEAN, MEAN * cv / 100))
+        tracker.add_iteration(measurement,
+                              [iteration_result(measurement, averages[-1])])
+        if i + 1 >= args.min_iterations and tracker.target_reached():
+            break
+
+    width = tracker.widths[(measurement, 0, "utilization")]
+    half_width = width / 200 * abs(fmean(averages))
+    missed = abs(fmean(averages) - MEAN) > half_width
+    return len(averages), tracker.target_reached(), missed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cv", type=float, nargs="+", default=[0.5, 2, 5],
+                        help="coefficients of variation of the iteration "
+                             "averages in percent")
+    parser.add_argument("--target", type=float, default=2.0,
+                        help="target relative confidence interval width in "
+                             "percent")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--min-iterations", type=int, default=3)
+    parser.add_argument("--max-iterations", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=2000,
+                        help="number of simulated perf tests per cv")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--corrected", action="store_true",
+                        help="correct the confidence level for the repeated "
+                             "stopping checks")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print("{:>6} {:>10} {:>10} {:>10}".format(
+        "cv %", "mean iter", "reached %", "missed %"))
+    for cv in args.cv:
+        runs = [simulate(cv, args, rng) for i in range(args.runs)]
+        print("{:>6g} {:>10.2f} {:>10.1f} {:>10.1f}".format(
+            cv,
+            fmean(iterations for iterations, reached, missed in runs),
+            100 * sum(reached for iterations, reached, missed in runs)
+            / len(runs),
+            100 * sum(missed for iterations, reached, missed in runs)
+            / len(runs)))
+
+
+if __name__ == "__main__":
+    main()
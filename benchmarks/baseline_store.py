@@ -0,0 +1,100 @@
+"""
+Benchmark of the BaselineStore lookups.
+
+Stores the given numbers of runs of a recipe with the given number of CPU
+results each into a temporary BaselineStore and measures how long storing
+a run and fetching the baselines of all results of a run for the
+StoredBaselineEvaluator take. Run from the repository root:
+
+    python -m benchmarks.baseline_store --runs 100 1000 5000 --results 64
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from lnst.Common.Parameters import Parameters
+from lnst.RecipeCommon.Perf.BaselineStore import BaselineStore
+from lnst.RecipeCommon.Perf.Evaluators import StoredBaselineEvaluator
+from lnst.RecipeCommon.Perf.Measurements.Results import CPUMeasurementResults
+from lnst.RecipeCommon.Perf.Recipe import RecipeConf as PerfRecipeConf
+from lnst.RecipeCommon.Perf.Results import PerfInterval, SequentialPerfResult
+
+
+class BenchmarkRecipe(object):
+    def __init__(self):
+        self.params = Parameters()
+        self.params.perf_iterations = 5
+        self.params.perf_duration = 60
+
+
+class BenchmarkMeasurement(object):
+    version = "1"
+
+
+class BenchmarkHost(object):
+    hostid = "host1"
+
+    def __str__(self):
+        return "Host(machine_id=host1)"
+
+
+def run_results(measurement, host, count):
+    results = []
+    for cpu in range(count):
+        result = CPUMeasurementResults(measurement, True, host,
+                                       "cpu{}".format(cpu))
+        result.utilization = SequentialPerfResult(
+            [PerfInterval(random.uniform(40, 60), 1, "time units", i)
+             for i in range(60)])
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, nargs="+", default=[100, 1000, 5000],
+                        help="numbers of stored runs to measure with")
+    parser.add_argument("--results", type=int, default=64,
+                        help="number of results of each run")
+    parser.add_argument("--history", type=int, default=10,
+                        help="number of runs the baselines are computed from")
+    args = parser.parse_args()
+
+    recipe = BenchmarkRecipe()
+    measurement = BenchmarkMeasurement()
+    recipe_conf = PerfRecipeConf([measurement], 5)
+    results = run_results(measurement, BenchmarkHost(), args.results)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = BaselineStore(os.path.join(tmpdir, "baselines.db"))
+        evaluator = StoredBaselineEvaluator(store, history=args.history)
+        stored = 0
+
+        print("{:>8} {:>10} {:>10}".format("runs", "store ms", "lookup ms"))
+        for runs in args.runs:
+            while stored < runs:
+                start = time.perf_counter()
+                store.store_results(recipe, recipe_conf, results,
+                                    timestamp=stored)
+                store_time = time.perf_counter() - start
+                stored += 1
+
+            start = time.perf_counter()
+            baselines = evaluator.get_baselines(recipe, recipe_conf, results)
+            lookup_time = time.perf_counter() - start
+            assert all(b.utilization.runs == min(runs, args.history)
+                       for b in baselines)
+
+            print("{:>8} {:>10.2f} {:>10.2f}".format(
+                runs, store_time * 1000, lookup_time * 1000))
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark of the CPUStatMonitor result formats.
+
+Generates /proc/stat contents of a machine with the given number of cpus
+and processes the given number of samples of it the way CPUStatMonitor does
+in the default and in the compact mode. Prints the agent side processing
+time, the size of the pickled job result and the time StatCPUMeasurement
+needs to create the results from it on the controller. Run from the
+repository root:
+
+    python -m benchmarks.cpu_stat_samples --cpus 384 --samples 60 600
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import pickle
+import random
+import time
+from lnst.Tests.CPUStatMonitor import CPUStatMonitor, CompactCPUStats
+from lnst.RecipeCommon.Perf.Measurements.StatCPUMeasurement import StatCPUMeasurement
+
+
+class FakeJob(object):
+    host = None
+    passed = True
+
+    def __init__(self, result):
+        self.result = result
+
+
+def generate_stats(cpus, samples):
+    counters = [[random.randrange(10**6) for _ in range(10)]
+                for _ in range(cpus + 1)]
+    stats = []
+    for _ in range(samples):
+        lines = []
+        for i, cpu in enumerate(counters):
+            for j in range(len(cpu)):
+                cpu[j] += random.randrange(100)
+            name = "cpu" if i == 0 else "cpu{}".format(i - 1)
+            lines.append("{} {}\n".format(name, " ".join(map(str, cpu))))
+        lines.append("intr 1234 0 0 0\nctxt 5678\nbtime 1700000000\n")
+        stats.append("".join(lines))
+    return stats
+
+
+def default_mode(monitor, stats):
+    raw_samples = []
+    for i, stat in enumerate(stats):
+        stat_lines = "".join(l for l in stat.splitlines(True)
+                             if l.startswith("cpu"))
+        raw_samples.append({"timestamp": 1000.0 + i, "stat": stat_lines})
+    return {"raw_data": raw_samples,
+            "data": monitor._process_samples(raw_samples)}
+
+
+def compact_mode(monitor, stats):
+    compact_stats = CompactCPUStats()
+    for i, stat in enumerate(stats):
+        compact_stats.add_sample(1000.0 + i, stat.encode())
+    return {"compact": compact_stats.result()}
+
+
+def measure(mode, stats):
+    monitor = CPUStatMonitor()
+    start = time.perf_counter()
+    result = mode(monitor, stats)
+    agent_time = time.perf_counter() - start
+
+    data = pickle.dumps(result)
+
+    measurement = StatCPUMeasurement([])
+    start = time.perf_counter()
+    measurement._process_job(FakeJob(pickle.loads(data)))
+    ctl_time = time.perf_counter() - start
+    return agent_time, len(data), ctl_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cpus", type=int, default=384,
+                        help="number of cpus of the generated /proc/stat")
+    parser.add_argument("--samples", type=int, nargs="+", default=[60, 600],
+                        help="numbers of samples to measure")
+    args = parser.parse_args()
+
+    print("{:>8} {:>8} {:>10} {:>10} {:>10}".format(
+        "mode", "samples", "agent ms", "KiB", "ctl ms"))
+    for samples in args.samples:
+        stats = generate_stats(args.cpus, samples)
+        for name, mode in [("default", default_mode),
+                           ("compact", compact_mode)]:
+            agent_time, size, ctl_time = measure(mode, stats)
+            print("{:>8} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                name, samples, agent_time * 1000, size / 1024,
+                ctl_time * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark of the device reference translation of Controller-Agent messages.
+
+Builds result messages with the given numbers of CPU statistics like samples
+and a few device references and times their serialization and
+deserialization with the DeviceRefPickler/DeviceRefUnpickler, compared to
+plain pickle and to the recursive rewriting of the message containers that
+was done before each pickle.dumps and after each pickle.loads. Run from the
+repository root:
+
+    python -m benchmarks.device_refs --samples 1000 10000 100000
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import pickle
+import random
+import time
+from lnst.Common.DeviceRef import DeviceRef
+from lnst.Common.DeviceRef import device_refs_dumps, device_refs_loads
+
+
+class FakeDevice(object):
+    def __init__(self, ifindex):
+        self.ifindex = ifindex
+
+
+def create_message(samples, devices):
+    result = {"devices": devices,
+              "samples": [{"cpu": i % 8,
+                           "timestamp": float(i),
+                           "user": random.random(),
+                           "system": random.random(),
+                           "idle": random.random(),
+                           "values": [random.random() for _ in range(4)]}
+                          for i in range(samples)]}
+    return {"type": "result", "request_id": 1, "result": result}
+
+
+def rewrite(obj, translate):
+    """the container walk the messages used to go through"""
+    if isinstance(obj, (FakeDevice, DeviceRef)):
+        return translate(obj)
+    elif isinstance(obj, dict):
+        return {key: rewrite(value, translate) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [rewrite(value, translate) for value in obj]
+    elif isinstance(obj, tuple):
+        return tuple(rewrite(value, translate) for value in obj)
+    return obj
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ret = func()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best, ret
+
+
+def measure(samples, repeat):
+    devices = {i: FakeDevice(i) for i in range(1, 9)}
+    msg = create_message(samples, list(devices.values()))
+
+    def get_device(ifindex, netns):
+        return devices[ifindex]
+
+    def to_ref(dev):
+        return DeviceRef(dev.ifindex)
+
+    def from_ref(ref):
+        return devices[ref.ifindex]
+
+    plain_msg = rewrite(msg, to_ref)
+    plain = pickle.dumps(plain_msg)
+    plain_dump, _ = timed(lambda: pickle.dumps(plain_msg), repeat)
+    plain_load, _ = timed(lambda: pickle.loads(plain), repeat)
+
+    walk_dump, _ = timed(lambda: pickle.dumps(rewrite(msg, to_ref)), repeat)
+    walk_load, _ = timed(lambda: rewrite(pickle.loads(plain), from_ref), repeat)
+
+    refs_dump, data = timed(lambda: device_refs_dumps(msg, (FakeDevice,)),
+                            repeat)
+    refs_load, _ = timed(lambda: device_refs_loads(data, get_device), repeat)
+
+    return [(plain_dump, plain_load), (walk_dump, walk_load),
+            (refs_dump, refs_load)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--samples", type=int, nargs="+",
+                        default=[1000, 10000, 100000],
+                        help="numbers of samples in the message")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="the best of this many runs is reported")
+    args = parser.parse_args()
+
+    print("{:>8} {:>22} {:>22} {:>22}".format(
+        "samples", "plain dump/load ms", "rewrite dump/load ms",
+        "refs dump/load ms"))
+    for samples in args.samples:
+        row = measure(samples, args.repeat)
+        print("{:>8} {}".format(samples, " ".join(
+            "{:>10.2f} {:>11.2f}".format(dump * 1000, load * 1000)
+            for dump, load in row)))
+
+
+if __name__ == "__main__":
+    main()
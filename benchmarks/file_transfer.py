@@ -0,0 +1,101 @@
+"""
+Benchmark of Machine.copy_file_to_machine and copy_file_from_machine.
+
+Connects to a running lnst-agent (by default on localhost, the "loopback"
+case) and reports MB/s for files of several sizes, comparing the windowed
+transfer against a single chunk in flight and the available compression
+methods. Run from the repository root:
+
+    lnst-agent -p 9999 &
+    python -m benchmarks.file_transfer --sizes 10 100 1024
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from lnst.Common.Logs import LoggingCtl
+from lnst.Controller.Config import CtlConfig
+from lnst.Controller.MessageDispatcher import MessageDispatcher
+from lnst.Controller.Machine import Machine, COPY_WINDOW
+
+
+def connect(hostname, port):
+    log_ctl = LoggingCtl(0, log_dir=tempfile.mkdtemp(prefix="lnst-bench-"))
+    msg_dispatcher = MessageDispatcher(log_ctl)
+    machine = Machine("bench", hostname, msg_dispatcher, CtlConfig(),
+                      rpcport=port, security={"auth_type": "none"})
+    machine.init_connection()
+    return machine
+
+
+def create_file(path, size_mb):
+    # half random, half zeroes so that compression has something to do
+    block = os.urandom(512*1024) + bytes(512*1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+def measure(func, size_mb):
+    start = time.perf_counter()
+    func()
+    return size_mb / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="localhost", help="agent hostname")
+    parser.add_argument("--port", type=int, default=9999, help="agent port")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1024],
+                        help="file sizes in MB")
+    parser.add_argument("--compression", nargs="*", default=[None, "zlib"],
+                        help="compression methods to measure")
+    parser.add_argument("--remote-path", default="/tmp/lnst-file-transfer-benchmark",
+                        help="file on the agent that is overwritten by the "
+                             "benchmark, truncated when finished")
+    args = parser.parse_args()
+
+    machine = connect(args.host, args.port)
+    tmpdir = tempfile.mkdtemp(prefix="lnst-bench-")
+    local_path = os.path.join(tmpdir, "src")
+    back_path = os.path.join(tmpdir, "dst")
+
+    print("{:>8} {:>8} {:>12} {:>12} {:>12}".format("size MB", "window",
+                                                    "compression", "to MB/s",
+                                                    "from MB/s"))
+    try:
+        for size_mb in args.sizes:
+            create_file(local_path, size_mb)
+            for window in [1, COPY_WINDOW]:
+                for compression in args.compression:
+                    def copy_to():
+                        machine.copy_file_to_machine(
+                            local_path, args.remote_path, window=window,
+                            compression=compression)
+
+                    def copy_from():
+                        machine.copy_file_from_machine(
+                            args.remote_path, back_path, window=window,
+                            compression=compression)
+
+                    to_rate = measure(copy_to, size_mb)
+                    from_rate = measure(copy_from, size_mb)
+                    print("{:>8} {:>8} {:>12} {:>12.1f} {:>12.1f}".format(
+                          size_mb, window, str(compression), to_rate, from_rate))
+    finally:
+        open(local_path, "wb").close()
+        machine.copy_file_to_machine(local_path, args.remote_path)
+        for path in [local_path, back_path]:
+            if os.path.exists(path):
+                os.unlink(path)
+        os.rmdir(tmpdir)
+        machine.rpc_call("bye")
+
+
+if __name__ == "__main__":
+    main()
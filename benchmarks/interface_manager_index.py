@@ -0,0 +1,104 @@
+"""
+Lookup benchmark of the Agent's InterfaceManager device index.
+
+Creates a network namespace with 2000 dummy links, builds an
+InterfaceManager inside of it and times the get_device, get_device_by_name
+and get_device_by_hwaddr lookups. For comparison the same lookups are also
+timed with a full netlink dump before each of them, which is what every
+lookup used to cost. Needs root privileges, run from the repository root:
+
+    python -m benchmarks.interface_manager_index
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import random
+import subprocess
+import time
+from pyroute2 import netns
+from lnst.Agent.InterfaceManager import InterfaceManager
+from lnst.Devices.Device import Device
+from lnst.Devices.LoopbackDevice import LoopbackDevice
+
+NETNS_NAME = "lnst-bench-ifmanager"
+
+
+class DiscardingServerHandler(object):
+    def send_data_to_ctl(self, data):
+        pass
+
+
+def create_links(count, kind):
+    subprocess.run(["ip", "netns", "add", NETNS_NAME], check=True)
+    batch = "".join("link add bench{} type {}\n".format(i, kind)
+                    for i in range(count))
+    subprocess.run(["ip", "-n", NETNS_NAME, "-b", "-"], input=batch,
+                   text=True, check=True)
+
+
+def create_if_manager():
+    if_manager = InterfaceManager(DiscardingServerHandler())
+    # only the classes used for devices not created through the manager
+    for cls in [Device, LoopbackDevice]:
+        if_manager.add_device_class(cls.__name__, cls)
+    if_manager.resync_devices()
+    return if_manager
+
+
+def run(if_manager, lookups, full_dump):
+    devices = if_manager.get_devices()
+    results = []
+    for name, lookup, key in [
+            ("get_device", if_manager.get_device, lambda d: d.ifindex),
+            ("get_device_by_name", if_manager.get_device_by_name,
+                lambda d: d.name),
+            ("get_device_by_hwaddr", if_manager.get_device_by_hwaddr,
+                lambda d: d.hwaddr)]:
+        keys = [key(random.choice(devices)) for _ in range(lookups)]
+
+        start = time.perf_counter()
+        for k in keys:
+            if full_dump:
+                if_manager.resync_devices()
+            lookup(k)
+        elapsed = time.perf_counter() - start
+        results.append((name, elapsed / lookups))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--links", type=int, default=2000)
+    parser.add_argument("--kind", default="dummy",
+                        help="link type to create, default dummy")
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--dump-lookups", type=int, default=20,
+                        help="lookups to time with a full dump before each")
+    args = parser.parse_args()
+
+    create_links(args.links, args.kind)
+    try:
+        netns.setns(NETNS_NAME)
+
+        start = time.perf_counter()
+        if_manager = create_if_manager()
+        print("initial sync of {} devices: {:.3f} s".format(
+            len(if_manager.get_devices()), time.perf_counter() - start))
+
+        indexed = run(if_manager, args.lookups, False)
+        dumped = run(if_manager, args.dump_lookups, True)
+
+        print("{:>22} {:>14} {:>14}".format("lookup", "index us",
+                                             "full dump us"))
+        for (name, index_time), (_, dump_time) in zip(indexed, dumped):
+            print("{:>22} {:>14.1f} {:>14.1f}".format(
+                name, index_time * 1e6, dump_time * 1e6))
+    finally:
+        subprocess.run(["ip", "netns", "del", NETNS_NAME])
+
+
+if __name__ == "__main__":
+    main()
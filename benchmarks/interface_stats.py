@@ -0,0 +1,77 @@
+"""
+Benchmark of the ways to read the statistics of network interfaces.
+
+Measures the time one sample of the given devices takes when it's read by
+a RTM_GETLINK request per device (which is what Device.link_stats64 does),
+by the RTM_GETSTATS requests of InterfaceStatsMonitor and from the sysfs
+statistics files read with pread. Run from the repository root:
+
+    python -m benchmarks.interface_stats --devices lo eth0 --samples 10000
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import os
+import socket
+import time
+from pyroute2 import IPRoute
+from lnst.Tests.InterfaceStatsMonitor import NetlinkStatsReader, SysfsStatsReader
+
+STATS = ["rx_packets", "tx_packets", "rx_bytes", "tx_bytes"]
+
+
+class GetLinkReader(object):
+    def __init__(self, ifindexes, stats):
+        self._ifindexes = ifindexes
+        self._stats = stats
+        self._ipr = IPRoute()
+
+    def read(self):
+        result = []
+        for ifindex in self._ifindexes:
+            link = self._ipr.link("get", index=ifindex)[0]
+            stats64 = link.get_attr("IFLA_STATS64")
+            result.append([stats64[stat] for stat in self._stats])
+        return result
+
+    def close(self):
+        self._ipr.close()
+
+
+def measure(reader, samples):
+    start = time.perf_counter()
+    for _ in range(samples):
+        reader.read()
+    duration = time.perf_counter() - start
+    reader.close()
+    return duration / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", nargs="+",
+                        default=sorted(os.listdir("/sys/class/net")),
+                        help="names of the devices to read")
+    parser.add_argument("--samples", type=int, default=10000,
+                        help="number of samples to read")
+    args = parser.parse_args()
+
+    ifindexes = [socket.if_nametoindex(name) for name in args.devices]
+    readers = [
+        ("getlink", lambda: GetLinkReader(ifindexes, STATS)),
+        ("getstats", lambda: NetlinkStatsReader(ifindexes, STATS)),
+        ("sysfs", lambda: SysfsStatsReader(args.devices, STATS)),
+    ]
+
+    print("{} devices".format(len(args.devices)))
+    print("{:>9} {:>12}".format("reader", "sample us"))
+    for name, make_reader in readers:
+        sample_time = measure(make_reader(), args.samples)
+        print("{:>9} {:>12.1f}".format(name, sample_time * 10**6))
+
+
+if __name__ == "__main__":
+    main()
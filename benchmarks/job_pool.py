@@ -0,0 +1,73 @@
+"""
+Benchmark of short Jobs run through host.run().
+
+Connects to a running lnst-agent (by default on localhost) and reports the
+number of host.run("true") calls finished per second with the agent's job
+worker pool disabled and with the given number of pre-forked workers. Run
+from the repository root:
+
+    lnst-agent -p 9999 &
+    python -m benchmarks.job_pool --jobs 200 --workers 4
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import tempfile
+import time
+from lnst.Common.Logs import LoggingCtl
+from lnst.Controller.Config import CtlConfig
+from lnst.Controller.MessageDispatcher import MessageDispatcher
+from lnst.Controller.Machine import Machine
+from lnst.Controller.Host import Host
+
+
+def connect(hostname, port):
+    log_ctl = LoggingCtl(0, log_dir=tempfile.mkdtemp(prefix="lnst-bench-"))
+    log_ctl.set_recipe("JobPoolBenchmark")
+    log_ctl.add_agent("bench")
+    msg_dispatcher = MessageDispatcher(log_ctl)
+    machine = Machine("bench", hostname, msg_dispatcher, CtlConfig(),
+                      rpcport=port, security={"auth_type": "none"})
+    machine.init_connection()
+    host = Host(machine)
+    machine.set_mapped(True)
+    machine.prepare_machine()
+    return machine, host
+
+
+def measure(host, command, jobs):
+    start = time.perf_counter()
+    for _ in range(jobs):
+        host.run(command)
+    return jobs / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="localhost", help="agent hostname")
+    parser.add_argument("--port", type=int, default=9999, help="agent port")
+    parser.add_argument("--jobs", type=int, default=200,
+                        help="number of jobs to run for each pool size")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4],
+                        help="pool sizes to measure besides the disabled pool")
+    parser.add_argument("--command", default="true",
+                        help="shell command to run, default 'true'")
+    args = parser.parse_args()
+
+    machine, host = connect(args.host, args.port)
+    try:
+        print("{:>8} {:>10}".format("workers", "jobs/s"))
+        for workers in [0] + args.workers:
+            machine.rpc_call("set_job_workers", workers)
+            rate = measure(host, args.command, args.jobs)
+            print("{:>8} {:>10.1f}".format(workers, rate))
+    finally:
+        machine.rpc_call("set_job_workers", 0)
+        machine.rpc_call("bye")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark of the log record shipping of the agent.
+
+Logs the given numbers of DEBUG records through a TransmitHandler and through
+a BatchingTransmitHandler connected to a pipe that is drained by a thread
+(standing in for the controller) and prints the records per second and the
+number of messages that had to be sent. Run from the repository root:
+
+    python -m benchmarks.log_shipping --records 10000 100000
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import logging
+import threading
+import time
+from multiprocessing import Pipe
+from lnst.Common.LoggingHandler import TransmitHandler, BatchingTransmitHandler
+
+
+def drain(reader, counts):
+    while True:
+        try:
+            msg = reader.recv()
+        except EOFError:
+            return
+        counts[0] += 1
+        if msg["type"] == "log":
+            counts[1] += 1
+        else:
+            counts[1] += len(msg["records"])
+
+
+def measure(make_handler, records):
+    reader, writer = Pipe(duplex=False)
+    counts = [0, 0]
+    drainer = threading.Thread(target=drain, args=(reader, counts))
+    drainer.start()
+
+    handler = make_handler(writer)
+    logger = logging.getLogger("log_shipping_benchmark")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    try:
+        start = time.perf_counter()
+        for i in range(records):
+            logger.debug("Benchmark record %d", i)
+        handler.flush()
+        duration = time.perf_counter() - start
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+        writer.close()
+        drainer.join()
+    return duration, counts[0], counts[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", type=int, nargs="+",
+                        default=[10000, 100000],
+                        help="numbers of records to log")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="batch size of the BatchingTransmitHandler")
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="rate limit of the BatchingTransmitHandler")
+    args = parser.parse_args()
+
+    handlers = [
+        ("plain", TransmitHandler),
+        ("batching", lambda target: BatchingTransmitHandler(
+            target, batch_size=args.batch_size, rate_limit=args.rate_limit)),
+    ]
+
+    print("{:>10} {:>9} {:>12} {:>10} {:>10}".format(
+        "handler", "records", "records/s", "messages", "received"))
+    for records in args.records:
+        for name, make_handler in handlers:
+            duration, messages, received = measure(make_handler, records)
+            print("{:>10} {:>9} {:>12.0f} {:>10} {:>10}".format(
+                name, records, records / duration, messages, received))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark of the network namespace backends of the agent.
+
+Connects to a running lnst-agent (by default on localhost) and, for both the
+"fork" and the "thread" backend, creates the given numbers of network
+namespaces, measures the latency of rpc calls and short Jobs served by the
+namespaces and the time to delete them again. Run from the repository root
+as root:
+
+    lnst-agent -p 9999 &
+    python -m benchmarks.netns_backends --counts 1 10 100 500
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import tempfile
+import time
+from lnst.Common.Logs import LoggingCtl
+from lnst.Controller.Config import CtlConfig
+from lnst.Controller.MessageDispatcher import MessageDispatcher
+from lnst.Controller.Machine import Machine
+from lnst.Controller.Host import Host
+from lnst.Controller.NetNamespace import NetNamespace
+
+
+def connect(hostname, port):
+    log_ctl = LoggingCtl(0, log_dir=tempfile.mkdtemp(prefix="lnst-bench-"))
+    log_ctl.set_recipe("NetnsBackendsBenchmark")
+    log_ctl.add_agent("bench")
+    msg_dispatcher = MessageDispatcher(log_ctl)
+    machine = Machine("bench", hostname, msg_dispatcher, CtlConfig(),
+                      rpcport=port, security={"auth_type": "none"})
+    machine.init_connection()
+    host = Host(machine)
+    machine.set_mapped(True)
+    machine.prepare_machine()
+    return machine, host
+
+
+def measure(machine, host, backend, count, calls, jobs):
+    namespaces = []
+    start = time.perf_counter()
+    for i in range(count):
+        netns = NetNamespace("lnstb{}{}".format(backend[0], i), backend=backend)
+        setattr(host, "bench_{}_{}_{}".format(backend, count, i), netns)
+        namespaces.append(netns)
+    create = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(calls):
+        machine.rpc_call("get_devices", netns=namespaces[i % count])
+    call = (time.perf_counter() - start) / calls
+
+    start = time.perf_counter()
+    for i in range(jobs):
+        namespaces[i % count].run("true")
+    job = (time.perf_counter() - start) / jobs
+
+    start = time.perf_counter()
+    machine.del_namespaces()
+    delete = time.perf_counter() - start
+    return create, call, job, delete
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="localhost", help="agent hostname")
+    parser.add_argument("--port", type=int, default=9999, help="agent port")
+    parser.add_argument("--counts", type=int, nargs="+",
+                        default=[1, 10, 100, 500],
+                        help="numbers of namespaces to measure")
+    parser.add_argument("--backends", nargs="+", default=["fork", "thread"],
+                        choices=["fork", "thread"], help="backends to measure")
+    parser.add_argument("--calls", type=int, default=500,
+                        help="number of get_devices calls for each count")
+    parser.add_argument("--jobs", type=int, default=50,
+                        help="number of 'true' Jobs for each count")
+    args = parser.parse_args()
+
+    machine, host = connect(args.host, args.port)
+    try:
+        print("{:>8} {:>6} {:>10} {:>10} {:>10} {:>10}".format(
+            "backend", "netns", "create s", "call ms", "job ms", "delete s"))
+        for backend in args.backends:
+            for count in args.counts:
+                create, call, job, delete = measure(
+                    machine, host, backend, count, args.calls, args.jobs)
+                print("{:>8} {:>6} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                    backend, count, create, call * 1000, job * 1000, delete))
+    finally:
+        machine.del_namespaces()
+        machine.rpc_call("bye")
+
+
+if __name__ == "__main__":
+    main()
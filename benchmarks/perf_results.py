@@ -0,0 +1,83 @@
+"""
+Benchmark of the perf result types.
+
+Builds a SequentialPerfResult of PerfInterval objects and a
+ColumnarPerfResult from the same samples for each of the given numbers of
+intervals and prints the time to build them, to compute the value, average
+and standard deviation, to cut a time slice out of the middle and the memory
+they take. Run from the repository root:
+
+    python -m benchmarks.perf_results --counts 1000 10000 100000 1000000
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from lnst.RecipeCommon.Perf.Results import PerfInterval
+from lnst.RecipeCommon.Perf.Results import SequentialPerfResult
+from lnst.RecipeCommon.Perf.Results import ColumnarPerfResult
+
+
+def build_sequential(samples):
+    result = SequentialPerfResult()
+    for value, duration, timestamp in samples:
+        result.append(PerfInterval(value, duration, "bits", timestamp))
+    return result
+
+
+def build_columnar(samples):
+    result = ColumnarPerfResult(unit="bits")
+    for value, duration, timestamp in samples:
+        result.add_interval(value, duration, timestamp)
+    return result
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    res = func(*args)
+    return time.perf_counter() - start, res
+
+
+def measure(build, samples):
+    tracemalloc.start()
+    build_time, result = timed(build, samples)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    stats_time, _ = timed(lambda: (result.value, result.average,
+                                   result.std_deviation))
+    start = samples[0][2]
+    end = samples[-1][2]
+    slice_time, _ = timed(result.time_slice, start + (end - start) / 4,
+                          end - (end - start) / 4)
+    return build_time, stats_time, slice_time, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--counts", type=int, nargs="+",
+                        default=[1000, 10000, 100000, 1000000],
+                        help="numbers of intervals to measure")
+    args = parser.parse_args()
+
+    print("{:>11} {:>8} {:>10} {:>10} {:>10} {:>9}".format(
+        "result", "count", "build ms", "stats ms", "slice ms", "MiB"))
+    for count in args.counts:
+        samples = [(random.uniform(9e9, 1e10), 1.0, 1000.0 + i)
+                   for i in range(count)]
+        for name, build in [("sequential", build_sequential),
+                            ("columnar", build_columnar)]:
+            build_time, stats_time, slice_time, memory = measure(build,
+                                                                 samples)
+            print("{:>11} {:>8} {:>10.2f} {:>10.2f} {:>10.2f} {:>9.2f}".format(
+                name, count, build_time * 1000, stats_time * 1000,
+                slice_time * 1000, memory / 2**20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Micro-benchmark of the SecureSocket wire framing modes.
+
+Pushes messages of several sizes through a socketpair wrapped in
+SecureSocket instances and reports messages/s and MB/s for each of the
+supported framing modes. For reference it also measures the original ascii
+receive path that concatenated the payload chunk by chunk ("ascii-legacy").
+Run from the repository root:
+
+    python -m benchmarks.secure_socket_framing
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import socket
+import threading
+import time
+from lnst.Common.SecureSocket import SecureSocket, SUPPORTED_FRAMINGS
+from lnst.Common.SecureSocket import FRAMING_ASCII
+
+DEFAULT_SIZES = [64, 1024, 64*1024, 1024*1024, 8*1024*1024]
+LEGACY = "ascii-legacy"
+
+
+class LegacySecureSocket(SecureSocket):
+    """receive path of the ascii framing before recv_into was used"""
+    def recv(self):
+        length = b""
+        while True:
+            c = self._socket.recv(1)
+            if c == b' ':
+                length = int(length.decode('ascii'))
+                break
+            elif c == b"":
+                return b""
+            else:
+                length += c
+
+        data = b""
+        while len(data) < length:
+            c = self._socket.recv(length - len(data))
+            if c == b"":
+                return b""
+            else:
+                data += c
+
+        return self._handle_internal(self._uprotect_data(data))
+
+
+def run(framing, size, count):
+    left, right = socket.socketpair()
+    sender = SecureSocket(left)
+    if framing == LEGACY:
+        receiver = LegacySecureSocket(right)
+        framing = FRAMING_ASCII
+    else:
+        receiver = SecureSocket(right)
+    sender._set_framing(framing)
+    receiver._set_framing(framing)
+
+    payload = b"x" * size
+
+    def send_all():
+        for _ in range(count):
+            sender.send(payload)
+
+    thread = threading.Thread(target=send_all)
+    start = time.perf_counter()
+    thread.start()
+    for _ in range(count):
+        receiver.recv()
+    thread.join()
+    elapsed = time.perf_counter() - start
+
+    sender.close()
+    receiver.close()
+    return count / elapsed, (size * count) / elapsed / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="message sizes in bytes")
+    parser.add_argument("--total", type=int, default=256*1024*1024,
+                        help="approximate amount of bytes sent per size")
+    parser.add_argument("--max-count", type=int, default=20000,
+                        help="maximum number of messages sent per size")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of runs per measurement, best is reported")
+    args = parser.parse_args()
+
+    print("{:>12} {:>10} {:>14} {:>10}".format("framing", "size", "msgs/s", "MB/s"))
+    for size in args.sizes:
+        count = max(1, min(args.max_count, args.total // size))
+        for framing in SUPPORTED_FRAMINGS + [LEGACY]:
+            msgs, mbs = max(run(framing, size, count) for _ in range(args.repeat))
+            print("{:>12} {:>10} {:>14.1f} {:>10.1f}".format(framing, size, msgs, mbs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Throughput benchmark of the SecureSocket record protection protocols.
+
+Measures send_msg/recv_msg round trips through a socketpair for the
+original aes-cbc-hmac record protocol and the single pass AEAD ones, using
+1 KB, 64 KB and 1 MB payloads. Requires the 'cryptography' library. Run
+from the repository root:
+
+    python -m benchmarks.secure_socket_records
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+from lnst.Common.SecureSocket import SecureSocket, SUPPORTED_RECORD_PROTOCOLS
+from lnst.Common.SecureSocket import FRAMING_BINARY
+
+DEFAULT_SIZES = [1024, 64*1024, 1024*1024]
+
+
+def connected_pair(record_protocol):
+    left, right = socket.socketpair()
+    sender = SecureSocket(left)
+    receiver = SecureSocket(right)
+
+    spec = {"enc_key": os.urandom(32),
+            "mac_key": os.urandom(64),
+            "seq_num": 0}
+    for soc, name in [(sender, "_current_write_spec"),
+                      (receiver, "_current_read_spec")]:
+        soc._set_framing(FRAMING_BINARY)
+        soc._set_record_protocol(record_protocol)
+        setattr(soc, name, dict(spec))
+    return sender, receiver
+
+
+def run(record_protocol, size, count):
+    sender, receiver = connected_pair(record_protocol)
+    msg = {"type": "command", "data": os.urandom(size)}
+
+    def send_all():
+        for _ in range(count):
+            sender.send_msg(msg)
+
+    thread = threading.Thread(target=send_all)
+    start = time.perf_counter()
+    thread.start()
+    for _ in range(count):
+        receiver.recv_msg()
+    thread.join()
+    elapsed = time.perf_counter() - start
+
+    sender.close()
+    receiver.close()
+    return count / elapsed, (size * count) / elapsed / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="payload sizes in bytes")
+    parser.add_argument("--total", type=int, default=256*1024*1024,
+                        help="approximate amount of bytes sent per size")
+    parser.add_argument("--max-count", type=int, default=20000,
+                        help="maximum number of messages sent per size")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of runs per measurement, best is reported")
+    args = parser.parse_args()
+
+    print("{:>18} {:>10} {:>14} {:>10}".format("record protocol", "size",
+                                               "msgs/s", "MB/s"))
+    for size in args.sizes:
+        count = max(1, min(args.max_count, args.total // size))
+        for record_protocol in SUPPORTED_RECORD_PROTOCOLS:
+            msgs, mbs = max(run(record_protocol, size, count)
+                            for _ in range(args.repeat))
+            print("{:>18} {:>10} {:>14.1f} {:>10.1f}".format(
+                  record_protocol, size, msgs, mbs))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,11 +14,13 @@ jpirko@redhat.com (Jiri Pirko)
 import importlib.machinery
 import signal
 import logging
-import os, stat
+import os
 import sys
 import datetime
 import socket
+import select
 import ctypes
+import hashlib
 import multiprocessing
 import types
 from time import sleep
@@ -28,19 +30,23 @@ from lnst.Common.Logs import log_exc_traceback
 from lnst.Common.PacketCapture import PacketCapture
 from lnst.Common.Utils import die_when_parent_die
 from lnst.Common.ExecCmd import exec_cmd, ExecCmdFail
-from lnst.Common.ResourceCache import ResourceCache
+from lnst.Common.ResourceCache import ResourceCache, ResourceCacheError
+from lnst.Common.Compression import compress, decompress
 from lnst.Common.Utils import check_process_running
 from lnst.Common.Utils import is_installed
 from lnst.Common.ConnectionHandler import send_data
 from lnst.Common.ConnectionHandler import ConnectionHandler
 from lnst.Common.DeviceRef import DeviceRef
+from lnst.Common.DeviceRef import device_refs_dumps, device_refs_loads
 from lnst.Common.LnstError import LnstError
 from lnst.Common.DeviceError import DeviceDeleted, DeviceDisabled
-from lnst.Common.DeviceError import DeviceConfigValueError
-from lnst.Common.Parameters import Parameters
+from lnst.Common.DeviceError import DeviceConfigValueError, DeviceNotFound
 from lnst.Common.Version import lnst_version
-from lnst.Agent.Job import Job, JobContext
+from lnst.Agent.Job import Job, JobContext, JobWorkerPool
 from lnst.Agent.InterfaceManager import InterfaceManager
+from lnst.Agent.NetnsExecutor import NetnsExecutor, NETNS_RUN_DIR
+from lnst.Agent.NetnsExecutor import CLONE_NEWNET, MNT_DETACH, MS_BIND, MS_REC
+from lnst.Agent.NetnsExecutor import get_libc, prepare_netns_run_dir
 from lnst.Agent.BridgeTool import BridgeTool
 from lnst.Agent.AgentSecSocket import AgentSecSocket, SecSocketException
 
@@ -89,7 +95,8 @@ class RemoteMethods:
         self._system_config = {}
 
         self._cache = ResourceCache(agent_config.get_option("cache", "dir"),
-                                    agent_config.get_option("cache", "expiration_period"))
+                                    agent_config.get_option("cache", "expiration_period"),
+                                    agent_config.get_option("cache", "max_size"))
 
         self._dynamic_modules = {}
         self._dynamic_classes = {}
@@ -157,6 +164,12 @@ class RemoteMethods:
         setattr(Devices, cls_name, cls)
 
     def load_cached_module(self, module_name, res_hash):
+        try:
+            self._load_cached_module(module_name, res_hash)
+        finally:
+            self._cache.save()
+
+    def _load_cached_module(self, module_name, res_hash):
         self._cache.renew_entry(res_hash)
         if module_name in self._dynamic_modules:
             return
@@ -165,6 +178,42 @@ class RemoteMethods:
         module = module_loader.load_module()
         self._dynamic_modules[module_name] = module
 
+    def load_cached_modules(self, modules, device_classes=None,
+                            resources=None):
+        """Bulk variant of add_resource_to_cache, load_cached_module and
+        map_device_class
+
+        resources maps module names to the contents of modules that were
+        reported by missing_resources, these are added to the cache first.
+        Then modules, a list of (module_name, res_hash) pairs, are loaded in
+        order and device_classes, a list of (cls_name, module_name) pairs,
+        are mapped. Adding the resources doesn't evict the cached modules
+        that are loaded afterwards.
+        """
+        if device_classes is None:
+            device_classes = []
+        if resources is None:
+            resources = {}
+
+        used = {res_hash for module_name, res_hash in modules}
+        for module_name, data in resources.items():
+            with NamedTemporaryFile("w+b", delete=False) as f:
+                f.write(data)
+            try:
+                self._cache.add_file_entry(f.name, module_name, keep=used)
+            except ResourceCacheError:
+                os.unlink(f.name)
+
+        try:
+            for module_name, res_hash in modules:
+                self._load_cached_module(module_name, res_hash)
+        finally:
+            self._cache.save()
+
+        for cls_name, module_name in device_classes:
+            self.map_device_class(cls_name, module_name)
+        return True
+
     def init_cls(self, cls_name, module_name, args, kwargs):
         module = self._dynamic_modules[module_name]
         cls = getattr(module, cls_name)
@@ -182,7 +231,7 @@ class RemoteMethods:
             if isclass(cls):
                 self._if_manager.add_device_class(cls_name, cls)
 
-        self._if_manager.rescan_devices()
+        self._if_manager.resync_devices()
         self._server_handler.set_if_manager(self._if_manager)
         return True
 
@@ -217,6 +266,29 @@ class RemoteMethods:
             log_exc_traceback()
             raise LnstError(exc)
 
+    def multicall(self, calls, stop_on_error=False):
+        """Executes several RPC methods in the order given
+
+        calls is a list of (method_name, args, kwargs) tuples. Returns a list
+        with a {"result": ...} or {"exception": ...} dictionary for each of
+        the executed calls. With stop_on_error the calls following the first
+        failed one aren't executed and are missing from the returned list.
+        """
+        results = []
+        for method_name, args, kwargs in calls:
+            method = getattr(self, method_name, None)
+            try:
+                if (method is None or method_name.startswith("_") or
+                        method_name == "multicall"):
+                    raise LnstError("Method '%s' not supported." % method_name)
+                results.append({"result": method(*args, **kwargs)})
+            except LnstError as e:
+                log_exc_traceback()
+                results.append({"exception": e})
+                if stop_on_error:
+                    break
+        return results
+
     def dev_method(self, ifindex, name, args, kwargs):
         dev = self._if_manager.get_device(ifindex)
         method = getattr(dev, name)
@@ -231,6 +303,26 @@ class RemoteMethods:
         dev = self._if_manager.get_device(ifindex)
         return setattr(dev, name, value)
 
+    def dev_snapshot(self, ifindex, names):
+        dev = self._if_manager.get_device(ifindex)
+        return dev._get_snapshot(names)
+
+    def dev_snapshot_all(self, devices):
+        """Snapshots the attributes of multiple devices of the namespace
+
+        devices is a {ifindex: [attribute names]} dictionary, devices that
+        don't exist anymore are missing from the returned
+        {ifindex: {name: value}} dictionary.
+        """
+        result = {}
+        for ifindex, names in devices.items():
+            try:
+                dev = self._if_manager.get_device(ifindex)
+            except DeviceNotFound:
+                continue
+            result[ifindex] = dev._get_snapshot(names)
+        return result
+
     def get_devices(self):
         devices = self._if_manager.get_devices()
         result = {}
@@ -268,7 +360,8 @@ class RemoteMethods:
         devices = self._if_manager.get_devices()
         matched = []
         for dev in devices:
-            dev_data = dev._get_if_data()
+            ethtool_data = any(key in dev._ethtool_if_data for key in params)
+            dev_data = dev._get_if_data(ethtool_data)
             entry = {"name": dev.get_name(),
                      "hwaddr": dev.get_hwaddr()}
             for key, value in params.items():
@@ -312,6 +405,10 @@ class RemoteMethods:
         dev =  self._if_manager.create_device(clsname, args, kwargs)
         return {"ifindex": dev.ifindex, "name": dev.name}
 
+    def create_devices(self, devices):
+        devs = self._if_manager.create_devices(devices)
+        return [{"ifindex": dev.ifindex, "name": dev.name} for dev in devs]
+
     def start_packet_capture(self, filt):
         if not is_installed("tcpdump"):
             raise Exception("Can't start packet capture, tcpdump not available")
@@ -386,7 +483,7 @@ class RemoteMethods:
         return True
 
     def run_job(self, job):
-        job_instance = Job(job, self._log_ctl)
+        job_instance = Job(job, self._log_ctl, self._job_context.worker_pool)
         self._job_context.add_job(job_instance)
 
         res = job_instance.run()
@@ -402,6 +499,12 @@ class RemoteMethods:
 
         return job.kill(signal)
 
+    def set_job_workers(self, count):
+        """sets the number of pre-forked processes used to run Jobs, 0
+        disables the worker pool"""
+        self._job_context.worker_pool.set_size(count)
+        return True
+
     def kill_jobs(self):
         logging.info("Killing all forked processes.")
         self._job_context.kill_all_jobs()
@@ -410,6 +513,7 @@ class RemoteMethods:
     def machine_cleanup(self):
         logging.info("Performing machine cleanup.")
         self._job_context.kill_all_jobs()
+        self._job_context.worker_pool.restart()
 
         self.restore_system_config()
 
@@ -446,9 +550,21 @@ class RemoteMethods:
 
         return False
 
+    def get_cache_stats(self):
+        """returns the resource cache hit/miss/eviction counters and its
+        current size"""
+        return self._cache.get_stats()
+
+    def missing_resources(self, manifest):
+        """returns the names from the {name: res_hash} manifest that aren't
+        in the resource cache"""
+        return [name for name, res_hash in manifest.items()
+                if not self._cache.query(res_hash)]
+
     def add_resource_to_cache(self, res_type, local_path, name):
         if res_type == "file":
             self._cache.add_file_entry(local_path, name)
+            self._cache.save()
             return True
         else:
             raise Exception("Unknown resource type")
@@ -458,27 +574,30 @@ class RemoteMethods:
             return ""
 
         if filepath:
-            self._copy_targets[filepath] = open(filepath, "w+b")
+            target = FileTransfer(open(filepath, "w+b"))
         else:
-            tmpfile = NamedTemporaryFile("w+b", delete=False)
-            filepath = tmpfile.name
-            self._copy_targets[filepath] = tmpfile
+            target = FileTransfer(NamedTemporaryFile("w+b", delete=False))
+            filepath = target.file.name
+        self._copy_targets[filepath] = target
 
         return filepath
 
-    def copy_part_to(self, filepath, data):
+    def copy_part_to(self, filepath, data, offset=None, compression=None):
+        """writes a chunk of the file, the chunks are expected to arrive in
+        order, offset allows writing them with pwrite without seeking"""
         if self._copy_targets[filepath]:
-            self._copy_targets[filepath].write(data)
+            self._copy_targets[filepath].write(decompress(data, compression),
+                                               offset)
             return True
 
         return False
 
     def finish_copy_to(self, filepath):
+        """returns the sha256 digest of the received data"""
         if self._copy_targets[filepath]:
-            self._copy_targets[filepath].close()
-
-            del self._copy_targets[filepath]
-            return True
+            target = self._copy_targets.pop(filepath)
+            target.close()
+            return target.hexdigest()
 
         return False
 
@@ -486,33 +605,53 @@ class RemoteMethods:
         if filepath in self._copy_sources or not os.path.exists(filepath):
             return False
 
-        self._copy_sources[filepath] = open(filepath, "rb")
+        self._copy_sources[filepath] = FileTransfer(open(filepath, "rb"))
         return True
 
-    def copy_part_from(self, filepath, buffsize):
-        data = self._copy_sources[filepath].read(buffsize)
-        return data
+    def copy_part_from(self, filepath, buffsize, offset=None, compression=None):
+        data = self._copy_sources[filepath].read(buffsize, offset)
+        return compress(data, compression)
 
     def finish_copy_from(self, filepath):
+        """returns the sha256 digest of the data that was read"""
         if filepath in self._copy_sources:
-            self._copy_sources[filepath].close()
-            del self._copy_sources[filepath]
-            return True
+            source = self._copy_sources.pop(filepath)
+            source.close()
+            return source.hexdigest()
 
         return False
 
     def reset_file_transfers(self):
-        for file_handle in self._copy_targets.values():
-            file_handle.close()
+        for transfer in self._copy_targets.values():
+            transfer.close()
         self._copy_targets = {}
 
-        for file_handle in self._copy_sources.values():
-            file_handle.close()
+        for transfer in self._copy_sources.values():
+            transfer.close()
         self._copy_sources = {}
 
-    def add_namespace(self, netns):
+    def add_namespace(self, netns, backend="fork"):
+        """Creates a network namespace
+
+        With the "fork" backend the namespace is served by a forked copy of
+        the Agent, with the "thread" backend by a thread of this process
+        that entered the namespace, see NetnsExecutor. Threads are much
+        cheaper to create and to call, but the namespace shares the mount
+        namespace (and /sys) with the init namespace and its Jobs don't use
+        the job worker pool. The namespace threads make the Agent a
+        multi-threaded process, processes forked from it (namespace agents,
+        Jobs) only have the forking thread and must not use the executors
+        of the thread backed namespaces, see _reset_after_fork.
+        """
+        if backend not in ["fork", "thread"]:
+            raise LnstError("Unknown network namespace backend %s" % backend)
+
         if netns in self._net_namespaces:
             logging.debug("Network namespace %s already exists." % netns)
+        elif backend == "thread":
+            logging.debug("Creating thread backed network namespace %s." % netns)
+            self._add_thread_namespace(netns)
+            return True
         else:
             logging.debug("Creating network namespace %s." % netns)
             read_pipe, write_pipe = multiprocessing.Pipe()
@@ -529,44 +668,17 @@ class RemoteMethods:
                 return True
             elif pid == 0:
                 self._agent_server.set_netns_sighandlers()
+                self._reset_after_fork()
                 #create new network namespace
-                libc_name = ctypes.util.find_library("c")
-                #from sched.h
-                CLONE_NEWNET = 0x40000000
                 CLONE_NEWNS = 0x00020000
-                #based on ipnetns.c from the iproute2 project
-                MNT_DETACH = 0x00000002
-                MS_BIND = 4096
                 MS_SLAVE = 1<<19
-                MS_REC = 16384
-                MS_SHARED = 1 << 20
-                libc = ctypes.CDLL(libc_name)
+                libc = get_libc()
 
                 #based on ipnetns.c from the iproute2 project
                 #bind to named namespace
-                netns_dir = "/var/run/netns/".encode("ascii")
-                if not os.path.exists(netns_dir):
-                    os.mkdir(netns_dir, stat.S_IRWXU | stat.S_IRGRP |
-                                         stat.S_IXGRP | stat.S_IROTH |
-                                         stat.S_IXOTH)
-
-                # this is a code mimicking the iproute2 implementation
-                # introduced by commit 58a3e8270f:
-                # modify all mounts in the files and subdirectories of
-                # /var/run/netns to be shared mount points so that unmount
-                # events can propagate, making it unlikely that "ip netns delete"
-                # will fail because a directory is mounted in another mount
-                # namespace
-                done = False
-                while libc.mount(b'', netns_dir, b'none', MS_SHARED | MS_REC, None) != 0:
-                    if done:
-                        raise OSError(ctypes.get_errno(), 'share rundir failed', netns)
-                    if libc.mount(netns_dir, netns_dir, b'none', MS_BIND | MS_REC,
-                                  None) != 0:
-                        raise OSError(ctypes.get_errno(), 'mount rundir failed', netns)
-                    done = True
-
-                netns_path = netns_dir + netns.encode("ascii")
+                prepare_netns_run_dir(libc)
+
+                netns_path = NETNS_RUN_DIR + netns.encode("ascii")
                 try:
                     f = os.open(netns_path, os.O_RDONLY | os.O_CREAT | os.O_EXCL, 0)
                 except FileExistsError:
@@ -601,7 +713,10 @@ class RemoteMethods:
 
                 self._log_ctl.disable_logging()
                 self._log_ctl.set_origin_name(netns)
-                self._log_ctl.set_connection(write_pipe)
+                self._log_ctl.set_connection(
+                    write_pipe, batching=True,
+                    rate_limit=self._agent_config.get_option(
+                        "environment", "log_rate_limit"))
 
                 self.init_if_manager()
 
@@ -610,16 +725,54 @@ class RemoteMethods:
             else:
                 raise Exception("Fork failed!")
 
+    def _reset_after_fork(self):
+        """Drops the state a forked network namespace agent inherited
+
+        The other namespaces and the jobs belong to the parent process, the
+        cleanup of the forked agent must not delete or kill them. The
+        threads of the thread backed namespaces don't even exist after the
+        fork, calling their executors would block forever. The jobs of the
+        new namespace need workers forked inside of it.
+        """
+        for ns in self._net_namespaces.values():
+            if "pipe" in ns:
+                ns["pipe"].close()
+        self._net_namespaces.clear()
+        self._job_context.reset_after_fork()
+
+    def _add_thread_namespace(self, netns):
+        executor = NetnsExecutor(netns)
+        server_handler = NetnsServerHandler(self._server_handler, executor)
+        methods = NetnsRemoteMethods(self, server_handler)
+        try:
+            executor.call(methods.init_if_manager)
+        except:
+            executor.close()
+            raise
+
+        self._net_namespaces[netns] = {"executor": executor,
+                                       "methods": methods}
+        self._server_handler.add_netns_thread(netns, server_handler)
+
     def del_namespace(self, netns):
         if netns not in self._net_namespaces:
             logging.debug("Network namespace %s doesn't exist." % netns)
             return False
+        elif "executor" in self._net_namespaces[netns]:
+            executor = self._net_namespaces[netns]["executor"]
+            methods = self._net_namespaces[netns]["methods"]
+            try:
+                executor.call(methods.netns_cleanup)
+            finally:
+                executor.close()
+                self._server_handler.del_netns(netns)
+                del self._net_namespaces[netns]
+
+            logging.debug("Network namespace %s removed." % netns)
+            return True
         else:
-            MNT_DETACH = 0x00000002
-            libc_name = ctypes.util.find_library("c")
-            libc = ctypes.CDLL(libc_name)
-            netns_path = "/var/run/netns/" + netns
-            netns_path = netns_path.encode('ascii')
+            libc = get_libc()
+            netns_path = NETNS_RUN_DIR + netns.encode('ascii')
 
             netns_pid = self._net_namespaces[netns]["pid"]
             os.kill(netns_pid, signal.SIGUSR1)
@@ -756,10 +909,103 @@ class RemoteMethods:
         brt.set_state(br_state_info)
         return True
 
+class NetnsRemoteMethods(RemoteMethods):
+    """RPC methods of a thread backed network namespace
+
+    Called from the thread of the namespace's NetnsExecutor. The resource
+    cache, the loaded modules and classes and the Job context are shared
+    with the RemoteMethods of the init namespace, everything related to the
+    network configuration is separate.
+    """
+    def __init__(self, root_methods, server_handler):
+        self.__dict__.update(root_methods.__dict__)
+
+        self._server_handler = server_handler
+        self._if_manager = None
+        self._net_namespaces = {}
+        self._packet_captures = {}
+        self._capture_files = {}
+        self._copy_targets = {}
+        self._copy_sources = {}
+        self._system_config = {}
+        self._job_ids = set()
+
+    def add_namespace(self, netns, backend="fork"):
+        raise LnstError("Can't create network namespace %s in a thread "
+                        "backed network namespace" % netns)
+
+    def del_namespace(self, netns):
+        return False
+
+    def run_job(self, job):
+        # the worker pool processes were forked in the init namespace, the
+        # job process has to be forked from the namespace thread
+        job_instance = Job(job, self._log_ctl)
+        self._job_context.add_job(job_instance)
+        self._job_ids.add(job_instance.get_id())
+
+        return job_instance.run()
+
+    def machine_cleanup(self):
+        raise LnstError("Can't clean up the machine from a network namespace")
+
+    def netns_cleanup(self):
+        for job_id in self._job_ids:
+            job = self._job_context.get_job(job_id)
+            if job is not None and not job._finished:
+                job.kill(sig=signal.SIGKILL)
+        self._job_ids = set()
+
+        self.restore_system_config()
+        self._remove_capture_files()
+        self._if_manager = None
+        self._server_handler.set_if_manager(None)
+        return True
+
+
+class FileTransfer(object):
+    """File being copied from or to the agent in chunks
+
+    Chunks are read and written with pread/pwrite when the controller sends
+    their offsets and a running sha256 digest of the transferred data is kept
+    for end to end verification.
+    """
+    def __init__(self, file):
+        self._file = file
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def file(self):
+        return self._file
+
+    def write(self, data, offset=None):
+        if offset is None:
+            self._file.write(data)
+        else:
+            os.pwrite(self._file.fileno(), data, offset)
+        self._sha256.update(data)
+
+    def read(self, size, offset=None):
+        if offset is None:
+            data = self._file.read(size)
+        else:
+            data = os.pread(self._file.fileno(), size, offset)
+        self._sha256.update(data)
+        return data
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+
 class ServerHandler(ConnectionHandler):
-    def __init__(self, addr, agent_config):
+    def __init__(self, addr, agent_config, log_ctl):
         super(ServerHandler, self).__init__()
+        self._log_ctl = log_ctl
         self._netns_con_mapping = {}
+        self._netns_threads = {}
         try:
             self._s_socket = socket.socket()
             self._s_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -781,6 +1027,9 @@ class ServerHandler(ConnectionHandler):
 
     def accept_connection(self):
         self._c_socket, addr = self._s_socket.accept()
+        # the replies are often preceded by log messages, don't let Nagle's
+        # algorithm hold them back until the controller ACKs those
+        self._c_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self._c_socket = (AgentSecSocket(self._c_socket), addr[0])
         logging.info("Recieved connection from %s" % self._c_socket[1])
 
@@ -817,9 +1066,44 @@ class ServerHandler(ConnectionHandler):
     def check_connections(self, timeout=None):
         if self._if_manager is not None:
             self._if_manager.handle_netlink_msgs()
+        self.handle_netns_netlink_msgs()
         msgs = super(ServerHandler, self).check_connections(timeout=timeout)
         return msgs
 
+    def _loads(self, data):
+        return device_refs_loads(data, self._get_device)
+
+    def _get_device(self, ifindex, netns):
+        if netns is None:
+            if_manager = self._if_manager
+        elif netns in self._netns_threads:
+            if_manager = self._netns_threads[netns].if_manager
+        else:
+            # served by a forked agent which translates the reference itself
+            return DeviceRef(ifindex)
+
+        if if_manager is None:
+            return DeviceRef(ifindex)
+        return if_manager.get_device(ifindex)
+
+    def handle_netns_netlink_msgs(self):
+        """Processes the pending netlink notifications of the thread backed
+        network namespaces
+
+        Only the namespaces with a readable netlink socket are called.
+        """
+        poller = select.poll()
+        handlers = {}
+        for handler in self._netns_threads.values():
+            nl_socket = handler.get_nl_socket()
+            if nl_socket is not None:
+                poller.register(nl_socket, select.POLLIN)
+                handlers[nl_socket.fileno()] = handler
+
+        if handlers:
+            for fd, _ in poller.poll(0):
+                handlers[fd].handle_netlink_msgs()
+
     def get_messages(self):
         messages = self.check_connections(timeout=MAX_SERVER_HANG)
 
@@ -851,12 +1135,14 @@ class ServerHandler(ConnectionHandler):
 
     def send_data_to_ctl(self, data):
         if self._c_socket != None:
+            # the log records are batched, the ones logged before this
+            # message have to reach the controller before it
+            self._log_ctl.flush_connection()
             if self._netns != None:
                 data = {"type": "from_netns",
                         "netns": self._netns,
                         "data": data}
-            data = device_to_deviceref(data)
-            return send_data(self._c_socket[0], data)
+            return send_data(self._c_socket[0], data, dumps_message)
         else:
             return False
 
@@ -865,7 +1151,7 @@ class ServerHandler(ConnectionHandler):
             raise Exception("No network namespace '%s'!" % netns)
         else:
             netns_con = self._netns_con_mapping[netns]
-            return send_data(netns_con, data)
+            return send_data(netns_con, data, dumps_message)
 
     def clear_connections(self):
         super(ServerHandler, self).clear_connections()
@@ -883,78 +1169,70 @@ class ServerHandler(ConnectionHandler):
         self._connections.append(connection)
         self._netns_con_mapping[netns] = connection
 
+    def add_netns_thread(self, netns, handler):
+        self._netns_threads[netns] = handler
+
     def del_netns(self, netns):
         if netns in self._netns_con_mapping:
             connection = self._netns_con_mapping[netns]
             self._connections.remove(connection)
             del self._netns_con_mapping[netns]
+        self._netns_threads.pop(netns, None)
 
     def clear_netns_connections(self):
-        for netns, con in self._netns_con_mapping:
+        for netns, con in self._netns_con_mapping.items():
             self._connections.remove(con)
         self._netns_con_mapping = {}
+        self._netns_threads = {}
 
 
-def device_to_deviceref(obj):
-    try:
-        Device = Devices.Device
-    except:
-        return obj
-
-    if isinstance(obj, Device):
-        dev_ref = DeviceRef(obj.ifindex)
-        return dev_ref
-    elif isinstance(obj, dict):
-        new_dict = {}
-        for key, value in list(obj.items()):
-            new_dict[key] = device_to_deviceref(value)
-        return new_dict
-    elif isinstance(obj, list):
-        new_list = []
-        for value in obj:
-            new_list.append(device_to_deviceref(value))
-        return new_list
-    elif isinstance(obj, tuple):
-        new_list = []
-        for value in obj:
-            new_list.append(device_to_deviceref(value))
-        return tuple(new_list)
-    else:
-        return obj
-
-def deviceref_to_device(if_manager, obj):
+class NetnsServerHandler(object):
+    """ServerHandler of a thread backed network namespace
+
+    Messages for the controller are tagged with the namespace name and sent
+    through the connection of the Agent.
+    """
+    def __init__(self, server_handler, executor):
+        self._server_handler = server_handler
+        self._executor = executor
+        self._if_manager = None
+
+    @property
+    def executor(self):
+        return self._executor
+
+    @property
+    def if_manager(self):
+        return self._if_manager
+
+    def set_if_manager(self, if_manager):
+        self._if_manager = if_manager
+
+    def get_nl_socket(self):
+        if self._if_manager is None:
+            return None
+        return self._if_manager.get_nl_socket()
+
+    def handle_netlink_msgs(self):
+        if self._if_manager is not None:
+            self._executor.call(self._if_manager.handle_netlink_msgs)
+
+    def send_data_to_ctl(self, data):
+        data["netns"] = self._executor.name
+        return self._server_handler.send_data_to_ctl(data)
+
+
+def dumps_message(data):
+    """Pickles a message, Device objects are sent as references
+
+    The references are translated back by the receiving ServerHandler or
+    MessageDispatcher, see lnst.Common.DeviceRef.
+    """
     try:
-        from lnst.Tests.BaseTestModule import BaseTestModule
-    except:
-        BaseTestModule = None
-
-    if isinstance(obj, DeviceRef):
-        dev = if_manager.get_device(obj.ifindex)
-        return dev
-    elif isinstance(obj, dict):
-        new_dict = {}
-        for key, value in list(obj.items()):
-            new_dict[key] = deviceref_to_device(if_manager, value)
-        return new_dict
-    elif isinstance(obj, list):
-        new_list = []
-        for value in obj:
-            new_list.append(deviceref_to_device(if_manager, value))
-        return new_list
-    elif isinstance(obj, tuple):
-        new_list = []
-        for value in obj:
-            new_list.append(deviceref_to_device(if_manager, value))
-        return tuple(new_list)
-    elif isinstance(obj, Parameters):
-        for param_name, param in obj:
-            setattr(obj, param_name, deviceref_to_device(if_manager, param))
-        return obj
-    elif BaseTestModule is not None and isinstance(obj, BaseTestModule):
-        obj.params = deviceref_to_device(if_manager, obj.params)
-        return obj
-    else:
-        return obj
+        device_classes = (Devices.Device,)
+    except AttributeError:
+        device_classes = ()
+    return device_refs_dumps(data, device_classes, data.get("netns", None))
 
 
 class Agent:
@@ -962,10 +1240,12 @@ class Agent:
         self._agent_config = agent_config
         die_when_parent_die()
 
-        self._job_context = JobContext()
+        self._job_context = JobContext(
+            JobWorkerPool(log_ctl,
+                          agent_config.get_option("environment", "job_workers")))
         port = agent_config.get_option("environment", "rpcport")
         logging.info("Using RPC port %d." % port)
-        self._server_handler = ServerHandler(("", port), agent_config)
+        self._server_handler = ServerHandler(("", port), agent_config, log_ctl)
 
         self._net_namespaces = {}
 
@@ -993,8 +1273,14 @@ class Agent:
                         self._server_handler.accept_connection()
                     except (socket.error, SecSocketException):
                         continue
-                    self._log_ctl.set_connection(self._server_handler.get_ctl_sock())
-
+                    self._log_ctl.set_connection(
+                        self._server_handler.get_ctl_sock(), batching=True,
+                        rate_limit=self._agent_config.get_option(
+                            "environment", "log_rate_limit"))
+
+                # nothing else would send the buffered log records while
+                # waiting for new messages
+                self._log_ctl.flush_connection()
                 msgs = self._server_handler.get_messages()
 
                 for msg in msgs:
@@ -1020,36 +1306,15 @@ class Agent:
 
     def _process_msg(self, msg):
         if msg["type"] == "command":
-            method = getattr(self._methods, msg["method_name"], None)
-            if method != None:
-                if_manager = self._methods._if_manager
-                if if_manager is not None:
-                    args = deviceref_to_device(if_manager, msg["args"])
-                    kwargs = deviceref_to_device(if_manager, msg["kwargs"])
-                else:
-                    args = msg["args"]
-                    kwargs = msg["kwargs"]
-
-                try:
-                    result = method(*args, **kwargs)
-                except LnstError as e:
-                    log_exc_traceback()
-                    response = {"type": "exception", "Exception": e}
-
-                    self._server_handler.send_data_to_ctl(response)
-                    return
-
-                response = {"type": "result", "result": result}
-                response = device_to_deviceref(response)
-                self._server_handler.send_data_to_ctl(response)
-            else:
-                err = LnstError("Method '%s' not supported." % msg["method_name"])
-                response = {"type": "exception", "Exception": err}
-                self._server_handler.send_data_to_ctl(response)
+            self._process_command(msg, self._methods, self._server_handler)
         elif msg["type"] == "log":
             logger = logging.getLogger()
             record = logging.makeLogRecord(msg["record"])
             logger.handle(record)
+        elif msg["type"] == "log_batch":
+            logger = logging.getLogger()
+            for r in msg["records"]:
+                logger.handle(logging.makeLogRecord(r))
         elif msg["type"] == "exception":
             if msg["cmd_id"] != None:
                 logging.debug("Recieved an exception from command with id: %s"
@@ -1066,6 +1331,10 @@ class Agent:
             job.join()
 
             job.set_finished(msg["result"])
+            self._push_device_updates()
+            # pooled workers keep their pipe, it's registered again for
+            # their next job
+            self._server_handler.remove_connection_by_id(msg["job_id"])
             self._server_handler.send_data_to_ctl(msg)
 
         elif msg["type"] == "from_netns":
@@ -1073,11 +1342,31 @@ class Agent:
             self._server_handler.send_data_to_ctl(msg["data"])
         elif msg["type"] == "to_netns":
             netns = msg["netns"]
+            ns = self._methods._net_namespaces.get(netns, {})
+            if "executor" in ns:
+                netns_handler = ns["methods"]._server_handler
+                try:
+                    ns["executor"].call(self._process_command, msg["data"],
+                                        ns["methods"], netns_handler)
+                except Exception as e:
+                    # a forked namespace agent would die here, the thread
+                    # backed one runs in this process so only the command
+                    # fails
+                    log_exc_traceback()
+                    err = LnstError("Command failed in network namespace "
+                                    "%s: %s" % (netns, e))
+                    response = {"type": "exception", "Exception": err,
+                                "request_id": msg["data"].get("request_id", None)}
+                    netns_handler.send_data_to_ctl(response)
+                pipes = self._job_context.get_parent_pipes()
+                self._server_handler.update_connections(pipes)
+                return
             try:
                 self._server_handler.send_data_to_netns(netns, msg["data"])
             except LnstError as e:
                 log_exc_traceback()
-                response = {"type": "exception", "Exception": e}
+                response = {"type": "exception", "Exception": e,
+                            "request_id": msg["data"].get("request_id", None)}
 
                 self._server_handler.send_data_to_ctl(response)
                 return
@@ -1087,6 +1376,45 @@ class Agent:
         pipes = self._job_context.get_parent_pipes()
         self._server_handler.update_connections(pipes)
 
+    def _process_command(self, msg, methods, server_handler):
+        # echoed back so that the controller can match the response to
+        # the request when several commands are in flight
+        request_id = msg.get("request_id", None)
+        method = getattr(methods, msg["method_name"], None)
+        if method != None:
+            try:
+                result = method(*msg["args"], **msg["kwargs"])
+            except LnstError as e:
+                log_exc_traceback()
+                self._push_device_updates(methods)
+                response = {"type": "exception", "Exception": e,
+                            "request_id": request_id}
+
+                server_handler.send_data_to_ctl(response)
+                return
+
+            self._push_device_updates(methods)
+            response = {"type": "result", "result": result,
+                        "request_id": request_id}
+            server_handler.send_data_to_ctl(response)
+        else:
+            err = LnstError("Method '%s' not supported." % msg["method_name"])
+            response = {"type": "exception", "Exception": err,
+                        "request_id": request_id}
+            server_handler.send_data_to_ctl(response)
+
+    def _push_device_updates(self, methods=None):
+        # process pending netlink notifications so that the device updates
+        # caused by a command or job reach the controller before its result
+        if methods is None:
+            methods = self._methods
+        if methods._if_manager is not None:
+            methods._if_manager.handle_netlink_msgs()
+
+        if methods is self._methods:
+            # e.g. a device moved to a thread backed namespace
+            self._server_handler.handle_netns_netlink_msgs()
+
     def register_die_signal(self, signum):
         signal.signal(signum, self._signal_die_handler)
 
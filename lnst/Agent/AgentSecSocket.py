@@ -23,8 +23,9 @@ ser = not_imported
 load_pem_private_key = not_imported
 load_pem_public_key = not_imported
 load_ssh_public_key = not_imported
+load_ssh_private_key = not_imported
 backend = not_imported
-cryptography_imported = not_imported
+cryptography_imported = False
 def cryptography_imports():
     global cryptography_imported
     if cryptography_imported:
@@ -34,6 +35,7 @@ def cryptography_imports():
     global load_pem_private_key
     global load_pem_public_key
     global load_ssh_public_key
+    global load_ssh_private_key
     global backend
 
     try:
@@ -41,6 +43,7 @@ def cryptography_imports():
         from cryptography.hazmat.primitives.serialization import load_pem_private_key
         from cryptography.hazmat.primitives.serialization import load_pem_public_key
         from cryptography.hazmat.primitives.serialization import load_ssh_public_key
+        from cryptography.hazmat.primitives.serialization import load_ssh_private_key
         from cryptography.hazmat.backends import default_backend
     except ImportError:
         logging.error("Library 'cryptography' missing "\
@@ -51,6 +54,13 @@ def cryptography_imports():
     backend = default_backend()
     cryptography_imported = True
 
+def load_private_key(data):
+    """loads PEM keys and the OpenSSH format newer ssh-keygen generates"""
+    try:
+        return load_pem_private_key(data, None, backend)
+    except ValueError:
+        return load_ssh_private_key(data, None, backend)
+
 
 class AgentSecSocket(SecureSocket):
     def __init__(self, soc):
@@ -64,10 +74,17 @@ class AgentSecSocket(SecureSocket):
 
         self._ctl_random = ctl_hello["ctl_random"]
         self._agent_random = os.urandom(28)
+        framing = self._select_framing(ctl_hello.get("framing"))
+        record_protocol = self._select_record_protocol(
+                                ctl_hello.get("record_protocol"))
 
         agent_hello = {"type": "agent_hello",
-                       "agent_random": self._agent_random}
+                       "agent_random": self._agent_random,
+                       "framing": framing,
+                       "record_protocol": record_protocol}
         self.send_msg(agent_hello)
+        self._set_framing(framing)
+        self._set_record_protocol(record_protocol)
 
         if sec_params["auth_types"] == "none":
             logging.warning("===================================")
@@ -89,7 +106,7 @@ class AgentSecSocket(SecureSocket):
             cryptography_imports()
             srv_key = None
             try:
-                with open(sec_params["privkey"], 'r') as f:
+                with open(sec_params["privkey"], 'rb') as f:
                     srv_key = load_pem_private_key(f.read(), None, backend)
             except:
                 srv_key = None
@@ -100,7 +117,7 @@ class AgentSecSocket(SecureSocket):
                 if not os.path.isfile(path):
                     continue
                 try:
-                    with open(path, 'r') as f:
+                    with open(path, 'rb') as f:
                         ctl_pubkeys[fname] = load_pem_public_key(f.read(),
                                                                  backend)
                 except:
@@ -118,7 +135,7 @@ class AgentSecSocket(SecureSocket):
         hashed_handshake_data.update(handshake_data)
 
         srv_verify_data = self.PRF(self._master_secret,
-                                   "server finished",
+                                   b"server finished",
                                    hashed_handshake_data.digest(),
                                    12)
 
@@ -131,7 +148,7 @@ class AgentSecSocket(SecureSocket):
             raise SecSocketException("Handshake failed.")
 
         ctl_verify_data = self.PRF(self._master_secret,
-                                   "ctl finished",
+                                   b"ctl finished",
                                    hashed_handshake_data.digest(),
                                    12)
 
@@ -142,7 +159,7 @@ class AgentSecSocket(SecureSocket):
     def _dh_handshake(self):
         modp_group = DH_GROUP
         #private exponent
-        srv_privkey = int(os.urandom(modp_group["q_size"]+1).encode('hex'), 16)
+        srv_privkey = int(os.urandom(modp_group["q_size"]+1).hex(), 16)
         srv_privkey = srv_privkey % modp_group["q"]
         #public key
         srv_pubkey = pow(modp_group["g"], srv_privkey, modp_group["p"])
@@ -159,18 +176,18 @@ class AgentSecSocket(SecureSocket):
 
         ZZ = pow(ctl_pubkey, srv_privkey, modp_group["p"])
         ZZ = "{1:0{0}x}".format(modp_group['p_size']*2, ZZ)
-        ZZ = self._master_secret.decode('hex')
+        ZZ = bytes.fromhex(ZZ)
 
         self._master_secret = self.PRF(ZZ,
-                                       "master secret",
+                                       b"master secret",
                                        self._ctl_random + self._agent_random,
                                        48)
 
-        handshake_data = ""
-        handshake_data += ("{1:0{0}x}".format(modp_group['p_size']*2,
-                                              ctl_pubkey)).decode('hex')
-        handshake_data += ("{1:0{0}x}".format(modp_group['p_size']*2,
-                                              srv_pubkey)).decode('hex')
+        handshake_data = b""
+        handshake_data += bytes.fromhex("{1:0{0}x}".format(
+                                        modp_group['p_size']*2, ctl_pubkey))
+        handshake_data += bytes.fromhex("{1:0{0}x}".format(
+                                        modp_group['p_size']*2, srv_pubkey))
 
         self._init_cipher_spec()
         self._send_change_cipher_spec()
@@ -185,16 +202,14 @@ class AgentSecSocket(SecureSocket):
         ssh_dir_path = os.path.expanduser("~/.ssh")
         for f_name in sshd_key_paths:
             try:
-                with open(f_name, 'r') as f:
-                    srv_keys.append(load_pem_private_key(f.read(),
-                                                         None,
-                                                         backend))
+                with open(f_name, 'rb') as f:
+                    srv_keys.append(load_private_key(f.read()))
                     srv_pubkeys.append(srv_keys[-1].public_key())
             except:
                 continue
 
         if os.path.isfile(ssh_dir_path+"/authorized_keys"):
-            with open(ssh_dir_path+"/authorized_keys", 'r') as f:
+            with open(ssh_dir_path+"/authorized_keys", 'rb') as f:
                 for line in f.readlines():
                     try:
                         authorized_keys.append(load_ssh_public_key(line,
@@ -237,7 +252,7 @@ class AgentSecSocket(SecureSocket):
             raise SecSocketException("Handshake failed.")
 
         if not self._verify_signature(ctl_ssh_pubkey,
-                                      str(msg["index"]),
+                                      str(msg["index"]).encode(),
                                       msg["signature"]):
             raise SecSocketException("Handshake failed.")
 
@@ -246,8 +261,7 @@ class AgentSecSocket(SecureSocket):
     def _pubkey_handshake(self, srv_privkey, client_pubkeys):
         modp_group = DH_GROUP
         #private exponent
-        srv_dh_privkey = int(os.urandom(modp_group["q_size"]+1).encode('hex'),
-                             16)
+        srv_dh_privkey = int(os.urandom(modp_group["q_size"]+1).hex(), 16)
         srv_dh_privkey = srv_dh_privkey % modp_group["q"]
         #public key
         srv_dh_pubkey_int = pow(modp_group["g"],
@@ -255,7 +269,7 @@ class AgentSecSocket(SecureSocket):
                                 modp_group["p"])
         srv_dh_pubkey = "{1:0{0}x}".format(modp_group['p_size']*2,
                                            srv_dh_pubkey_int)
-        srv_dh_pubkey = srv_dh_pubkey.decode('hex')
+        srv_dh_pubkey = bytes.fromhex(srv_dh_pubkey)
 
         msg = self.recv_msg()
         if msg["type"] != "pubkey_client_hello":
@@ -278,7 +292,7 @@ class AgentSecSocket(SecureSocket):
                                       signature):
             raise SecSocketException("Handshake failed.")
 
-        ctl_dh_pubkey_int = int(ctl_dh_pubkey.encode('hex'), 16)
+        ctl_dh_pubkey_int = int(ctl_dh_pubkey.hex(), 16)
 
         srv_pubkey = srv_privkey.public_key()
         srv_pubkey_pem = srv_pubkey.public_bytes(
@@ -294,10 +308,10 @@ class AgentSecSocket(SecureSocket):
 
         ZZ = pow(ctl_dh_pubkey_int, srv_dh_privkey, modp_group["p"])
         ZZ = "{1:0{0}x}".format(modp_group['p_size']*2, ZZ)
-        ZZ = self._master_secret.decode('hex')
+        ZZ = bytes.fromhex(ZZ)
 
         self._master_secret = self.PRF(ZZ,
-                                       "master secret",
+                                       b"master secret",
                                        self._ctl_random + self._agent_random,
                                        48)
 
@@ -314,18 +328,19 @@ class AgentSecSocket(SecureSocket):
 
         srp_group = SRP_GROUP
         p_bytes = "{1:0{0}x}".format(srp_group['p_size']*2, srp_group['p'])
-        p_bytes = p_bytes.decode('hex')
+        p_bytes = bytes.fromhex(p_bytes)
         g_bytes = "{0:02x}".format(srp_group['g'])
-        g_bytes = g_bytes.decode('hex')
+        g_bytes = bytes.fromhex(g_bytes)
         k = hashlib.sha256(p_bytes + g_bytes).digest()
-        k = int(k.encode('hex'), 16)
+        k = int(k.hex(), 16)
         username = msg["username"]
 
         salt = os.urandom(16)
 
-        x = hashlib.sha256(salt + username + auth_passwd).digest()
+        x = hashlib.sha256(salt + username.encode() +
+                           auth_passwd.encode()).digest()
 
-        x_int = int(x.encode('hex'), 16)
+        x_int = int(x.hex(), 16)
 
         v = pow(srp_group["g"], x_int, srp_group["p"])
 
@@ -339,30 +354,30 @@ class AgentSecSocket(SecureSocket):
             raise SecSocketException("Handshake failed.")
 
         ctl_pubkey = reply["ctl_pubkey"]
-        ctl_pubkey_int = int(ctl_pubkey.encode('hex'), 16)
+        ctl_pubkey_int = int(ctl_pubkey.hex(), 16)
 
         if (ctl_pubkey_int % srp_group["p"]) == 0:
             raise SecSocketException("Handshake failed.")
 
         srv_privkey = os.urandom(srp_group["q_size"]+1)
-        srv_privkey_int = int(srv_privkey.encode('hex'), 16) % srp_group["q"]
+        srv_privkey_int = int(srv_privkey.hex(), 16) % srp_group["q"]
 
         srv_pubkey_int = pow(srp_group["g"], srv_privkey_int, srp_group["p"])
         srv_pubkey_int = (srv_pubkey_int + k*v) % srp_group["p"]
         srv_pubkey = "{1:0{0}x}".format(srp_group['p_size']*2, srv_pubkey_int)
-        srv_pubkey = srv_pubkey.decode('hex')
+        srv_pubkey = bytes.fromhex(srv_pubkey)
 
         msg = {"type": "srp_server_pub",
                "srv_pubkey": srv_pubkey}
         self.send_msg(msg)
 
         u = hashlib.sha256(ctl_pubkey + srv_pubkey).digest()
-        u_int = int(u.encode('hex'), 16)
+        u_int = int(u.hex(), 16)
 
         S_int = pow(v, u_int, srp_group['p'])*ctl_pubkey_int
         S_int = pow(S_int, srv_privkey_int, srp_group["p"])
         S = "{1:0{0}x}".format(srp_group['p_size']*2, S_int)
-        S = S.decode('hex')
+        S = bytes.fromhex(S)
 
         msg = self.recv_msg()
         if msg["type"] != "srp_client_m1":
@@ -381,7 +396,7 @@ class AgentSecSocket(SecureSocket):
 
         K = hashlib.sha256(S).digest()
         self._master_secret = self.PRF(K,
-                                       "master secret",
+                                       b"master secret",
                                        self._ctl_random + self._agent_random,
                                        48)
 
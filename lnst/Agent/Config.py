@@ -28,6 +28,16 @@ class AgentConfig(Config):
                 "additive" : False,
                 "action" : self.optionPort,
                 "name" : "rpcport"}
+        self._options['environment']['job_workers'] = {\
+                "value" : 0,
+                "additive" : False,
+                "action" : self.optionInt,
+                "name" : "job_workers"}
+        self._options['environment']['log_rate_limit'] = {\
+                "value" : 0,
+                "additive" : False,
+                "action" : self.optionInt,
+                "name" : "log_rate_limit"}
 
         self._options['cache'] = dict()
         self._options['cache']['dir'] = {\
@@ -43,6 +53,12 @@ class AgentConfig(Config):
                 "action" : self.optionTimeval,
                 "name" : "expiration_period"}
 
+        self._options['cache']['max_size'] = {\
+                "value" : 0, # unlimited
+                "additive" : False,
+                "action" : self.optionSize,
+                "name" : "max_size"}
+
         self._options['security'] = dict()
         self._options['security']['auth_types'] = {\
                 "value" : "none",
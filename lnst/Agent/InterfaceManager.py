@@ -12,16 +12,24 @@ __author__ = """
 olichtne@redhat.com (Ondrej Lichtner)
 """
 
+import os
 import re
+import random
 import select
 import socket
+import struct
+import time
 from collections import deque
 from lnst.Common.ExecCmd import exec_cmd
 from lnst.Common.DeviceError import (DeviceNotFound, DeviceConfigError,
         DeviceError)
 from lnst.Common.InterfaceManagerError import InterfaceManagerError
-from pyroute2 import IPRSocket
+from lnst.Common.HWAddress import hwaddress
+from lnst.Common.LnstError import LnstError
+from pyroute2 import IPRoute, IPBatch, IPRSocket
 from pyroute2.netlink import NLM_F_REQUEST, NLM_F_DUMP
+from pyroute2.netlink import NLMSG_DONE, NLMSG_ERROR
+from pyroute2.netlink.rtnl.ifinfmsg import ifinfmsg
 from pyroute2.netlink.rtnl import RTMGRP_IPV4_IFADDR
 from pyroute2.netlink.rtnl import RTMGRP_IPV6_IFADDR
 from pyroute2.netlink.rtnl import RTMGRP_LINK
@@ -33,19 +41,48 @@ from pyroute2.netlink.rtnl import RTM_GETADDR
 from pyroute2.netlink.rtnl import RTM_DELADDR
 
 NL_GROUPS = RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR | RTMGRP_LINK
+NL_REQUEST_TIMEOUT = 10
+NL_CREATE_BATCH_SIZE = 100
+NL_HEADER = struct.Struct("=IHHII")
 PF_BRIDGE = 7
 
+def _pushed_value_key(value):
+    # address equality ignores the flags, e.g. IFA_F_TENTATIVE
+    if isinstance(value, list):
+        return [(str(item), getattr(item, "prefixlen", None),
+                 getattr(item, "flags", None)) for item in value]
+    return value
+
 class InterfaceManager(object):
     def __init__(self, server_handler):
         self._device_classes = {}
 
         self._devices = {} #ifindex to device
-
-        self._nl_socket = IPRSocket()
-        self._nl_socket.bind(groups=NL_GROUPS)
+        self._name_index = {} #name to ifindex
+        self._hwaddr_index = {} #hwaddr to {ifindex: None}, ordered set
+        self._index_keys = {} #ifindex to (name, hwaddr) it's indexed under
+        self._pushed_state = {} #ifindex to attributes last sent to the ctl
+        self._reserved_names = None #names taken during bulk creation
+        self._handling_msgs = False
+
+        # the notification socket, the device index and the updates pushed
+        # to the controller belong to the process that created the manager,
+        # forked jobs get their own socket, see get_nl_socket()
+        self._pid = os.getpid()
+        self._nl_socket = None
+        self._nl_pid = None
+        self._open_nl_socket()
+        self._nl_seq = random.randint(1, 2**31)
 
         self._msg_queue = deque()
 
+        # handles for configuration requests, owned by the process that
+        # opened them since netlink sockets can't be shared with forked jobs
+        self._iproute = None
+        self._ipbatch = None
+        self._request_socket = None
+        self._request_pid = None
+
         #TODO split DevlinkManager away from the InterfaceManager
         #self._dl_manager = DevlinkManager()
 
@@ -61,47 +98,289 @@ class InterfaceManager(object):
         self._device_classes[name] = cls
         return cls
 
-    def reconnect_netlink(self):
-        if self._nl_socket != None:
-            self._nl_socket.close()
-            self._nl_socket = None
+    def _open_nl_socket(self):
         self._nl_socket = IPRSocket()
         self._nl_socket.bind(groups=NL_GROUPS)
+        self._nl_pid = os.getpid()
 
-        self.rescan_devices()
+    def reconnect_netlink(self):
+        if self._nl_socket != None and self._nl_pid == os.getpid():
+            self._nl_socket.close()
+        self._nl_socket = None
+        self._open_nl_socket()
+
+        self.resync_devices()
 
     def get_nl_socket(self):
+        """Returns the socket subscribed to the link and address notifications
+
+        Every notification is delivered to a socket only once, a forked
+        process (e.g. a job) reading the inherited socket would take them
+        from the parent whose device index would go stale. So a forked
+        process opens its own socket and rebuilds its copy of the index from
+        a full dump instead.
+        """
+        if self._nl_pid != os.getpid():
+            self._msg_queue.clear()
+            self._open_nl_socket()
+            self.resync_devices()
         return self._nl_socket
 
+    def _is_owner(self):
+        return self._pid == os.getpid()
+
+    def _send_to_ctl(self, msg):
+        # the connection to the controller is inherited by forked processes,
+        # only the owner process reports the device changes through it
+        if self._is_owner():
+            self._server_handler.send_data_to_ctl(msg)
+
+    def get_iproute(self):
+        """Returns the pyroute2 IPRoute handle shared by all Devices
+
+        The handle stays open for the lifetime of the manager, it's reopened
+        after close_iproute() or when used from a forked process.
+        """
+        self._check_request_pid()
+        if self._iproute is None:
+            self._iproute = IPRoute()
+        return self._iproute
+
+    def _get_ipbatch(self):
+        self._check_request_pid()
+        if self._ipbatch is None:
+            self._ipbatch = IPBatch()
+        self._ipbatch.reset()
+        return self._ipbatch
+
+    def _get_request_socket(self):
+        self._check_request_pid()
+        if self._request_socket is None:
+            self._request_socket = IPRSocket()
+            self._request_socket.bind(groups=0)
+        return self._request_socket
+
+    def _check_request_pid(self):
+        if self._request_pid != os.getpid():
+            # inherited from the parent process, leave them to it
+            self._iproute = None
+            self._ipbatch = None
+            self._request_socket = None
+            self._request_pid = os.getpid()
+
+    def close_iproute(self):
+        """Closes the configuration handles, e.g. after a socket error"""
+        self._check_request_pid()
+        for handle in [self._iproute, self._ipbatch, self._request_socket]:
+            if handle is not None:
+                try:
+                    handle.close()
+                except Exception:
+                    pass
+        self._iproute = None
+        self._ipbatch = None
+        self._request_socket = None
+
+    def ipr_batch(self, requests):
+        """Sends several IPRoute requests at once and waits for their ACKs
+
+        Args:
+            requests -- list of (obj_name, op_name, kwargs) tuples, the
+                        requests are compiled the same way as the
+                        IPRoute().<obj_name>(op_name, **kwargs) call would
+
+        Returns a list with the NetlinkError of each request or None if it
+        succeeded, in the order of the requests.
+        """
+        if not requests:
+            return []
+
+        batch = self._get_ipbatch()
+        for obj_name, op_name, kwargs in requests:
+            getattr(batch, obj_name)(op_name, **kwargs)
+        data = bytearray(batch.batch)
+
+        # IPBatch only uses a small pool of sequence numbers, renumber the
+        # messages so that every ACK can be matched to its request
+        seqs = []
+        offset = 0
+        while offset < len(data):
+            length, msg_type, flags, _, pid = NL_HEADER.unpack_from(data,
+                                                                    offset)
+            self._nl_seq = self._nl_seq % 2**32 + 1
+            NL_HEADER.pack_into(data, offset, length, msg_type, flags,
+                                self._nl_seq, pid)
+            seqs.append(self._nl_seq)
+            offset += (length + 3) & ~3
+        if len(seqs) != len(requests):
+            raise InterfaceManagerError(
+                "Compiled {} netlink messages for {} requests".format(
+                    len(seqs), len(requests)))
+
+        nl_socket = self._get_request_socket()
+        pending = set(seqs)
+        errors = {}
+        try:
+            nl_socket.sendto(bytes(data), (0, 0))
+            while len(errors) < len(pending):
+                rl, wl, xl = select.select([nl_socket], [], [],
+                                           NL_REQUEST_TIMEOUT)
+                if not len(rl):
+                    raise InterfaceManagerError(
+                        "Timed out waiting for netlink ACKs")
+
+                for reply in nl_socket.get():
+                    header = reply['header']
+                    if (header['type'] == NLMSG_ERROR and
+                            header['sequence_number'] in pending):
+                        errors[header['sequence_number']] = header.get('error')
+        except socket.error:
+            self.close_iproute()
+            raise
+
+        return [errors.get(seq) for seq in seqs]
+
     def pull_netlink_messages_into_queue(self):
+        nl_socket = self.get_nl_socket()
         try:
             while True:
-                rl, wl, xl = select.select([self._nl_socket], [], [], 0)
+                rl, wl, xl = select.select([nl_socket], [], [], 0)
                 if not len(rl):
                     break
-                self._msg_queue.extend(self._nl_socket.get())
+                self._msg_queue.extend(nl_socket.get())
         except socket.error:
+            # most likely ENOBUFS, the socket overran and notifications
+            # were lost so the device index can't be trusted anymore
             self.reconnect_netlink()
             return []
 
     def rescan_devices(self):
+        """Brings the device index up to date
+
+        The index is maintained from the link and address notifications the
+        netlink socket is subscribed to, so this only processes the
+        notifications received since the last call instead of dumping all
+        links and addresses from the kernel.
+        """
+        if self._handling_msgs:
+            # a device looked up while the notifications are processed, e.g.
+            # the master of a device whose state is pushed, the index is
+            # used as is instead of processing the notifications reentrantly
+            return
+        self.handle_netlink_msgs()
+
+    def resync_devices(self):
+        """Rebuilds the device index from a full netlink dump
+
+        Needed on startup and when netlink notifications were lost, devices
+        that are no longer reported by the kernel are removed.
+        """
+        queued = len(self._msg_queue)
         self.request_netlink_dump()
+
+        present = set()
+        for msg in list(self._msg_queue)[queued:]:
+            if (msg['header']['type'] == RTM_NEWLINK and
+                    msg['family'] != PF_BRIDGE):
+                present.add(msg['index'])
+
+        self.handle_netlink_msgs()
+
+        for ifindex in set(self._devices.keys()) - present:
+            self._remove_device(ifindex, {"type": "dev_deleted",
+                                          "ifindex": ifindex})
+
+    def refresh_device(self, ifindex):
+        """Requests the current link state of a single device
+
+        Link notifications aren't sent for statistics changes so attributes
+        like IFLA_STATS64 need an explicit request to be up to date. The
+        request uses the configuration socket so that the reply isn't
+        interleaved with the notifications, the pending notifications are
+        processed first so that the reply is the newest state applied.
+        """
         self.handle_netlink_msgs()
 
+        msg = ifinfmsg()
+        msg['index'] = ifindex
+        try:
+            replies = self._netlink_request(
+                RTM_GETLINK, msg, msg_flags=NLM_F_REQUEST,
+                nl_socket=self._get_request_socket())
+        except socket.error:
+            self.close_iproute()
+            raise
+
+        for reply in replies:
+            self._handle_netlink_msg(reply)
+
     def request_netlink_dump(self):
-        self._nl_socket.put(
-            None, RTM_GETLINK, msg_flags=NLM_F_REQUEST | NLM_F_DUMP
-        )
-        self._nl_socket.put(
-            None, RTM_GETADDR, msg_flags=NLM_F_REQUEST | NLM_F_DUMP
-        )
+        # the kernel refuses a dump request while another dump on the same
+        # socket is in progress, so the address dump has to wait until the
+        # link dump is done
+        self._msg_queue.extend(self._netlink_request(RTM_GETLINK))
+        self._msg_queue.extend(self._netlink_request(RTM_GETADDR))
+
+    def _netlink_request(self, msg_type, msg=None,
+                         msg_flags=NLM_F_REQUEST | NLM_F_DUMP,
+                         nl_socket=None):
+        if nl_socket is None:
+            nl_socket = self.get_nl_socket()
+
+        self._nl_seq = self._nl_seq % 2**32 + 1
+        seq = self._nl_seq
+        nl_socket.put(msg, msg_type, msg_flags=msg_flags, msg_seq=seq)
+
+        replies = []
+        done = False
+        while not done:
+            rl, wl, xl = select.select([nl_socket], [], [],
+                                       NL_REQUEST_TIMEOUT)
+            if not len(rl):
+                raise InterfaceManagerError(
+                    "Timed out waiting for netlink reply")
+
+            for reply in nl_socket.get():
+                # keep everything received, notifications can be interleaved
+                # with the replies
+                replies.append(reply)
+
+                header = reply['header']
+                if header['sequence_number'] != seq:
+                    continue
+                if (not msg_flags & NLM_F_DUMP or
+                        header['type'] in [NLMSG_DONE, NLMSG_ERROR]):
+                    done = True
+        return replies
+
+    def wait_for_condition(self, condition, timeout):
+        """Waits for netlink notifications until condition() is True
+
+        The condition is a callable checking the state of the managed
+        Devices, it's reevaluated whenever new notifications were processed.
+        Returns True if the condition was met and False if it still isn't
+        after timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        self.handle_netlink_msgs()
+        while not condition():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            select.select([self.get_nl_socket()], [], [], remaining)
+            self.handle_netlink_msgs()
+        return True
 
     def handle_netlink_msgs(self):
         self.pull_netlink_messages_into_queue()
 
-        while len(self._msg_queue):
-            msg = self._msg_queue.popleft()
-            self._handle_netlink_msg(msg)
+        self._handling_msgs = True
+        try:
+            while len(self._msg_queue):
+                msg = self._msg_queue.popleft()
+                self._handle_netlink_msg(msg)
+        finally:
+            self._handling_msgs = False
 
         # self._dl_manager.rescan_ports()
         # for device in self._devices.values():
@@ -110,21 +389,30 @@ class InterfaceManager(object):
 
     def _handle_netlink_msg(self, msg):
         if msg['header']['type'] in [RTM_NEWLINK, RTM_NEWADDR, RTM_DELADDR]:
+            if (msg['header']['type'] == RTM_NEWLINK and
+                    msg['family'] == PF_BRIDGE):
+                # bridge port notifications would replace the link message
+                return
+
             if msg['index'] in self._devices:
-                self._devices[msg['index']]._update_netlink(msg)
+                dev = self._devices[msg['index']]
+                dev._update_netlink(msg)
+                if msg['header']['type'] == RTM_NEWLINK:
+                    self._index_device(dev)
+                self._push_device_state(dev)
             elif msg['header']['type'] == RTM_NEWLINK:
                 if msg['ifi_type'] == 772:
                     dev = self._device_classes["LoopbackDevice"](self)
                 else:
                     dev = self._device_classes["Device"](self)
                 dev._init_netlink(msg)
-                self._devices[msg['index']] = dev
+                self._track_device(dev)
 
                 update_msg = {"type": "dev_created",
                               "dev_data": dev._get_if_data()}
-                self._server_handler.send_data_to_ctl(update_msg)
+                self._send_to_ctl(update_msg)
 
-                if msg['ifi_type'] != 772:
+                if msg['ifi_type'] != 772 and self._is_owner():
                     dev._disable()
 
         elif msg['header']['type'] == RTM_DELLINK:
@@ -139,11 +427,6 @@ class InterfaceManager(object):
 
                     return None
 
-                dev = self._devices[msg['index']]
-                dev._deleted = True
-
-                del self._devices[msg['index']]
-
                 # the event may have been a move of device to netns
                 del_msg = {"ifindex": msg['index']}
                 if _netlink_msg_attr(msg, 'IFLA_NEW_NETNSID') is not None:
@@ -152,13 +435,77 @@ class InterfaceManager(object):
                 else:
                     del_msg["type"] = "dev_deleted"
 
-                self._server_handler.send_data_to_ctl(del_msg)
+                self._remove_device(msg['index'], del_msg)
         else:
             return
 
+    def _remove_device(self, ifindex, del_msg):
+        dev = self._devices[ifindex]
+        dev._deleted = True
+
+        self._untrack_ifindex(ifindex)
+
+        self._send_to_ctl(del_msg)
+
+    def _track_device(self, dev):
+        self._devices[dev.ifindex] = dev
+        self._index_device(dev)
+        self._push_device_state(dev)
+
+    def _untrack_ifindex(self, ifindex):
+        del self._devices[ifindex]
+        self._unindex_device(ifindex)
+        self._pushed_state.pop(ifindex, None)
+
+    def _push_device_state(self, dev):
+        """sends the changed netlink based attributes of the device to the
+        controller which serves them from its attribute cache"""
+        state = dev._get_pushed_state()
+        old_state = self._pushed_state.get(dev.ifindex, {})
+        self._pushed_state[dev.ifindex] = state
+
+        changed = {name: value for name, value in state.items()
+                   if name not in old_state or
+                      _pushed_value_key(old_state[name]) != _pushed_value_key(value)}
+        if changed:
+            self._send_to_ctl({"type": "dev_updated",
+                               "ifindex": dev.ifindex,
+                               "attrs": changed})
+
+    def _index_device(self, dev):
+        name = dev._nl_msg.get_attr("IFLA_IFNAME")
+        try:
+            hwaddr = str(hwaddress(dev._nl_msg.get_attr("IFLA_ADDRESS")))
+        except LnstError:
+            # missing or not an ethernet style address, e.g. tunnels
+            hwaddr = None
+
+        if self._index_keys.get(dev.ifindex) == (name, hwaddr):
+            return
+        self._unindex_device(dev.ifindex)
+
+        self._index_keys[dev.ifindex] = (name, hwaddr)
+        self._name_index[name] = dev.ifindex
+        if hwaddr is not None:
+            self._hwaddr_index.setdefault(hwaddr, {})[dev.ifindex] = None
+
+    def _unindex_device(self, ifindex):
+        if ifindex not in self._index_keys:
+            return
+
+        name, hwaddr = self._index_keys.pop(ifindex)
+        if self._name_index.get(name) == ifindex:
+            del self._name_index[name]
+
+        if hwaddr in self._hwaddr_index:
+            ifindexes = self._hwaddr_index[hwaddr]
+            ifindexes.pop(ifindex, None)
+            if not ifindexes:
+                del self._hwaddr_index[hwaddr]
+
     def untrack_device(self, dev):
         if dev.ifindex in self._devices:
-            del self._devices[dev.ifindex]
+            self._untrack_ifindex(dev.ifindex)
 
     def get_device(self, ifindex):
         self.rescan_devices()
@@ -173,24 +520,29 @@ class InterfaceManager(object):
 
     def get_device_by_hwaddr(self, hwaddr):
         self.rescan_devices()
-        for dev in list(self._devices.values()):
-            if dev.hwaddr == hwaddr:
-                return dev
+        try:
+            hwaddr = str(hwaddress(hwaddr))
+        except LnstError:
+            raise DeviceNotFound()
+
+        for ifindex in self._hwaddr_index.get(hwaddr, {}):
+            return self._devices[ifindex]
         raise DeviceNotFound()
 
     def get_device_by_name(self, name):
         self.rescan_devices()
-        for dev in list(self._devices.values()):
-            if dev.name == name:
-                return dev
-        raise DeviceNotFound()
+        try:
+            return self._devices[self._name_index[name]]
+        except KeyError:
+            raise DeviceNotFound()
 
     def get_device_by_params(self, params):
         self.rescan_devices()
         matched = None
         for dev in list(self._devices.values()):
             matched = dev
-            dev_data = dev.get_if_data()
+            ethtool_data = any(key in dev._ethtool_if_data for key in params)
+            dev_data = dev._get_if_data(ethtool_data)
             for key, value in params.items():
                 if key not in dev_data or dev_data[key] != value:
                     matched = None
@@ -207,32 +559,129 @@ class InterfaceManager(object):
             # dev.clear_configuration()
 
     def create_device(self, clsname, args=[], kwargs={}):
+        device = self._new_device(clsname, args, kwargs)
+        device._create()
+        device._bulk_enabled = False
+
+        created = self._resolve_created_devices([device])
+        if created[device] is None:
+            raise DeviceError("Device creation failed")
+        return device
+
+    def create_devices(self, devices):
+        """Creates multiple devices at once
+
+        Args:
+            devices -- list of (clsname, args, kwargs) tuples, the devices
+                       can't refer to each other
+
+        The names of all devices are allocated in one pass from the device
+        index, the links of device types that support it (see
+        SoftDevice._create_request) are created with a single netlink
+        batch and the rest of the devices one by one afterwards. The
+        created devices are resolved from the link notifications.
+
+        Returns the list of created devices in the order of the requests,
+        raises DeviceError listing the failed ones if any creation failed.
+        """
+        self._reserved_names = self._get_used_names()
+        try:
+            new_devices = [self._new_device(clsname, args, kwargs)
+                           for clsname, args, kwargs in devices]
+        finally:
+            self._reserved_names = None
+
+        errors = {}
+        batched = []
+        requests = []
+        for device in new_devices:
+            request = device._create_request()
+            if request is not None:
+                batched.append(device)
+                requests.append(request)
+
+        for i in range(0, len(requests), NL_CREATE_BATCH_SIZE):
+            chunk = slice(i, i + NL_CREATE_BATCH_SIZE)
+            for device, error in zip(batched[chunk],
+                                     self.ipr_batch(requests[chunk])):
+                if error is not None:
+                    errors[device] = error
+            # the notifications of a whole chunk are queued in the socket
+            # by now, read them before the next one can overrun it
+            self.pull_netlink_messages_into_queue()
+
+        for device in new_devices:
+            if device in batched:
+                device._nl_link_update = {}
+            else:
+                try:
+                    device._create()
+                except DeviceError as e:
+                    errors[device] = e
+            device._bulk_enabled = False
+
+        created = self._resolve_created_devices(
+            [device for device in new_devices if device not in errors])
+        for device, ifindex in created.items():
+            if ifindex is None:
+                errors[device] = "no link notification received"
+
+        if errors:
+            failed = ["{}: {}".format(device.name, error)
+                      for device, error in errors.items()]
+            if len(failed) > 10:
+                failed[10:] = ["... {} more".format(len(failed) - 10)]
+            raise DeviceError("Creating {} of {} devices failed: {}".format(
+                len(errors), len(new_devices), ", ".join(failed)))
+        return new_devices
+
+    def _new_device(self, clsname, args, kwargs):
         devcls = self._device_classes[clsname]
 
         try:
             device = devcls(self, *args, **kwargs)
         except KeyError as e:
             raise DeviceConfigError("%s is a mandatory argument" % e)
-        device._create()
-        device._bulk_enabled = False
 
-        self.request_netlink_dump()
+        name = getattr(device, "name", None)
+        if name is not None:
+            self._reserve_name(name)
+        return device
+
+    def _resolve_created_devices(self, devices):
+        """Starts tracking newly created devices
+
+        The devices are matched by name to the link notifications received
+        since their creation. Returns a {device: ifindex} dictionary, the
+        ifindex is None for devices whose link wasn't found.
+        """
+        pending = {device.name: device for device in devices}
         self.pull_netlink_messages_into_queue()
 
-        device_found = False
         while len(self._msg_queue):
             msg = self._msg_queue.popleft()
-            if msg.get_attr("IFLA_IFNAME") == device.name:
-                device_found = True
+            if (msg['header']['type'] == RTM_NEWLINK and
+                    msg['family'] != PF_BRIDGE and
+                    msg.get_attr("IFLA_IFNAME") in pending):
+                device = pending.pop(msg.get_attr("IFLA_IFNAME"))
                 device._init_netlink(msg)
-                self._devices[msg['index']] = device
+                self._track_device(device)
             else:
                 self._handle_netlink_msg(msg)
 
-        if device_found:
-            return device
-        else:
-            raise DeviceError("Device creation failed")
+        for name, device in list(pending.items()):
+            if name in self._name_index:
+                # the notification was already processed while creating the
+                # device, e.g. from _ipr_wrapper, take over the tracked state
+                old_device = self._devices[self._name_index[name]]
+                if old_device is not device:
+                    device._init_netlink(old_device._nl_msg)
+                    device._ip_addrs = old_device._ip_addrs
+                    self._track_device(device)
+                del pending[name]
+
+        return {device: None if device.name in pending else device.ifindex
+                for device in devices}
 
     def remap_device(self, ifindex, clsname, args=[], kwargs={}):
         devcls = self._device_classes[clsname]
@@ -249,40 +698,60 @@ class InterfaceManager(object):
         remapped_device._bulk_enabled = False
         remapped_device._nl_link_update = {}
         remapped_device.ifindex = ifindex
+        remapped_device._init_netlink(old_device._nl_msg)
+        remapped_device._ip_addrs = old_device._ip_addrs
         self.replace_dev(ifindex, remapped_device)
-        self.rescan_devices()
+        self.refresh_device(ifindex)
 
     def replace_dev(self, if_id, dev):
-        del self._devices[if_id]
-        self._devices[if_id] = dev
+        self._untrack_ifindex(if_id)
+        self._track_device(dev)
+
+    def _get_used_names(self):
+        """Returns the set of interface names that can't be assigned
+
+        While devices are created in bulk this is the set of names reserved
+        for the new devices, otherwise the names known to the kernel and to
+        openvswitch (whose interfaces might not exist in the kernel yet).
+        """
+        if self._reserved_names is not None:
+            return self._reserved_names
 
-    def _is_name_used(self, name):
         self.rescan_devices()
-        for device in self._devices.values():
-            if name == device.name:
-                return True
+        names = set(self._name_index)
 
         out, _ = exec_cmd("ovs-vsctl --columns=name list Interface",
                           log_outputs=False, die_on_err=False)
         for line in out.split("\n"):
             m = re.match(r'.*: \"(.*)\"', line)
             if m is not None:
-                if name == m.group(1):
-                    return True
-        return False
+                names.add(m.group(1))
+        return names
+
+    def _is_name_used(self, name):
+        return name in self._get_used_names()
+
+    def _reserve_name(self, name):
+        if self._reserved_names is not None:
+            self._reserved_names.add(name)
+        return name
 
     def assign_name(self, prefix):
+        used = self._get_used_names()
         index = 0
-        while (self._is_name_used(prefix + str(index))):
+        while prefix + str(index) in used:
             index += 1
-        return prefix + str(index)
+        return self._reserve_name(prefix + str(index))
 
     def _assign_name_pair(self, prefix):
+        used = self._get_used_names()
         index1 = 0
         index2 = 0
-        while (self._is_name_used(prefix + str(index1))):
+        while prefix + str(index1) in used:
             index1 += 1
         index2 = index1 + 1
-        while (self._is_name_used(prefix + str(index2))):
+        while prefix + str(index2) in used:
             index2 += 1
+        self._reserve_name(prefix + str(index1))
+        self._reserve_name(prefix + str(index2))
         return prefix + str(index1), prefix + str(index2)
@@ -11,13 +11,16 @@ olichtne@redhat.com (Ondrej Lichtner)
 """
 
 import os
+import sys
 import signal
 import logging
 import multiprocessing
+from multiprocessing.reduction import ForkingPickler
 from lnst.Common.JobError import JobError
 from lnst.Common.ExecCmd import exec_cmd, ExecCmdFail
 from lnst.Common.ConnectionHandler import send_data
 from lnst.Common.Logs import log_exc_traceback
+from lnst.Common.Utils import die_when_parent_die
 
 def get_job_class(what):
     if what["type"] == "shell":
@@ -29,8 +32,9 @@ def get_job_class(what):
         raise JobError("Unknown command type \"%s\"" % what["type"])
 
 class JobContext(object):
-    def __init__(self):
+    def __init__(self, worker_pool=None):
         self._dict = {}
+        self.worker_pool = worker_pool
 
     def add_job(self, job):
         self._dict[job.get_id()] = job
@@ -53,6 +57,17 @@ class JobContext(object):
             if not self._dict[id]._finished:
                 self._dict[id].kill(sig=signal.SIGKILL)
 
+    def reset_after_fork(self):
+        """drops the jobs and workers inherited from the parent process
+
+        They're still running for the parent, e.g. killing them during the
+        cleanup of a forked network namespace agent would kill the jobs of
+        the init namespace.
+        """
+        self._dict = {}
+        if self.worker_pool is not None:
+            self.worker_pool.reset_after_fork()
+
     def get_parent_pipes(self):
         pipes = {}
         for key in self._dict:
@@ -61,8 +76,186 @@ class JobContext(object):
                 pipes[key] = pipe
         return pipes
 
+def _setup_job_process(log_ctl, child_pipe):
+    os.setpgrp()
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    log_ctl.disable_logging()
+    log_ctl.set_connection(child_pipe)
+
+def _set_job_pgid(pid):
+    # the child calls setpgrp too, doing it from both sides makes the
+    # process group exist before kill() can signal it
+    try:
+        os.setpgid(pid, pid)
+    except OSError:
+        # the child already exited
+        pass
+
+def _execute_job(job_id, job_cls, child_pipe):
+    result = {}
+    try:
+        job_cls.run()
+        job_result = job_cls.get_result()
+    except Exception as e:
+        log_exc_traceback()
+        job_result = {}
+        job_result["passed"] = False
+        job_result["type"] = "exception"
+        job_result["res_data"] = job_cls.get_result()
+        job_result["res_data"]["exception"] = e
+    finally:
+        result["type"] = "job_finished"
+        result["job_id"] = job_id
+        result["result"] = job_result
+
+    send_data(child_pipe, result)
+
+class JobWorker(object):
+    """A pre-forked process executing jobs sent through its pipe"""
+    def __init__(self, log_ctl):
+        self.parent_pipe, self.child_pipe = multiprocessing.Pipe()
+        self.killed = False
+        # the module objects the worker can unpickle, compared by identity
+        # so that modules (re)loaded by the agent after the fork are detected
+        self.modules = dict(sys.modules)
+        self.process = multiprocessing.Process(target=self._run,
+                                               args=(log_ctl,))
+        self.process.daemon = True
+        self.process.start()
+        self.pid = self.process.pid
+        _set_job_pgid(self.pid)
+
+    def _run(self, log_ctl):
+        self.parent_pipe.close()
+        die_when_parent_die()
+        _setup_job_process(log_ctl, self.child_pipe)
+
+        while True:
+            try:
+                data = self.child_pipe.recv_bytes()
+            except KeyboardInterrupt:
+                # a signal for a job that finished in the meantime
+                continue
+            except EOFError:
+                break
+
+            job_id, what = ForkingPickler.loads(data)
+            if what is None:
+                break
+            # an interrupt not handled by the job ends the worker just like
+            # it would end a forked job process
+            _execute_job(job_id, get_job_class(what), self.child_pipe)
+
+    def can_run(self, what):
+        if what["type"] != "module":
+            return True
+        module_name = type(what["module"]).__module__
+        return self.modules.get(module_name) is sys.modules.get(module_name)
+
+    def start_job(self, job_id, what):
+        self.parent_pipe.send_bytes(ForkingPickler.dumps((job_id, what)))
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def stop(self):
+        try:
+            self.parent_pipe.send_bytes(ForkingPickler.dumps((None, None)))
+        except OSError:
+            pass
+        self.process.join()
+        self.close()
+
+    def close(self):
+        self.parent_pipe.close()
+        self.child_pipe.close()
+
+class JobWorkerPool(object):
+    """Pool of pre-forked processes for running Jobs
+
+    Forking the agent, creating a pipe and setting up logging for every Job
+    is the main cost of short jobs, the workers of the pool do this only
+    once and then execute jobs one after another. A Job takes a worker only
+    if one is idle, otherwise it forks its own process as usual. Module jobs
+    are only passed to workers forked after their module was loaded.
+
+    Killing a pooled Job signals the worker's process group, a worker that
+    doesn't survive the signal is replaced by a new one.
+    """
+    def __init__(self, log_ctl, size=0):
+        self._log_ctl = log_ctl
+        self._size = size
+        self._idle = []
+        self._busy = []
+
+        self._fill()
+
+    @property
+    def size(self):
+        return self._size
+
+    def set_size(self, size):
+        self._size = size
+        while self._idle and len(self._idle) + len(self._busy) > size:
+            self._idle.pop(0).stop()
+        self._fill()
+
+    def _fill(self):
+        # workers that died without finishing their job
+        self._busy = [worker for worker in self._busy if worker.is_alive()]
+        while len(self._idle) + len(self._busy) < self._size:
+            self._idle.append(JobWorker(self._log_ctl))
+
+    def acquire(self, what):
+        if not self._size:
+            return None
+
+        worker = None
+        for idle_worker in reversed(self._idle):
+            if idle_worker.can_run(what):
+                worker = idle_worker
+                self._idle.remove(worker)
+                break
+        else:
+            if not self._idle:
+                return None
+            # replace a worker forked before the module was loaded
+            self._idle.pop(0).stop()
+            worker = JobWorker(self._log_ctl)
+        self._busy.append(worker)
+        return worker
+
+    def release(self, worker):
+        if worker in self._busy:
+            self._busy.remove(worker)
+        if (not worker.killed and worker.is_alive() and
+                len(self._idle) + len(self._busy) < self._size):
+            self._idle.append(worker)
+        else:
+            worker.process.join()
+            worker.close()
+            self._fill()
+
+    def restart(self):
+        """replaces the idle workers with freshly forked ones"""
+        for worker in self._idle:
+            worker.stop()
+        self._idle = []
+        self._fill()
+
+    def reset_after_fork(self):
+        """drops the workers inherited from the parent process"""
+        for worker in self._idle + self._busy:
+            worker.close()
+        self._idle = []
+        self._busy = []
+        self._fill()
+
 class Job(object):
-    def __init__(self, what, log_ctl):
+    def __init__(self, what, log_ctl, worker_pool=None):
         self._job_cls = get_job_class(what)
         self._what = what
 
@@ -74,6 +267,9 @@ class Job(object):
         self._log_ctl = log_ctl
         self._finished = False
 
+        self._worker_pool = worker_pool
+        self._worker = None
+
     def get_id(self):
         return self._id
 
@@ -81,44 +277,48 @@ class Job(object):
         return self._parent_pipe
 
     def run(self):
+        if self._worker_pool is not None and self._run_pooled():
+            logging.debug("Running job %d in pooled worker with pid \"%d\"" %
+                          (self._id, self._pid))
+            return True
+
         self._parent_pipe, self._child_pipe = multiprocessing.Pipe()
         self._process = multiprocessing.Process(target=self._run)
 
         self._process.daemon = False
         self._process.start()
         self._pid = self._process.pid
+        _set_job_pgid(self._pid)
 
         logging.debug("Running job %d with pid \"%d\"" % (self._id, self._pid))
         return True
 
+    def _run_pooled(self):
+        worker = self._worker_pool.acquire(self._what)
+        if worker is None:
+            return False
+
+        try:
+            worker.start_job(self._id, self._what)
+        except Exception as e:
+            # e.g. objects in the module parameters that can't be pickled
+            logging.debug("Can't pass job %d to a pooled worker: %s" %
+                          (self._id, e))
+            self._worker_pool.release(worker)
+            return False
+
+        self._worker = worker
+        self._parent_pipe = worker.parent_pipe
+        self._child_pipe = worker.child_pipe
+        self._pid = worker.pid
+        return True
+
     def _run(self):
         self._parent_pipe.close()
 
-        os.setpgrp()
-        signal.signal(signal.SIGHUP, signal.SIG_DFL)
-        signal.signal(signal.SIGINT, signal.default_int_handler)
-        signal.signal(signal.SIGTERM, signal.SIG_DFL)
-
-        self._log_ctl.disable_logging()
-        self._log_ctl.set_connection(self._child_pipe)
+        _setup_job_process(self._log_ctl, self._child_pipe)
+        _execute_job(self._id, self._job_cls, self._child_pipe)
 
-        result = {}
-        try:
-            self._job_cls.run()
-            job_result = self._job_cls.get_result()
-        except Exception as e:
-            log_exc_traceback()
-            job_result = {}
-            job_result["passed"] = False
-            job_result["type"] = "exception"
-            job_result["res_data"] = self._job_cls.get_result()
-            job_result["res_data"]["exception"] = e
-        finally:
-            result["type"] = "job_finished"
-            result["job_id"] = self._id
-            result["result"] = job_result
-
-        send_data(self._child_pipe, result)
         self._child_pipe.close()
 
     def kill(self, sig=signal.SIGKILL):
@@ -130,6 +330,9 @@ class Job(object):
             os.killpg(self._pid, sig)
 
             if sig == signal.SIGKILL:
+                if self._worker is not None:
+                    # it may not be reaped yet when the result is processed
+                    self._worker.killed = True
                 result = dict(type = "job_finished",
                               job_id = self._id,
                               result = dict(passed = False,
@@ -142,14 +345,19 @@ class Job(object):
             return False
 
     def join(self):
-        self._process.join()
+        if self._process is not None:
+            self._process.join()
 
     def set_finished(self, result):
         self._finished = True
         self._result = result
 
-        self._parent_pipe.close()
-        self._child_pipe.close()
+        if self._worker is not None:
+            self._worker_pool.release(self._worker)
+            self._worker = None
+        else:
+            self._parent_pipe.close()
+            self._child_pipe.close()
         self._parent_pipe = None
         self._child_pipe = None
 
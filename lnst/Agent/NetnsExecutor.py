@@ -0,0 +1,147 @@
+"""
+Defines the NetnsExecutor class which runs functions inside of a network
+namespace from a thread of the Agent process.
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import os
+import stat
+import ctypes
+import ctypes.util
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from lnst.Common.LnstError import LnstError
+
+#from sched.h
+CLONE_NEWNET = 0x40000000
+#based on ipnetns.c from the iproute2 project
+MNT_DETACH = 0x00000002
+MS_BIND = 4096
+MS_REC = 16384
+MS_SHARED = 1 << 20
+
+NETNS_RUN_DIR = b"/var/run/netns/"
+
+
+class NetnsExecutorError(LnstError):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def get_libc():
+    # find_library() runs ldconfig, look the library up only once
+    return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+
+def prepare_netns_run_dir(libc):
+    """Creates /var/run/netns as a shared mount point
+
+    This is a code mimicking the iproute2 implementation introduced by
+    commit 58a3e8270f: modify all mounts in the files and subdirectories of
+    /var/run/netns to be shared mount points so that unmount events can
+    propagate, making it unlikely that "ip netns delete" will fail because a
+    directory is mounted in another mount namespace.
+    """
+    if not os.path.exists(NETNS_RUN_DIR):
+        os.mkdir(NETNS_RUN_DIR, stat.S_IRWXU | stat.S_IRGRP | stat.S_IXGRP |
+                                stat.S_IROTH | stat.S_IXOTH)
+
+    done = False
+    while libc.mount(b'', NETNS_RUN_DIR, b'none', MS_SHARED | MS_REC, None) != 0:
+        if done:
+            raise OSError(ctypes.get_errno(), 'share rundir failed')
+        if libc.mount(NETNS_RUN_DIR, NETNS_RUN_DIR, b'none', MS_BIND | MS_REC,
+                      None) != 0:
+            raise OSError(ctypes.get_errno(), 'mount rundir failed')
+        done = True
+
+
+class NetnsExecutor(object):
+    """Runs functions in a named network namespace
+
+    The network namespace is a property of a thread, not of the whole
+    process. The executor has a single thread that creates the namespace
+    (with unshare, bound to /var/run/netns/<name> the same way as
+    "ip netns add" does it) and stays in it, the functions passed to call()
+    are run by this thread. Sockets keep the namespace they were created in
+    and processes forked by the thread, e.g. Jobs and exec_cmd() commands,
+    inherit it.
+
+    Unlike the forked namespace agents the mount namespace is shared with
+    the rest of the Agent, /sys shows the devices of the init namespace.
+
+    The thread doesn't exist in processes forked from the Agent, the
+    executor can only be used by the process that created it.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._path = NETNS_RUN_DIR + name.encode("ascii")
+        self._libc = get_libc()
+        self._pid = os.getpid()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="netns-{}".format(name))
+
+        try:
+            self.call(self._create)
+        except:
+            self._executor.shutdown()
+            raise
+
+    @property
+    def name(self):
+        return self._name
+
+    def call(self, func, *args, **kwargs):
+        """Runs func in the namespace thread and returns its result
+
+        Exceptions raised by func are raised by this method.
+        """
+        if os.getpid() != self._pid:
+            # the result would never arrive
+            raise NetnsExecutorError(
+                "Network namespace {} is served by a thread of process {}, "
+                "it can't be used from process {}".format(
+                    self._name, self._pid, os.getpid()))
+        return self._executor.submit(func, *args, **kwargs).result()
+
+    def _create(self):
+        prepare_netns_run_dir(self._libc)
+
+        try:
+            fd = os.open(self._path, os.O_RDONLY | os.O_CREAT | os.O_EXCL, 0)
+        except FileExistsError:
+            raise NetnsExecutorError(
+                "Network namespace {} already exists".format(self._name))
+        os.close(fd)
+
+        try:
+            if self._libc.unshare(CLONE_NEWNET) < 0:
+                raise OSError(ctypes.get_errno(), 'unshare failed', self._name)
+
+            if self._libc.mount(b'/proc/thread-self/ns/net', self._path,
+                                b'none', MS_BIND, None) < 0:
+                raise OSError(ctypes.get_errno(), 'mount failed', self._name)
+        except:
+            os.unlink(self._path)
+            raise
+
+    def close(self):
+        """Removes the named namespace and stops the thread
+
+        The namespace itself is destroyed by the kernel once the thread
+        exited and no process uses it anymore. Does nothing in forked
+        processes, the namespace belongs to the parent process.
+        """
+        if os.getpid() != self._pid or self._closed:
+            return
+        self._closed = True
+
+        try:
+            self._libc.umount2(self._path, MNT_DETACH)
+            os.unlink(self._path)
+        finally:
+            self._executor.shutdown(wait=True)
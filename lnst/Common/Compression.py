@@ -0,0 +1,53 @@
+"""
+Helper functions for compressing data transferred between the Controller and
+the Agent.
+
+"zlib" is always available, "lz4" and "zstd" require the optional 'lz4' and
+'zstandard' libraries to be installed on both the Controller and the Agent.
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import zlib
+from lnst.Common.LnstError import LnstError
+from lnst.Common.DependencyError import DependencyError
+
+COMPRESSION_METHODS = ["zlib", "lz4", "zstd"]
+
+
+class CompressionError(LnstError):
+    pass
+
+
+def _get_codec(method):
+    if method == "zlib":
+        return (lambda data: zlib.compress(data, 1)), zlib.decompress
+    elif method == "lz4":
+        try:
+            import lz4.frame
+        except ModuleNotFoundError as e:
+            raise DependencyError(e)
+        return lz4.frame.compress, lz4.frame.decompress
+    elif method == "zstd":
+        try:
+            import zstandard
+        except ModuleNotFoundError as e:
+            raise DependencyError(e)
+        return (zstandard.ZstdCompressor().compress,
+                zstandard.ZstdDecompressor().decompress)
+    else:
+        raise CompressionError("Unknown compression method '{}'".format(method))
+
+
+def compress(data, method=None):
+    if method is None:
+        return data
+    return _get_codec(method)[0](data)
+
+
+def decompress(data, method=None):
+    if method is None:
+        return data
+    return _get_codec(method)[1](data)
@@ -202,6 +202,13 @@ class Config():
             raise ConfigError(msg)
         return int(option)
 
+    def optionInt(self, option, cfg_path):
+        try:
+            return int(option)
+        except ValueError:
+            msg = "Option expects a number."
+            raise ConfigError(msg)
+
     def optionPath(self, option, cfg_path):
         exp_path = os.path.expanduser(option)
         abs_path = os.path.join(os.path.dirname(cfg_path), exp_path)
@@ -255,6 +262,16 @@ class Config():
 
         return timeval
 
+    def optionSize(self, option, cfg_path):
+        size_re = r"^([0-9]+)\s*([kKmMgGtT]?)B?$"
+        size_match = re.match(size_re, option.strip())
+        if not size_match:
+            msg = "Incorrect size format."
+            raise ConfigError(msg)
+
+        units = {"": 0, "k": 1, "m": 2, "g": 3, "t": 4}
+        return int(size_match.group(1)) * 1024**units[size_match.group(2).lower()]
+
     def optionColour(self, option, cfg_path):
         colour = option.split()
         if len(colour) != 3:
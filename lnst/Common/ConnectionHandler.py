@@ -12,32 +12,47 @@ olichtne@redhat.com (Ondrej Lichtner)
 """
 
 import select
+import pickle
 import socket
 import logging
 import traceback
 from multiprocessing.connection import Connection
 from lnst.Common.SecureSocket import SecureSocket, SecSocketException
 
-def send_data(s, data):
+def send_data(s, data, dumps=None):
+    """sends data, dumps is an optional function replacing pickle.dumps"""
     try:
         if isinstance(s, SecureSocket):
-            s.send_msg(data)
+            if dumps is None:
+                s.send_msg(data)
+            else:
+                s.send_msg(data, dumps)
         elif isinstance(s, Connection):
-            s.send(data)
+            if dumps is None:
+                s.send(data)
+            else:
+                s.send_bytes(dumps(data))
         else:
             return False
     except socket.error:
         return False
     return True
 
-def recv_data(s):
+def recv_data(s, loads=None):
+    """receives data, loads is an optional function replacing pickle.loads"""
     if isinstance(s, SecureSocket):
         try:
-            data = s.recv_msg()
+            if loads is None:
+                data = s.recv_msg()
+            else:
+                data = s.recv_msg(loads)
         except SecSocketException:
             return ""
     elif isinstance(s, Connection):
-        data = s.recv()
+        if loads is None:
+            data = s.recv()
+        else:
+            data = loads(s.recv_bytes())
     else:
         return None
     return data
@@ -48,6 +63,14 @@ class ConnectionHandler(object):
         self._connections = []
         self._connection_mapping = {}
 
+    def _loads(self, data):
+        """Deserializes the received messages
+
+        Derived classes override this to translate the device references
+        in the messages, see lnst.Common.DeviceRef.
+        """
+        return pickle.loads(data)
+
     def check_connections(self, timeout=None):
         return self._check_connections(list(self._connections), timeout)
 
@@ -73,7 +96,7 @@ class ConnectionHandler(object):
             f_ready = True
             while f_ready:
                 try:
-                    data = recv_data(f)
+                    data = recv_data(f, self._loads)
 
                     if data == "":
                         f.close()
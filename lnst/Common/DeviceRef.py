@@ -1,5 +1,6 @@
 """
-Defines the DeviceRef class.
+Defines the DeviceRef class and the picklers used to transfer references to
+devices between the Controller and the Agent.
 
 Copyright 2017 Red Hat, Inc.
 Licensed under the GNU General Public License, version 2 as
@@ -10,6 +11,9 @@ __author__ = """
 olichtne@redhat.com (Ondrej Lichtner)
 """
 
+import io
+import pickle
+
 class DeviceRef(object):
     """Device reference transferable over network
 
@@ -17,3 +21,58 @@ class DeviceRef(object):
     """
     def __init__(self, ifindex):
         self.ifindex = int(ifindex)
+
+def _device_ref(ifindex, netns=None):
+    """Unpickles a device reference
+
+    Used when a message created by DeviceRefPickler is loaded with the plain
+    pickle.loads, the DeviceRefUnpickler resolves the reference instead.
+    """
+    return DeviceRef(ifindex)
+
+class DeviceRefPickler(pickle.Pickler):
+    """Pickler that sends devices as references
+
+    Instances of device_classes (and DeviceRef objects) are replaced by a
+    reference containing their ifindex and the name of the network
+    namespace the message belongs to, the receiving side translates it back
+    with a DeviceRefUnpickler. The rest of the message is pickled as usual
+    so there's no need to walk and copy it beforehand.
+
+    reducer_override is used instead of persistent_id, the pickler calls
+    persistent_id for every object of the message (e.g. each float of
+    a sample list) while reducer_override isn't called for the builtin
+    types.
+    """
+    def __init__(self, file, device_classes=(), netns=None):
+        super(DeviceRefPickler, self).__init__(file, pickle.DEFAULT_PROTOCOL)
+        self._device_classes = tuple(device_classes) + (DeviceRef,)
+        self._netns = netns
+
+    def reducer_override(self, obj):
+        if isinstance(obj, self._device_classes):
+            return _device_ref, (obj.ifindex, self._netns)
+        return NotImplemented
+
+class DeviceRefUnpickler(pickle.Unpickler):
+    """Unpickler translating the references created by DeviceRefPickler
+
+    get_device is called with the ifindex and network namespace name of
+    each reference and returns the object that replaces it.
+    """
+    def __init__(self, file, get_device):
+        super(DeviceRefUnpickler, self).__init__(file)
+        self._get_device = get_device
+
+    def find_class(self, module, name):
+        if module == __name__ and name == _device_ref.__name__:
+            return self._get_device
+        return super(DeviceRefUnpickler, self).find_class(module, name)
+
+def device_refs_dumps(obj, device_classes=(), netns=None):
+    f = io.BytesIO()
+    DeviceRefPickler(f, device_classes, netns).dump(obj)
+    return f.getvalue()
+
+def device_refs_loads(data, get_device):
+    return DeviceRefUnpickler(io.BytesIO(data), get_device).load()
@@ -5,6 +5,10 @@ LogBuffer
 Handler used solely for temporarily storing messages so that they can be
 retrieved later.
 
+TransmitHandler, BatchingTransmitHandler
+Handlers sending the log records to the controller (or to the parent
+process).
+
 Copyright 2012 Red Hat, Inc.
 Licensed under the GNU General Public License, version 2 as
 published by the Free Software Foundation; see COPYING for details.
@@ -14,6 +18,7 @@ __author__ = """
 olichtne@redhat.com (Ondrej Lichtner)
 """
 
+import time
 import pickle
 import logging
 import xmlrpc.client
@@ -71,15 +76,17 @@ class TransmitHandler(logging.Handler):
     def set_origin_name(self, name):
         self._origin_name = name
 
-    def emit(self, record):
+    def _record_dict(self, record):
         r = dict(record.__dict__)
         r['msg'] = record.getMessage()
         r['args'] = None
         r['exc_info'] = None
         if self._origin_name != None:
             r['origin_name'] = self._origin_name
+        return r
 
-        data = {"type": "log", "record": r}
+    def emit(self, record):
+        data = {"type": "log", "record": self._record_dict(record)}
 
         send_data(self.target, data)
 
@@ -87,6 +94,98 @@ class TransmitHandler(logging.Handler):
         logging.Handler.close(self)
 
 
+class BatchingTransmitHandler(TransmitHandler):
+    """TransmitHandler sending the records in "log_batch" messages
+
+    Records are collected and sent when batch_size records are buffered,
+    when the oldest buffered record is older than flush_interval seconds
+    (checked when a record is emitted) or when flush() is called. The owner
+    of the target calls flush() before sending other messages through it, so
+    that the records stay ordered with them, and before it starts waiting
+    for new messages. Records of level WARNING and above are sent
+    immediately together with the buffered ones.
+
+    With rate_limit set, at most rate_limit records below WARNING are sent
+    per second, the rest is dropped. The number of dropped records is
+    reported by a WARNING record once the second is over and kept in the
+    dropped attribute.
+    """
+    def __init__(self, target, batch_size=100, flush_interval=0.05,
+                 rate_limit=0):
+        TransmitHandler.__init__(self, target)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._rate_limit = rate_limit
+
+        self._buffer = []
+        self._first_buffered = None
+
+        self._window_start = 0
+        self._window_count = 0
+        self._window_dropped = 0
+        self.dropped = 0
+
+    def emit(self, record):
+        now = time.monotonic()
+        if now - self._window_start >= 1:
+            self._end_rate_window(now)
+
+        if record.levelno < logging.WARNING and self._rate_limit:
+            if self._window_count >= self._rate_limit:
+                self._window_dropped += 1
+                self.dropped += 1
+                return
+            self._window_count += 1
+
+        self._add_record(self._record_dict(record), now)
+
+        if (record.levelno >= logging.WARNING or
+                len(self._buffer) >= self._batch_size or
+                now - self._first_buffered >= self._flush_interval):
+            self._send_buffer()
+
+    def _add_record(self, record_dict, now):
+        if not self._buffer:
+            self._first_buffered = now
+        self._buffer.append(record_dict)
+
+    def _end_rate_window(self, now):
+        if self._window_dropped:
+            record = logging.makeLogRecord({
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": logging.getLevelName(logging.WARNING),
+                "msg": "Dropped %d log records exceeding the limit of %d "
+                       "records per second" % (self._window_dropped,
+                                               self._rate_limit)})
+            self._add_record(self._record_dict(record), now)
+        self._window_start = now
+        self._window_count = 0
+        self._window_dropped = 0
+
+    def _send_buffer(self):
+        if not self._buffer:
+            return
+        data = {"type": "log_batch", "records": self._buffer}
+        self._buffer = []
+        self._first_buffered = None
+        send_data(self.target, data)
+
+    def flush(self):
+        self.acquire()
+        try:
+            now = time.monotonic()
+            if self._window_dropped and now - self._window_start >= 1:
+                self._end_rate_window(now)
+            self._send_buffer()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        TransmitHandler.close(self)
+
+
 class ExportHandler(logging.Handler):
     def __init__(self, logs):
         logging.Handler.__init__(self)
@@ -14,6 +14,7 @@ from logging import Formatter
 import logging.handlers
 import traceback
 from lnst.Common.LoggingHandler import TransmitHandler, ExportHandler
+from lnst.Common.LoggingHandler import BatchingTransmitHandler
 from lnst.Common.Colours import decorate_with_preset, strip_colours
 
 def log_exc_traceback():
@@ -221,16 +222,31 @@ class LoggingCtl:
         del self.agents[agent_id]
 
     def add_client_log(self, agent_id, log_record):
+        """log_record is a record dictionary or a list of them (the
+        records of a "log_batch" message)"""
         logger = logging.getLogger(agent_id)
 
-        log_record['address'] = agent_id
-        record = logging.makeLogRecord(log_record)
-        logger.handle(record)
+        if isinstance(log_record, dict):
+            log_record = [log_record]
 
-    def set_connection(self, target):
+        for r in log_record:
+            r['address'] = agent_id
+            logger.handle(logging.makeLogRecord(r))
+
+    def set_connection(self, target, batching=False, rate_limit=0):
+        """Sends the log records to target
+
+        With batching the records are sent in batches, see
+        BatchingTransmitHandler, and flush_connection() has to be called
+        before other messages are sent to target.
+        """
         if self.transmit_handler != None:
             self.cancel_connection()
-        self.transmit_handler = TransmitHandler(target)
+        if batching:
+            self.transmit_handler = BatchingTransmitHandler(
+                target, rate_limit=rate_limit)
+        else:
+            self.transmit_handler = TransmitHandler(target)
 
         self.transmit_handler.set_origin_name(self._origin_name)
 
@@ -240,6 +256,10 @@ class LoggingCtl:
         for k in list(self.agents.keys()):
             self.remove_agent(k)
 
+    def flush_connection(self):
+        if self.transmit_handler != None:
+            self.transmit_handler.flush()
+
     def cancel_connection(self):
         if self.transmit_handler != None:
             logger = logging.getLogger()
@@ -11,26 +11,42 @@ rpazdera@redhat.com (Radek Pazdera)
 
 import logging
 import os
+import re
 import time
 import shutil
 import json
+from tempfile import NamedTemporaryFile
 from lnst.Common.Utils import sha256sum
 from lnst.Common.LnstError import LnstError
 
 #current index version
-INDEX_VERSION = 1
+INDEX_VERSION = 2
 #minimal supported index version -- will be updated to current one when loaded
 MIN_INDEX_VERSION = 1
 
+_ENTRY_FILE_RE = re.compile(r"^[0-9a-f]{64}$")
+
 class ResourceCacheError(LnstError):
     pass
 
 class ResourceCache(object):
+    """Content addressed cache of the resources sent by the Controller
+
+    Entries are stored as files named by the sha256 digest of their content.
+    The index keeps the entries in least recently used order and is written
+    atomically (temporary file + rename) by save(), modifications only mark
+    it as dirty so that bulk operations write it once.
+
+    Entries not used for expiration_period seconds are removed by
+    del_old_entries(), if max_size (in bytes) is set the least recently used
+    entries are evicted whenever the cache grows bigger. 0 disables either
+    limit.
+    """
     _CACHE_INDEX_FILE_NAME = "index"
     _root = None
     _expiration_period = None
 
-    def __init__(self, cache_path, expiration_period):
+    def __init__(self, cache_path, expiration_period, max_size=0):
         if os.path.exists(cache_path):
             if os.path.isdir(cache_path):
                 self._root = cache_path
@@ -42,34 +58,82 @@ class ResourceCache(object):
 
         self._index = {"index_version": INDEX_VERSION,
                        "entries": {}}
-        self._read_index()
+        self._dirty = False
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
         self._expiration_period = expiration_period
+        self._max_size = max_size
+
+        self._read_index()
+        self._check_entries()
 
     def _read_index(self):
         try:
-            with open(self.index_path, "w") as f:
+            with open(self.index_path, "r") as f:
                 index = json.load(f)
-                if index["index_version"] > INDEX_VERSION:
-                    raise ResourceCacheError("Incompatible ResourceCache index versions")
-                elif index["index_version"] == INDEX_VERSION:
-                    self._index = index
-                    logging.debug("Resource cache index loaded")
-                else:
-                    self._index = self._update_old_index(index)
-                    logging.debug("Resource cache index loaded")
-                    self._save_index()
-        except:
-            pass
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning("Couldn't load the resource cache index: %s" % e)
+            return
+
+        if index["index_version"] > INDEX_VERSION:
+            raise ResourceCacheError("Incompatible ResourceCache index versions")
+        elif index["index_version"] == INDEX_VERSION:
+            self._index = index
+        else:
+            self._index = self._update_old_index(index)
+            self._dirty = True
+        logging.debug("Resource cache index loaded")
 
     def _update_old_index(self, old):
         if old["index_version"] < MIN_INDEX_VERSION:
             raise ResourceCacheError("ResourceCache index version too old to update")
         logging.debug("Updating old index to newer version")
-        return old
 
-    def _save_index(self):
-        with open(self.index_path, "w") as f:
-            json.dump(self._index, f)
+        # version 2 keeps the entries in LRU order and records their size
+        entries = sorted(old["entries"].items(),
+                         key=lambda item: item[1]["last_used"])
+        for _, entry in entries:
+            try:
+                entry["size"] = os.path.getsize(entry["path"])
+            except OSError:
+                entry["size"] = 0
+        return {"index_version": INDEX_VERSION, "entries": dict(entries)}
+
+    def _check_entries(self):
+        entries = self._index["entries"]
+        for entry_hash, entry in list(entries.items()):
+            if not os.path.isfile(entry["path"]):
+                del entries[entry_hash]
+                self._dirty = True
+            else:
+                self._size += entry["size"]
+
+        # files left over by an add that didn't make it to the index
+        for file_name in os.listdir(self._root):
+            if _ENTRY_FILE_RE.match(file_name) and file_name not in entries:
+                os.remove(os.path.join(self._root, file_name))
+
+        self._evict()
+        self.save()
+
+    def save(self):
+        """writes the index to disk if it was modified"""
+        if not self._dirty:
+            return
+
+        with NamedTemporaryFile("w", dir=self._root, prefix=".index",
+                                delete=False) as f:
+            try:
+                json.dump(self._index, f)
+            except:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, self.index_path)
+        self._dirty = False
 
     @property
     def index_path(self):
@@ -80,16 +144,40 @@ class ResourceCache(object):
         return self._root
 
     def query(self, res_hash):
-        return res_hash in self._index["entries"]
+        if res_hash in self._index["entries"]:
+            self._hits += 1
+            return True
+
+        self._misses += 1
+        return False
 
     def get_path(self, res_hash):
         return self._index["entries"][res_hash]["path"]
 
-    def renew_entry(self, entry_hash):
-        self._index["entries"][entry_hash]["last_used"] = int(time.time())
-        self._save_index()
+    def get_stats(self):
+        return {"hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._index["entries"]),
+                "size": self._size,
+                "max_size": self._max_size}
 
-    def add_file_entry(self, filepath, entry_name):
+    def renew_entry(self, entry_hash):
+        entries = self._index["entries"]
+        try:
+            entry = entries.pop(entry_hash)
+        except KeyError:
+            raise ResourceCacheError("Entry %s not in cache" % entry_hash)
+        entry["last_used"] = int(time.time())
+        entries[entry_hash] = entry
+        self._dirty = True
+
+    def add_file_entry(self, filepath, entry_name, keep=()):
+        """Moves the file to the cache, returns its hash
+
+        The entries with the hashes in keep aren't evicted to make room for
+        the new entry, e.g. the ones the same resource sync uses.
+        """
         entry_hash = sha256sum(filepath)
 
         if entry_hash in self._index["entries"]:
@@ -105,28 +193,46 @@ class ResourceCache(object):
                  "path": entry_path,
                  "last_used": int(time.time()),
                  "digest": entry_hash,
+                 "size": os.path.getsize(entry_path),
                  "type": "file"}
         self._index["entries"][entry_hash] = entry
+        self._size += entry["size"]
+        self._dirty = True
 
-        self._save_index()
+        self._evict(keep={entry_hash, *keep})
 
         return entry_hash
 
     def del_cache_entry(self, entry_hash):
         if entry_hash in self._index["entries"]:
-            os.remove(self._index["entries"][entry_hash].path)
-            del self._index["entries"][entry_hash]
-            self._save_index()
-
-    def del_old_entries(self):
-        if self._expiration_period == 0:
+            entry = self._index["entries"].pop(entry_hash)
+            try:
+                os.remove(entry["path"])
+            except FileNotFoundError:
+                pass
+            self._size -= entry["size"]
+            self._dirty = True
+
+    def _evict(self, keep=()):
+        if not self._max_size:
             return
 
-        rm = []
-        now = time.time()
-        for entry_hash, entry in list(self._index["entries"].items()):
-            if entry["last_used"] <= (now - self._expiration_period):
-                rm.append(entry_hash)
-
-        for entry_hash in rm:
+        for entry_hash in list(self._index["entries"]):
+            if self._size <= self._max_size:
+                break
+            if entry_hash in keep:
+                continue
+            logging.debug("Evicting resource cache entry %s" % entry_hash)
             self.del_cache_entry(entry_hash)
+            self._evictions += 1
+
+    def del_old_entries(self):
+        if self._expiration_period != 0:
+            now = time.time()
+            for entry_hash, entry in list(self._index["entries"].items()):
+                if entry["last_used"] > (now - self._expiration_period):
+                    # entries are ordered by last use
+                    break
+                self.del_cache_entry(entry_hash)
+
+        self.save()
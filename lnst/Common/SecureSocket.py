@@ -17,6 +17,7 @@ olichtne@redhat.com (Ondrej Lichtner)
 
 import os
 import pickle
+import struct
 import hashlib
 import hmac
 from lnst.Common.Utils import not_imported
@@ -72,6 +73,28 @@ SRP_GROUP["p_size"] = bit_length(SRP_GROUP["p"])//8
 if bit_length(SRP_GROUP["p"])%8:
     SRP_GROUP["p_size"] += 1
 
+# Wire framing modes, negotiated in the ctl_hello/agent_hello exchange.
+# "ascii" is the original "<decimal length> <payload>" framing that has to be
+# parsed one byte at a time, "binary" uses a fixed size network order length
+# header so that the whole frame can be read with two recv_into calls.
+FRAMING_ASCII = "ascii"
+FRAMING_BINARY = "binary"
+SUPPORTED_FRAMINGS = [FRAMING_BINARY, FRAMING_ASCII]
+
+BINARY_FRAME_HEADER = struct.Struct("!Q")
+
+# Record protection protocols, negotiated together with the framing.
+# "aes-cbc-hmac" is the original pickle -> HMAC -> pickle -> pad -> AES-CBC ->
+# pickle chain, the AEAD protocols seal the raw payload in a single pass using
+# the per direction sequence number as the nonce.
+RECORD_LEGACY = "aes-cbc-hmac"
+RECORD_AES_GCM = "aes-gcm"
+RECORD_CHACHA20_POLY1305 = "chacha20-poly1305"
+SUPPORTED_RECORD_PROTOCOLS = [RECORD_AES_GCM, RECORD_CHACHA20_POLY1305,
+                              RECORD_LEGACY]
+
+AEAD_NONCE = struct.Struct("!4xQ")
+
 class SecSocketException(LnstError):
     pass
 
@@ -81,6 +104,8 @@ Cipher = not_imported
 algorithms = not_imported
 modes = not_imported
 padding = not_imported
+AESGCM = not_imported
+ChaCha20Poly1305 = not_imported
 ec = not_imported
 EllipticCurvePrivateKey = not_imported
 EllipticCurvePublicKey = not_imported
@@ -89,7 +114,7 @@ RSAPublicKey = not_imported
 DSAPrivateKey = not_imported
 DSAPublicKey = not_imported
 default_backend = not_imported
-cryptography_imported = not_imported
+cryptography_imported = False
 def cryptography_imports():
     global cryptography_imported
     if cryptography_imported:
@@ -101,6 +126,8 @@ def cryptography_imports():
     global algorithms
     global modes
     global padding
+    global AESGCM
+    global ChaCha20Poly1305
     global ec
     global EllipticCurvePrivateKey
     global EllipticCurvePublicKey
@@ -115,6 +142,8 @@ def cryptography_imports():
         from cryptography.hazmat.primitives import hashes
         from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
         from cryptography.hazmat.primitives.asymmetric import padding, ec
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
         from cryptography.hazmat.primitives.asymmetric.ec import EllipticCurvePrivateKey
         from cryptography.hazmat.primitives.asymmetric.ec import EllipticCurvePublicKey
         from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
@@ -131,8 +160,10 @@ class SecureSocket(object):
     def __init__(self, soc):
         self._role = None
         self._socket = soc
+        self._framing = FRAMING_ASCII
+        self._record_protocol = RECORD_LEGACY
 
-        self._master_secret = ""
+        self._master_secret = b""
 
         self._ctl_random = None
         self._agent_random = None
@@ -150,15 +181,15 @@ class SecureSocket(object):
                                 "mac_key": None,
                                 "seq_num": 0}
 
-    def send_msg(self, msg):
-        pickled_msg = pickle.dumps(msg)
+    def send_msg(self, msg, dumps=pickle.dumps):
+        pickled_msg = dumps(msg)
         return self.send(pickled_msg)
 
-    def recv_msg(self):
+    def recv_msg(self, loads=pickle.loads):
         pickled_msg = self.recv()
         if pickled_msg == b"":
             raise SecSocketException("Disconnected")
-        msg = pickle.loads(pickled_msg)
+        msg = loads(pickled_msg)
         return msg
 
     def _add_mac_sign(self, data):
@@ -213,9 +244,11 @@ class SecureSocket(object):
             return data
         cryptography_imports()
 
-        pad_length = ord(data[-1])
-        for char in data[-pad_length]:
-            if ord(char) != pad_length:
+        pad_length = data[-1]
+        if pad_length == 0 or pad_length > len(data):
+            return None
+        for char in data[-pad_length:]:
+            if char != pad_length:
                 return None
 
         return data[:-pad_length]
@@ -256,15 +289,55 @@ class SecureSocket(object):
 
         return decrypted_data
 
+    def _get_aead(self, spec):
+        aead = spec.get("aead")
+        if aead is None:
+            cryptography_imports()
+            if self._record_protocol == RECORD_AES_GCM:
+                aead = AESGCM(spec["enc_key"])
+            elif self._record_protocol == RECORD_CHACHA20_POLY1305:
+                aead = ChaCha20Poly1305(spec["enc_key"])
+            else:
+                raise SecSocketException("Unknown record protocol '{}'".format(
+                                         self._record_protocol))
+            spec["aead"] = aead
+        return aead
+
+    def _aead_seal(self, data):
+        spec = self._current_write_spec
+        nonce = AEAD_NONCE.pack(spec["seq_num"])
+        return self._get_aead(spec).encrypt(nonce, data, None)
+
+    def _aead_open(self, data):
+        spec = self._current_read_spec
+        nonce = AEAD_NONCE.pack(spec["seq_num"])
+        try:
+            return self._get_aead(spec).decrypt(nonce, data, None)
+        except cryptography.exceptions.InvalidTag:
+            return None
+
     def _protect_data(self, data):
-        signed = self._add_mac_sign(data)
-        padded = self._add_padding(signed)
-        encrypted = self._add_encrypt(padded)
+        if (self._record_protocol != RECORD_LEGACY and
+                self._current_write_spec["enc_key"]):
+            encrypted = self._aead_seal(data)
+        else:
+            signed = self._add_mac_sign(data)
+            padded = self._add_padding(signed)
+            encrypted = self._add_encrypt(padded)
 
         self._current_write_spec["seq_num"] += 1
         return encrypted
 
     def _uprotect_data(self, encrypted):
+        if (self._record_protocol != RECORD_LEGACY and
+                self._current_read_spec["enc_key"]):
+            data = self._aead_open(encrypted)
+            if data is None:
+                return None
+
+            self._current_read_spec["seq_num"] += 1
+            return data
+
         padded = self._del_encrypt(encrypted)
         signed = self._del_padding(padded)
 
@@ -281,36 +354,89 @@ class SecureSocket(object):
     def send(self, data):
         protected_data = self._protect_data(data)
 
-        transmit_data = bytes(str(len(protected_data)).encode('ascii')) + b" " + protected_data
+        if self._framing == FRAMING_BINARY:
+            header = BINARY_FRAME_HEADER.pack(len(protected_data))
+        else:
+            header = bytes(str(len(protected_data)).encode('ascii')) + b" "
 
-        return self._socket.sendall(transmit_data)
+        return self._socket.sendall(header + protected_data)
 
     def recv(self):
-        length = b""
-        while True:
-            c = self._socket.recv(1)
-
-            if c == b' ':
-                length = int(length.decode('ascii'))
-                break
-            elif c == b"":
-                return b""
-            else:
-                length += c
-
-        data = b""
-        while len(data) < length:
-            c = self._socket.recv(length - len(data))
-            if c == b"":
+        if self._framing == FRAMING_BINARY:
+            header = self._recv_exact(BINARY_FRAME_HEADER.size)
+            if not header:
                 return b""
-            else:
-                data += c
+            length = BINARY_FRAME_HEADER.unpack(header)[0]
+        else:
+            length = b""
+            while True:
+                c = self._socket.recv(1)
+
+                if c == b' ':
+                    length = int(length.decode('ascii'))
+                    break
+                elif c == b"":
+                    return b""
+                else:
+                    length += c
+
+        data = self._recv_exact(length)
+        if not data:
+            return b""
 
         msg = self._uprotect_data(data)
         if msg is None:
             return self.recv()
         return self._handle_internal(msg)
 
+    def _recv_exact(self, length):
+        buf = bytearray(length)
+        view = memoryview(buf)
+        received = 0
+        while received < length:
+            n = self._socket.recv_into(view[received:])
+            if n == 0:
+                return b""
+            received += n
+        return buf
+
+    @property
+    def framing(self):
+        return self._framing
+
+    def _set_framing(self, framing):
+        if framing not in SUPPORTED_FRAMINGS:
+            raise SecSocketException("Unsupported framing '{}'".format(framing))
+        self._framing = framing
+
+    def _select_framing(self, offered):
+        """picks the first framing offered by the peer that we support,
+        peers that don't offer anything only understand the ascii framing"""
+        return self._select_supported(offered, SUPPORTED_FRAMINGS,
+                                      FRAMING_ASCII)
+
+    @property
+    def record_protocol(self):
+        return self._record_protocol
+
+    def _set_record_protocol(self, record_protocol):
+        if record_protocol not in SUPPORTED_RECORD_PROTOCOLS:
+            raise SecSocketException("Unsupported record protocol '{}'".format(
+                                     record_protocol))
+        self._record_protocol = record_protocol
+
+    def _select_record_protocol(self, offered):
+        """same as _select_framing, the fallback for old peers is the
+        aes-cbc-hmac record protocol"""
+        return self._select_supported(offered, SUPPORTED_RECORD_PROTOCOLS,
+                                      RECORD_LEGACY)
+
+    def _select_supported(self, offered, supported, default):
+        for option in offered or []:
+            if option in supported:
+                return option
+        return default
+
     def _handle_internal(self, orig_msg):
         try:
             msg = pickle.loads(orig_msg)
@@ -382,11 +508,12 @@ class SecureSocket(object):
             raise SecSocketException("Socket without a role!")
         cryptography_imports()
 
-        aes_keysize = max(algorithms.AES.key_sizes)//8
+        # AES-256, AES.key_sizes also lists the 512 bit keys of AES-XTS
+        aes_keysize = 256//8
         mac_keysize = hashlib.sha256().block_size
 
         prf_seq = self.PRF(self._master_secret,
-                           "key expansion",
+                           b"key expansion",
                            self._agent_random + self._ctl_random,
                            2 * aes_keysize + 2 * mac_keysize)
 
@@ -404,40 +531,33 @@ class SecureSocket(object):
     def _sign_data(self, data, privkey):
         cryptography_imports()
         if isinstance(privkey, DSAPrivateKey):
-            signer = privkey.signer(hashes.SHA256())
+            return privkey.sign(data, hashes.SHA256())
         elif isinstance(privkey, RSAPrivateKey):
-            signer = privkey.signer(padding.PSS(padding.MGF1(hashes.SHA256()),
-                                                padding.PSS.MAX_LENGTH),
-                                    hashes.SHA256())
+            return privkey.sign(data,
+                                padding.PSS(padding.MGF1(hashes.SHA256()),
+                                            padding.PSS.MAX_LENGTH),
+                                hashes.SHA256())
         elif isinstance(privkey, EllipticCurvePrivateKey):
-            signer = privkey.signer(ec.ECDSA(hashes.SHA256()))
+            return privkey.sign(data, ec.ECDSA(hashes.SHA256()))
         else:
             raise SecSocketException("Unsupported Assymetric Key!")
 
-        signer.update(data)
-        return signer.finalize()
-
     def _verify_signature(self, pubkey, data, signature):
         cryptography_imports()
-        if isinstance(pubkey, DSAPublicKey):
-            verifier = pubkey.verifier(signature, hashes.SHA256())
-        elif isinstance(pubkey, RSAPublicKey):
-            verifier = pubkey.verifier(signature,
-                                       padding.PSS(padding.MGF1(hashes.SHA256()),
-                                                   padding.PSS.MAX_LENGTH),
-                                       hashes.SHA256())
-        elif isinstance(pubkey, EllipticCurvePublicKey):
-            verifier = pubkey.verifier(signature, ec.ECDSA(hashes.SHA256()))
-        else:
-            raise SecSocketException("Unsupported Assymetric Key!")
-
-        verifier.update(data)
         try:
-            verifier.verify()
+            if isinstance(pubkey, DSAPublicKey):
+                pubkey.verify(signature, data, hashes.SHA256())
+            elif isinstance(pubkey, RSAPublicKey):
+                pubkey.verify(signature, data,
+                              padding.PSS(padding.MGF1(hashes.SHA256()),
+                                          padding.PSS.MAX_LENGTH),
+                              hashes.SHA256())
+            elif isinstance(pubkey, EllipticCurvePublicKey):
+                pubkey.verify(signature, data, ec.ECDSA(hashes.SHA256()))
+            else:
+                raise SecSocketException("Unsupported Assymetric Key!")
         except cryptography.exceptions.InvalidSignature:
             return False
-        except:
-            return False
         return True
 
     def _cmp_pub_keys(self, first, second):
@@ -141,6 +141,21 @@ def sha256sum(file_path):
 
     return sha256.hexdigest()
 
+_sha256sum_cache = {}
+
+def cached_sha256sum(file_path):
+    """sha256sum() memoized per file, recomputed when its mtime or size change"""
+    stat = os.stat(file_path)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _sha256sum_cache.get(file_path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    digest = sha256sum(file_path)
+    _sha256sum_cache[file_path] = (key, digest)
+    return digest
+
 def create_tar_archive(input_path, target_path, compression=False):
     if compression:
         args = "cfj"
@@ -62,6 +62,13 @@ class CtlConfig(Config):
                 "name" : "allow_virtual"
                 }
 
+        self._options['environment']['strict_device_cache'] = {
+                "value" : False,
+                "additive" : False,
+                "action" : self.optionBool,
+                "name" : "strict_device_cache"
+                }
+
         self._options['pools'] = dict()
 
         self._options['security'] = dict()
@@ -10,6 +10,8 @@ olichtne@redhat.com (Ondrej Lichtner)
 
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Union
 import datetime
 import logging
@@ -26,6 +28,7 @@ from lnst.Controller.MachineMapper import MachineMapper
 from lnst.Controller.MachineMapper import format_match_description
 from lnst.Controller.Host import Hosts, Host
 from lnst.Controller.Recipe import BaseRecipe, RecipeRun
+from lnst.Controller.RecipeResults import MachinePrepareResult, ResultType
 from lnst.Controller.RecipeControl import RecipeControl
 
 class Controller(object):
@@ -167,9 +170,11 @@ class Controller(object):
                 for line in format_match_description(match).split('\n'):
                     logging.info(line)
                 try:
-                    self._map_match(match, req, recipe)
+                    prepare_results = self._map_match(match, req, recipe)
                     recipe._init_run(RecipeRun(recipe, match, log_dir=self._log_ctl.get_recipe_log_path(),
                                                log_list=self._log_ctl.get_recipe_log_list()))
+                    for result in prepare_results:
+                        recipe.current_run.add_result(result)
                     recipe.test()
                 except Exception as exc:
                     if recipe.current_run:
@@ -192,11 +197,15 @@ class Controller(object):
             machine = self._machines[m_id] = pool[m["target"]]
 
             setattr(self._hosts, m_id, Host(machine))
-            host = getattr(self._hosts, m_id)
 
             machine.set_id(m_id)
             machine.set_mapped(True)
-            self._prepare_machine(machine)
+
+        prepare_results = self._prepare_machines(list(self._machines.values()))
+
+        for m_id, m in list(match["machines"].items()):
+            machine = self._machines[m_id]
+            host = getattr(self._hosts, m_id)
 
             for if_id, i in list(m["interfaces"].items()):
                 host.map_device(if_id, i)
@@ -212,12 +221,52 @@ class Controller(object):
 
             machine.start_recipe(recipe)
 
+        return prepare_results
+
     def _prepare_machine(self, machine):
-        self._log_ctl.add_agent(machine.get_id())
-        machine.set_mac_pool(self._mac_pool)
-        machine.set_network_bridges(self._network_bridges)
+        return self._prepare_machines([machine])[0]
 
-        machine.prepare_machine()
+    def _prepare_machines(self, machines):
+        """Prepares all of the machines concurrently
+
+        Returns a MachinePrepareResult for each machine in the same order. If
+        the preparation of any machine fails, the exception of the first one
+        is re-raised annotated with the id of the machine.
+        """
+        for machine in machines:
+            self._log_ctl.add_agent(machine.get_id())
+            machine.set_mac_pool(self._mac_pool)
+            machine.set_network_bridges(self._network_bridges)
+
+        def prepare(machine):
+            start = time.time()
+            machine.prepare_machine()
+            return time.time() - start
+
+        with ThreadPoolExecutor(max_workers=max(len(machines), 1)) as executor:
+            futures = [(machine, executor.submit(prepare, machine))
+                       for machine in machines]
+
+        results = []
+        errors = []
+        for machine, future in futures:
+            exc = future.exception()
+            if exc is not None:
+                logging.error("Preparing host {} failed: {}".format(
+                    machine.get_id(), exc))
+                exc.add_note("while preparing host {}".format(machine.get_id()))
+                errors.append(exc)
+                continue
+
+            duration = future.result()
+            logging.debug("Host {} prepared in {:.2f} seconds".format(
+                machine.get_id(), duration))
+            results.append(MachinePrepareResult(ResultType.PASS,
+                                                machine.get_id(), duration))
+
+        if errors:
+            raise errors[0]
+        return results
 
     def _cleanup_agents(self):
         if self._machines == None:
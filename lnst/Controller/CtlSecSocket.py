@@ -17,14 +17,17 @@ import logging
 from lnst.Common.SecureSocket import SecureSocket
 from lnst.Common.SecureSocket import DH_GROUP, SRP_GROUP
 from lnst.Common.SecureSocket import SecSocketException
+from lnst.Common.SecureSocket import SUPPORTED_FRAMINGS
+from lnst.Common.SecureSocket import SUPPORTED_RECORD_PROTOCOLS
 from lnst.Common.Utils import not_imported
 
 ser = not_imported
 load_pem_private_key = not_imported
 load_pem_public_key = not_imported
 load_ssh_public_key = not_imported
+load_ssh_private_key = not_imported
 backend = not_imported
-cryptography_imported = not_imported
+cryptography_imported = False
 def cryptography_imports():
     global cryptography_imported
     if cryptography_imported:
@@ -34,6 +37,7 @@ def cryptography_imports():
     global load_pem_private_key
     global load_pem_public_key
     global load_ssh_public_key
+    global load_ssh_private_key
     global backend
 
     try:
@@ -41,6 +45,7 @@ def cryptography_imports():
         from cryptography.hazmat.primitives.serialization import load_pem_private_key
         from cryptography.hazmat.primitives.serialization import load_pem_public_key
         from cryptography.hazmat.primitives.serialization import load_ssh_public_key
+        from cryptography.hazmat.primitives.serialization import load_ssh_private_key
         from cryptography.hazmat.backends import default_backend
     except ImportError:
         raise SecSocketException("Library 'cryptography' missing "\
@@ -49,6 +54,13 @@ def cryptography_imports():
     backend = default_backend()
     cryptography_imported = True
 
+def load_private_key(data):
+    """loads PEM keys and the OpenSSH format newer ssh-keygen generates"""
+    try:
+        return load_pem_private_key(data, None, backend)
+    except ValueError:
+        return load_ssh_private_key(data, None, backend)
+
 class CtlSecSocket(SecureSocket):
     def __init__(self, soc):
         super(CtlSecSocket, self).__init__(soc)
@@ -58,7 +70,9 @@ class CtlSecSocket(SecureSocket):
         self._ctl_random = os.urandom(28)
 
         ctl_hello = {"type": "ctl_hello",
-                     "ctl_random": self._ctl_random}
+                     "ctl_random": self._ctl_random,
+                     "framing": SUPPORTED_FRAMINGS,
+                     "record_protocol": SUPPORTED_RECORD_PROTOCOLS}
         self.send_msg(ctl_hello)
         agent_hello = self.recv_msg()
 
@@ -66,6 +80,11 @@ class CtlSecSocket(SecureSocket):
             raise SecSocketException("Handshake failed.")
 
         self._agent_random = agent_hello["agent_random"]
+        # agents that don't know about the negotiation don't reply with the
+        # "framing" and "record_protocol" keys and keep using the originals
+        self._set_framing(self._select_framing([agent_hello.get("framing")]))
+        self._set_record_protocol(self._select_record_protocol(
+                                  [agent_hello.get("record_protocol")]))
 
         if sec_params["auth_type"] == "none":
             logging.warning("===================================")
@@ -89,14 +108,14 @@ class CtlSecSocket(SecureSocket):
             ctl_identity = sec_params["identity"]
             ctl_key_path = sec_params["privkey"]
             try:
-                with open(ctl_key_path, 'r') as f:
+                with open(ctl_key_path, 'rb') as f:
                     ctl_key = load_pem_private_key(f.read(), None, backend)
             except:
                 ctl_key = None
 
             srv_key_path = sec_params["pubkey_path"]
             try:
-                with open(srv_key_path, 'r') as f:
+                with open(srv_key_path, 'rb') as f:
                     srv_key = load_pem_public_key(f.read(), backend)
             except:
                 srv_key = None
@@ -116,7 +135,7 @@ class CtlSecSocket(SecureSocket):
         hashed_handshake_data.update(handshake_data)
 
         ctl_verify_data = self.PRF(self._master_secret,
-                                   "ctl finished",
+                                   b"ctl finished",
                                    hashed_handshake_data.digest(),
                                    12)
 
@@ -129,7 +148,7 @@ class CtlSecSocket(SecureSocket):
             raise SecSocketException("Handshake failed.")
 
         srv_verify_data = self.PRF(self._master_secret,
-                                   "server finished",
+                                   b"server finished",
                                    hashed_handshake_data.digest(),
                                    12)
 
@@ -157,18 +176,18 @@ class CtlSecSocket(SecureSocket):
 
         ZZ = pow(srv_pubkey, ctl_privkey, modp_group["p"])
         ZZ = "{1:0{0}x}".format(modp_group['p_size']*2, ZZ)
-        ZZ = self._master_secret.decode('hex')
+        ZZ = bytes.fromhex(ZZ)
 
         self._master_secret = self.PRF(ZZ,
-                                       "master secret",
+                                       b"master secret",
                                        self._ctl_random + self._agent_random,
                                        48)
 
-        handshake_data = ""
-        handshake_data += ("{1:0{0}x}".format(modp_group['p_size']*2,
-                                              ctl_pubkey)).decode('hex')
-        handshake_data += ("{1:0{0}x}".format(modp_group['p_size']*2,
-                                              srv_pubkey)).decode('hex')
+        handshake_data = b""
+        handshake_data += bytes.fromhex("{1:0{0}x}".format(
+                                        modp_group['p_size']*2, ctl_pubkey))
+        handshake_data += bytes.fromhex("{1:0{0}x}".format(
+                                        modp_group['p_size']*2, srv_pubkey))
 
         self._init_cipher_spec()
         self._send_change_cipher_spec()
@@ -179,9 +198,9 @@ class CtlSecSocket(SecureSocket):
         known_hosts = []
         ssh_dir_path = os.path.expanduser("~/.ssh")
         if os.path.isfile(ssh_dir_path+"/known_hosts"):
-            with open(ssh_dir_path+"/known_hosts", 'r') as f:
+            with open(ssh_dir_path+"/known_hosts", 'rb') as f:
                 for line in f.readlines():
-                    key = line[line.find(' ')+1:]
+                    key = line[line.find(b' ')+1:]
                     try:
                         known_hosts.append(load_ssh_public_key(key, backend))
                     except:
@@ -190,8 +209,8 @@ class CtlSecSocket(SecureSocket):
             logging.error("No known hosts loaded.")
 
         try:
-            with open(ssh_dir_path+"/id_rsa", 'r') as f:
-                ctl_ssh_key = load_pem_private_key(f.read(), None, backend)
+            with open(ssh_dir_path+"/id_rsa", 'rb') as f:
+                ctl_ssh_key = load_private_key(f.read())
         except:
             ctl_ssh_key = None
             logging.error("No controller ssh key loaded.")
@@ -232,15 +251,14 @@ class CtlSecSocket(SecureSocket):
 
         msg = {"type": "ssh_client_key_select",
                "index": i,
-               "signature": self._sign_data(str(i), ctl_ssh_key)}
+               "signature": self._sign_data(str(i).encode(), ctl_ssh_key)}
         self.send_msg(msg)
 
         self._pubkey_handshake("ssh", ctl_ssh_key, srv_ssh_pubkey)
 
     def _pubkey_handshake(self, ctl_identity, ctl_privkey, local_srv_pubkey):
         modp_group = DH_GROUP
-        ctl_dh_privkey = int(os.urandom(modp_group["q_size"]+1).encode('hex'),
-                             16)
+        ctl_dh_privkey = int(os.urandom(modp_group["q_size"]+1).hex(), 16)
         ctl_dh_privkey = ctl_dh_privkey % modp_group["q"]
         #public key
         ctl_dh_pubkey_int = pow(modp_group["g"],
@@ -248,7 +266,7 @@ class CtlSecSocket(SecureSocket):
                                 modp_group["p"])
         ctl_dh_pubkey = "{1:0{0}x}".format(modp_group['p_size']*2,
                                            ctl_dh_pubkey_int)
-        ctl_dh_pubkey = ctl_dh_pubkey.decode('hex')
+        ctl_dh_pubkey = bytes.fromhex(ctl_dh_pubkey)
 
         ctl_pubkey = ctl_privkey.public_key()
         ctl_pubkey_pem = ctl_pubkey.public_bytes(
@@ -282,14 +300,14 @@ class CtlSecSocket(SecureSocket):
                                       msg["signature"]):
             raise SecSocketException("Handshake failed.")
 
-        srv_dh_pubkey_int = int(srv_dh_pubkey.encode('hex'), 16)
+        srv_dh_pubkey_int = int(srv_dh_pubkey.hex(), 16)
 
         ZZ = pow(srv_dh_pubkey_int, ctl_dh_privkey, modp_group["p"])
         ZZ = "{1:0{0}x}".format(modp_group['p_size']*2, ZZ)
-        ZZ = self._master_secret.decode('hex')
+        ZZ = bytes.fromhex(ZZ)
 
         self._master_secret = self.PRF(ZZ,
-                                       "master secret",
+                                       b"master secret",
                                        self._ctl_random + self._agent_random,
                                        48)
 
@@ -299,11 +317,11 @@ class CtlSecSocket(SecureSocket):
     def _passwd_handshake(self, auth_passwd):
         srp_group = SRP_GROUP
         p_bytes = "{1:0{0}x}".format(srp_group['p_size']*2, srp_group['p'])
-        p_bytes = p_bytes.decode('hex')
+        p_bytes = bytes.fromhex(p_bytes)
         g_bytes = "{0:02x}".format(srp_group['g'])
-        g_bytes = g_bytes.decode('hex')
+        g_bytes = bytes.fromhex(g_bytes)
         k = hashlib.sha256(p_bytes + g_bytes).digest()
-        k = int(k.encode('hex'), 16)
+        k = int(k.hex(), 16)
 
         username = "lnst_user"
 
@@ -317,15 +335,16 @@ class CtlSecSocket(SecureSocket):
 
         salt = reply["salt"]
 
-        x = hashlib.sha256(salt + username + auth_passwd).digest()
-        x_int = int(x.encode('hex'), 16)
+        x = hashlib.sha256(salt + username.encode() +
+                           auth_passwd.encode()).digest()
+        x_int = int(x.hex(), 16)
 
         ctl_privkey = os.urandom(srp_group["q_size"]+1)
-        ctl_privkey_int = int(ctl_privkey.encode('hex'), 16) % srp_group["q"]
+        ctl_privkey_int = int(ctl_privkey.hex(), 16) % srp_group["q"]
 
         ctl_pubkey_int = pow(srp_group["g"], ctl_privkey_int, srp_group["p"])
         ctl_pubkey = "{1:0{0}x}".format(srp_group['p_size']*2, ctl_pubkey_int)
-        ctl_pubkey = ctl_pubkey.decode('hex')
+        ctl_pubkey = bytes.fromhex(ctl_pubkey)
 
         msg = {"type": "srp_client_pub",
                "ctl_pubkey": ctl_pubkey}
@@ -336,18 +355,18 @@ class CtlSecSocket(SecureSocket):
             raise SecSocketException("Handshake failed.")
 
         srv_pubkey = reply["srv_pubkey"]
-        srv_pubkey_int = int(srv_pubkey.encode('hex'), 16)
+        srv_pubkey_int = int(srv_pubkey.hex(), 16)
 
         if (srv_pubkey_int % srp_group["p"]) == 0:
             raise SecSocketException("Handshake failed.")
 
         u = hashlib.sha256(ctl_pubkey + srv_pubkey).digest()
-        u_int = int(u.encode('hex'), 16)
+        u_int = int(u.hex(), 16)
 
         S_int = srv_pubkey_int - k * pow(srp_group['g'], x_int, srp_group['p'])
         S_int = pow(S_int, ctl_privkey_int + u_int * x_int, srp_group['p'])
         S = "{1:0{0}x}".format(srp_group['p_size']*2, S_int)
-        S = S.decode('hex')
+        S = bytes.fromhex(S)
 
         m1 = hashlib.sha256(ctl_pubkey + srv_pubkey + S).digest()
         msg = {"type": "srp_client_m1",
@@ -365,7 +384,7 @@ class CtlSecSocket(SecureSocket):
 
         K = hashlib.sha256(S).digest()
         self._master_secret = self.PRF(K,
-                                       "master secret",
+                                       b"master secret",
                                        self._ctl_random + self._agent_random,
                                        48)
 
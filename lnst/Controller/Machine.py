@@ -11,11 +11,16 @@ __author__ = """
 rpazdera@redhat.com (Radek Pazdera)
 """
 
+import collections
+import hashlib
+import itertools
 import logging
 import socket
 import sys
-from lnst.Common.Utils import sha256sum
+from contextlib import contextmanager
+from lnst.Common.Utils import cached_sha256sum
 from lnst.Common.Utils import check_process_running
+from lnst.Common.Compression import compress, decompress
 from lnst.Common.Version import lnst_version
 from lnst.Controller.Common import ControllerError
 from lnst.Controller.CtlSecSocket import CtlSecSocket
@@ -30,12 +35,37 @@ from lnst.Devices.LoopbackDevice import LoopbackDevice
 if check_process_running("libvirtd"):
     from lnst.Controller.VirtDomainCtl import VirtDomainCtl
 
+# size of file transfer chunks and the default number of chunks in flight
+COPY_CHUNK_SIZE = 1024*1024
+COPY_WINDOW = 8
+
 class MachineError(ControllerError):
     pass
 
 class PrefixMissingError(ControllerError):
     pass
 
+class RpcBatch(object):
+    """Calls collected by Machine.rpc_batch
+
+    The results attribute contains the results of the calls that were
+    already sent to the agent, in the order the calls were made.
+    """
+    def __init__(self):
+        self.calls = []
+        self.results = []
+
+    def add(self, method_name, args, netns=None, recipe_result=None,
+            result_handler=None):
+        """Queues a call
+
+        The result of a call with a result_handler is passed to it instead
+        of being added to results.
+        """
+        self.calls.append((netns, method_name, args, recipe_result,
+                           result_handler))
+
+
 class Machine(object):
     """ Agent machine abstraction
 
@@ -88,6 +118,12 @@ class Machine(object):
         self._netns_moved_devices = {}
 
         self._initns = None
+        self._rpc_batch = None
+
+        self.device_cache_strict = ctl_config.get_option("environment",
+                                                         "strict_device_cache")
+        self._device_cache_stats = {"hits": 0, "misses": 0, "uncached": 0,
+                                    "updates": 0, "invalidations": 0}
 
     def set_id(self, new_id):
         self._id = new_id
@@ -128,6 +164,24 @@ class Machine(object):
         dev.ifindex = ret["ifindex"]
         self._add_device_to_database(ret["ifindex"], dev, netns)
 
+    def remote_devices_create(self, devs, netns=None):
+        for dev in devs:
+            self._add_recipe_result(
+                DeviceCreateResult(
+                    result=ResultType.PASS,
+                    device=dev,
+                )
+            )
+
+        ret = self.rpc_call("create_devices",
+                            [(dev._dev_cls.__name__, dev._dev_args,
+                              dev._dev_kwargs) for dev in devs],
+                            netns=netns)
+        for dev, dev_ret in zip(devs, ret):
+            dev._machine = self
+            dev.ifindex = dev_ret["ifindex"]
+            self._add_device_to_database(dev_ret["ifindex"], dev, netns)
+
     def remote_device_set_netns(self, dev, dst, src):
         dev_id = f"{dev.host.hostid}{dev.netns.name if dev.netns.name else ''}.{dev._id}"
         logging.info(f"Moving {dev_id} to namespace {dst.name}")
@@ -159,6 +213,7 @@ class Machine(object):
                 args=dev_args,
                 kwargs=dev_kwargs,
                 netns=dst)
+        self.invalidate_device_cache(dev)
 
     def _add_device_to_netns_moved_devices(self, dev, dst, src):
         del self._device_database[src][dev.ifindex]
@@ -179,6 +234,12 @@ class Machine(object):
             kwargs=kwargs,
         )
 
+        if self._rpc_batch is not None:
+            self._add_recipe_result(config_res)
+            self._rpc_batch.add("dev_method", (index, method_name, args, kwargs),
+                                netns, recipe_result=config_res)
+            return None
+
         try:
             res = self.rpc_call("dev_method", index, method_name, args, kwargs,
                                 netns=netns)
@@ -190,15 +251,33 @@ class Machine(object):
         return res
 
     def remote_device_setattr(self, index, attr_name, value, netns):
+        device = self._get_device_from_database(index, netns)
+        if self._rpc_batch is not None:
+            config_res = DeviceAttrSetResult(
+                result=ResultType.PASS,
+                device=device,
+                attr_name=attr_name,
+                value=value,
+                old_value=None,
+            )
+            self._add_recipe_result(config_res)
+
+            # reading the old value here would flush the batch, it's read by
+            # the multicall right before the value is set
+            def set_old_value(old_value):
+                config_res.old_value = old_value
+            self._rpc_batch.add("dev_getattr", (index, attr_name), netns,
+                                result_handler=set_old_value)
+            self._rpc_batch.add("dev_setattr", (index, attr_name, value),
+                                netns, recipe_result=config_res)
+            return None
+
         config_res = DeviceAttrSetResult(
             result=ResultType.PASS,
-            device=self._get_device_from_database(index, netns),
+            device=device,
             attr_name=attr_name,
             value=value,
-            old_value=getattr(
-                self._get_device_from_database(index, netns),
-                attr_name
-            ),
+            old_value=getattr(device, attr_name),
         )
         self._add_recipe_result(config_res)
 
@@ -210,7 +289,65 @@ class Machine(object):
         return res
 
     def remote_device_getattr(self, index, attr_name, netns):
-        return self.rpc_call("dev_getattr", index, attr_name, netns=netns)
+        dev = self._device_database.get(netns, {}).get(index)
+        if (dev is None or self.device_cache_strict or
+                attr_name not in dev._dev_cls._pushed_attrs):
+            self._device_cache_stats["uncached"] += 1
+            return self.rpc_call("dev_getattr", index, attr_name, netns=netns)
+
+        # calls waiting in a batch may change the value, the rpc sends them
+        pending_calls = self._rpc_batch is not None and self._rpc_batch.calls
+        if attr_name in dev._attr_cache and not pending_calls:
+            self._device_cache_stats["hits"] += 1
+            value = dev._attr_cache[attr_name]
+            # e.g. ips, the caller may modify the list
+            return list(value) if isinstance(value, list) else value
+
+        self._device_cache_stats["misses"] += 1
+        value = self.rpc_call("dev_getattr", index, attr_name, netns=netns)
+        dev._attr_cache[attr_name] = value
+        return value
+
+    def remote_device_snapshot(self, index, names, netns):
+        return self.rpc_call("dev_snapshot", index, names, netns=netns)
+
+    def device_updated(self, ifindex, attrs, netns=None):
+        ns_instance = self._get_netns_by_name(netns)
+        dev = self._device_database[ns_instance].get(ifindex)
+        if dev is None:
+            return
+
+        dev._attr_cache.update(attrs)
+        self._device_cache_stats["updates"] += 1
+
+    def invalidate_device_cache(self, dev=None):
+        """Drops the cached attributes of dev or of all devices
+
+        Device method calls and attribute changes don't need this, their
+        effects on any device reach the cache as dev_updated messages which
+        the agent sends before the result of the call. The cache of a device
+        moved to another namespace is dropped, it's refilled by the agent of
+        that namespace.
+        """
+        if dev is not None:
+            dev._attr_cache = {}
+        else:
+            for devices in self._device_database.values():
+                for dev in devices.values():
+                    dev._attr_cache = {}
+        self._device_cache_stats["invalidations"] += 1
+
+    def get_device_cache_stats(self):
+        """Returns the counters of the device attribute cache
+
+        hits and misses count reads of attributes pushed by the agent,
+        uncached counts the reads of other attributes (or all of them in
+        strict mode) that always use an RPC call.
+        """
+        stats = dict(self._device_cache_stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
 
     def device_created(self, dev_data, netns=None):
         ns_instance = self._get_netns_by_name(netns)
@@ -320,6 +457,79 @@ class Machine(object):
         return None
 
     def rpc_call(self, method_name, *args, **kwargs):
+        self._flush_rpc_batch()
+        msg = self._rpc_message(method_name, args, kwargs)
+        return self._msg_dispatcher.send_message(self, msg)
+
+    def rpc_call_async(self, method_name, *args, **kwargs):
+        """Sends the command without waiting for the agent to finish it
+
+        Returns an RpcFuture, calling its result() method returns the result
+        of the command (or raises its exception) the same way rpc_call would.
+        Commands sent to different machines or network namespaces are
+        processed by the agents concurrently.
+        """
+        self._flush_rpc_batch()
+        msg = self._rpc_message(method_name, args, kwargs)
+        return self._msg_dispatcher.send_message_async(self, msg)
+
+    @contextmanager
+    def rpc_batch(self):
+        """Collects device method calls and attribute changes
+
+        Inside of the with block the calls are queued instead of being sent
+        to the agent one by one. They're sent in "multicall" messages when
+        the block ends, or before any other RPC call so that the order of
+        the calls is kept. Yields the RpcBatch object which contains the
+        results of the calls once they were sent. The first failed call
+        raises its exception and the calls following it are dropped.
+        """
+        if self._rpc_batch is not None:
+            # nested blocks are part of the outer batch
+            yield self._rpc_batch
+            return
+
+        batch = RpcBatch()
+        self._rpc_batch = batch
+        try:
+            yield batch
+        finally:
+            try:
+                self._flush_rpc_batch()
+            finally:
+                self._rpc_batch = None
+
+    def _flush_rpc_batch(self):
+        batch = self._rpc_batch
+        if batch is None or not batch.calls:
+            return
+
+        calls = batch.calls
+        batch.calls = []
+        self._rpc_batch = None
+        try:
+            # one multicall per namespace, a namespace has its own agent
+            for netns, group in itertools.groupby(calls, key=lambda c: c[0]):
+                group = list(group)
+                results = self.rpc_call("multicall",
+                                        [(method_name, args, {})
+                                         for _, method_name, args, _, _ in group],
+                                        stop_on_error=True, netns=netns)
+
+                for call, res in zip(group, results):
+                    _, _, _, recipe_result, result_handler = call
+                    if "exception" in res:
+                        if recipe_result is not None:
+                            recipe_result.result = ResultType.FAIL
+                        raise res["exception"]
+                    if result_handler is not None:
+                        result_handler(res["result"])
+                    else:
+                        batch.results.append(res["result"])
+        finally:
+            self._rpc_batch = batch
+
+    def _rpc_message(self, method_name, args, kwargs):
         if kwargs.get("netns") in self._namespaces.values():
             netns = kwargs["netns"]
             del kwargs["netns"]
@@ -336,8 +546,7 @@ class Machine(object):
                    "method_name": method_name,
                    "args": args,
                    "kwargs": kwargs}
-
-        return self._msg_dispatcher.send_message(self, msg)
+        return msg
 
     def init_connection(self, timeout=None):
         """ Initialize the agent connection
@@ -350,8 +559,9 @@ class Machine(object):
         m_id = self._id
 
         logging.info("Connecting to RPC on machine %s (%s)", m_id, hostname)
-        connection = CtlSecSocket(socket.create_connection((hostname, port),
-                                                           timeout))
+        sock = socket.create_connection((hostname, port), timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = CtlSecSocket(sock)
         connection.handshake(self._security)
 
         self._msg_dispatcher.add_agent(self, connection)
@@ -403,31 +613,60 @@ class Machine(object):
             self._recipe.current_run.add_result(result)
 
     def _send_device_classes(self):
-        for cls_name, cls in device_classes:
-            self.send_class(cls)
-
-        for cls_name, cls in device_classes:
-            module_name = cls.__module__
-            self.rpc_call("map_device_class", cls_name, module_name)
+        self.send_classes([cls for cls_name, cls in device_classes],
+                          map_device_classes=True)
 
     def send_class(self, cls, netns=None):
-        classes = [cls]
-        classes.extend(self._get_base_classes(cls))
+        self.send_classes([cls], netns=netns)
 
-        for cls in reversed(classes):
-            module_name = cls.__module__
+    def send_classes(self, classes, netns=None, map_device_classes=False):
+        """Makes the classes available on the agent
 
-            if module_name == "builtins":
-                continue
+        The modules defining the classes and all of their base classes are
+        synced in bulk: one call sends the manifest of module digests and
+        returns the modules missing from the agent cache, a second call
+        transfers the missing modules, loads all of them and optionally maps
+        the classes as device classes.
+        """
+        modules = {}
+        for cls in classes:
+            for base in reversed(self._get_base_classes(cls)):
+                module_name = base.__module__
+
+                if module_name == "builtins" or module_name in modules:
+                    continue
+
+                filename = sys.modules[module_name].__file__
+
+                if filename[-3:] == "pyc":
+                    filename = filename[:-1]
 
-            module = sys.modules[module_name]
-            filename = module.__file__
+                modules[module_name] = filename
 
-            if filename[-3:] == "pyc":
-                filename = filename[:-1]
+        manifest = {module_name: cached_sha256sum(filename)
+                    for module_name, filename in modules.items()}
 
-            res_hash = self.sync_resource(module_name, filename, netns=netns)
-            self.rpc_call("load_cached_module", module_name, res_hash, netns=netns)
+        missing = self.rpc_call("missing_resources", manifest, netns=netns)
+
+        resources = {}
+        for module_name in missing:
+            msg = "Transfering %s to machine %s as '%s'" % (modules[module_name],
+                                                            self.get_id(),
+                                                            module_name)
+            logging.debug(msg)
+
+            with open(modules[module_name], "rb") as f:
+                resources[module_name] = f.read()
+
+        if map_device_classes:
+            class_names = [(cls.__name__, cls.__module__) for cls in classes]
+        else:
+            class_names = []
+
+        self.rpc_call("load_cached_modules",
+                      [(module_name, manifest[module_name])
+                       for module_name in modules],
+                      class_names, resources, netns=netns)
 
     def is_git_version(self, version):
         try:
@@ -460,8 +699,19 @@ class Machine(object):
         dev.enable_readonly_cache()
 
     def _set_readonly_cache_for_all_devices(self, netns):
-        for dev in self._device_database[netns].values():
-            dev.enable_readonly_cache()
+        devices = {ifindex: dev
+                   for ifindex, dev in self._device_database[netns].items()
+                   if not dev._cached}
+        if not devices:
+            return
+
+        snapshots = self.rpc_call(
+            "dev_snapshot_all",
+            {ifindex: dev._snapshot_attr_names()
+             for ifindex, dev in devices.items()},
+            netns=netns)
+        for ifindex, dev in devices.items():
+            dev.enable_readonly_cache(snapshots.get(ifindex, {}))
 
     def cleanup(self):
         """ Clean the machine up
@@ -630,42 +880,93 @@ class Machine(object):
         for netns in namespaces:
             self.rpc_call("stop_packet_capture", netns=netns)
 
-    def copy_file_to_machine(self, local_path, remote_path=None, netns=None):
-        remote_path = self.rpc_call("start_copy_to", remote_path, netns=netns)
-
-        f = open(local_path, "rb")
-
-        while True:
-            data: bytes = f.read(1024*1024) # 1MB buffer
-            if not data:
-                break
+    def copy_file_to_machine(self, local_path, remote_path=None, netns=None,
+                             window=COPY_WINDOW, compression=None):
+        """Copies a local file to the agent
 
-            self.rpc_call("copy_part_to", remote_path, data, netns=netns)
+        Up to `window` chunks are in flight at the same time, `compression`
+        optionally selects one of lnst.Common.Compression.COMPRESSION_METHODS
+        to compress the chunks with. The sha256 digest of the file is verified
+        after the transfer.
+        """
+        remote_path = self.rpc_call("start_copy_to", remote_path, netns=netns)
 
-        self.rpc_call("finish_copy_to", remote_path, netns=netns)
+        sha256 = hashlib.sha256()
+        in_flight = collections.deque()
+        offset = 0
+        with open(local_path, "rb") as f:
+            while True:
+                data: bytes = f.read(COPY_CHUNK_SIZE)
+                if not data:
+                    break
+                sha256.update(data)
+
+                in_flight.append(self.rpc_call_async("copy_part_to", remote_path,
+                                                     compress(data, compression),
+                                                     offset=offset,
+                                                     compression=compression,
+                                                     netns=netns))
+                offset += len(data)
+
+                if len(in_flight) >= window:
+                    in_flight.popleft().result()
+
+        while in_flight:
+            in_flight.popleft().result()
+
+        remote_digest = self.rpc_call("finish_copy_to", remote_path, netns=netns)
+        if remote_digest != sha256.hexdigest():
+            raise MachineError("Checksum mismatch after copying {} to {} on "
+                               "machine {}".format(local_path, remote_path,
+                                                   self.get_id()))
 
         return remote_path
 
-    def copy_file_from_machine(self, remote_path, local_path):
-        status = self.rpc_call("start_copy_from", remote_path)
+    def copy_file_from_machine(self, remote_path, local_path, netns=None,
+                               window=COPY_WINDOW, compression=None):
+        """Copies a file from the agent to a local path
+
+        Uses the same windowing, compression and checksum verification as
+        copy_file_to_machine.
+        """
+        status = self.rpc_call("start_copy_from", remote_path, netns=netns)
         if not status:
             raise MachineError("The requested file cannot be transfered." \
                        "It does not exist on machine %s" % self.get_id())
 
-        local_file = open(local_path, "wb")
-
-        buf_size = 1024*1024 # 1MB buffer
-        while True:
-            data: bytes = self.rpc_call("copy_part_from", remote_path, buf_size)
-            if not data:
-                break
-            local_file.write(data)
-
-        local_file.close()
-        self.rpc_call("finish_copy_from", remote_path)
+        sha256 = hashlib.sha256()
+        in_flight = collections.deque()
+        offset = 0
+        eof = False
+        with open(local_path, "wb") as local_file:
+            while not eof or in_flight:
+                while not eof and len(in_flight) < window:
+                    in_flight.append(self.rpc_call_async("copy_part_from",
+                                                         remote_path,
+                                                         COPY_CHUNK_SIZE,
+                                                         offset=offset,
+                                                         compression=compression,
+                                                         netns=netns))
+                    offset += COPY_CHUNK_SIZE
+
+                data: bytes = decompress(in_flight.popleft().result(),
+                                         compression)
+                if len(data) < COPY_CHUNK_SIZE:
+                    # the chunks requested past the end of file are empty
+                    eof = True
+                local_file.write(data)
+                sha256.update(data)
+
+        remote_digest = self.rpc_call("finish_copy_from", remote_path,
+                                      netns=netns)
+        if remote_digest != sha256.hexdigest():
+            raise MachineError("Checksum mismatch after copying {} from "
+                               "machine {} to {}".format(remote_path,
+                                                         self.get_id(),
+                                                         local_path))
 
     def sync_resource(self, res_name, file_path, netns=None):
-        digest = sha256sum(file_path)
+        digest = cached_sha256sum(file_path)
 
         if not self.rpc_call("has_resource", digest, netns=netns):
             msg = "Transfering %s to machine %s as '%s'" % (file_path,
@@ -692,7 +993,8 @@ class Machine(object):
     def add_netns(self, netns):
         self._namespaces[netns.name] = netns
         self._device_database[netns] = {}
-        return self.rpc_call("add_namespace", netns.name)
+        return self.rpc_call("add_namespace", netns.name,
+                             backend=netns.backend)
 
     def del_netns(self, netns):
         return self.rpc_call("del_namespace", netns.name)
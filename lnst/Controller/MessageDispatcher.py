@@ -2,8 +2,9 @@
 Defines the MessageDispatcher class used by the Controller to multiplex
 communication from all the connected Agent machines.
 
-In addition to that it defines functions used by the MessageDispatcher to
-transparently translate Device objects while communicating with the Agent.
+Device objects in the messages are transparently translated to device
+references and back while the messages are (de)serialized, see
+lnst.Common.DeviceRef.
 
 Copyright 2017 Red Hat, Inc.
 Licensed under the GNU General Public License, version 2 as
@@ -14,74 +15,16 @@ __author__ = """
 olichtne@redhat.com (Ondrej Lichtner)
 """
 
+import time
 import logging
-import copy
-import signal
+import itertools
+import threading
+import functools
 from lnst.Common.ConnectionHandler import send_data
 from lnst.Common.ConnectionHandler import ConnectionHandler
-from lnst.Common.Parameters import Parameters
-from lnst.Common.DeviceRef import DeviceRef
+from lnst.Common.DeviceRef import device_refs_dumps, device_refs_loads
 from lnst.Controller.Common import ControllerError
 from lnst.Devices.RemoteDevice import RemoteDevice
-from lnst.Tests.BaseTestModule import BaseTestModule
-
-def deviceref_to_remote_device(machine, obj, netns):
-    if isinstance(obj, DeviceRef):
-        dev = machine.dev_db_get_ifindex(obj.ifindex, netns)
-        return dev
-    elif isinstance(obj, dict):
-        new_dict = {}
-        for key, value in list(obj.items()):
-            new_dict[key] = deviceref_to_remote_device(machine,
-                                                       value,
-                                                       netns)
-        return new_dict
-    elif isinstance(obj, list):
-        new_list = []
-        for value in obj:
-            new_list.append(deviceref_to_remote_device(machine,
-                                                       value,
-                                                       netns))
-        return new_list
-    elif isinstance(obj, tuple):
-        new_list = []
-        for value in obj:
-            new_list.append(deviceref_to_remote_device(machine,
-                                                       value,
-                                                       netns))
-        return tuple(new_list)
-    else:
-        return obj
-
-def remote_device_to_deviceref(obj):
-    if isinstance(obj, RemoteDevice):
-        return DeviceRef(obj.ifindex)
-    elif isinstance(obj, dict):
-        new_dict = {}
-        for key, value in list(obj.items()):
-            new_dict[key] = remote_device_to_deviceref(value)
-        return new_dict
-    elif isinstance(obj, list):
-        new_list = []
-        for value in obj:
-            new_list.append(remote_device_to_deviceref(value))
-        return new_list
-    elif isinstance(obj, tuple):
-        new_list = []
-        for value in obj:
-            new_list.append(remote_device_to_deviceref(value))
-        return tuple(new_list)
-    elif isinstance(obj, Parameters):
-        for param_name, param in obj:
-            setattr(obj, param_name, remote_device_to_deviceref(param))
-        return obj
-    elif isinstance(obj, BaseTestModule):
-        new_test = copy.deepcopy(obj)
-        new_test.params = remote_device_to_deviceref(new_test.params)
-        new_test._orig_kwargs = remote_device_to_deviceref(new_test._orig_kwargs)
-        return new_test
-    else:
-        return obj
 
 class ConnectionError(ControllerError):
     pass
@@ -89,116 +32,226 @@ class ConnectionError(ControllerError):
 class WaitTimeoutError(ControllerError):
     pass
 
-def _timeout_handler(signum, frame):
-    msg = "Timeout expired"
-    raise WaitTimeoutError(msg)
+class RpcFuture(object):
+    """Handle of a command sent to an agent whose result hasn't been received
+
+    Returned by MessageDispatcher.send_message_async. The result is filled in
+    by the MessageDispatcher when the agent replies with a result (or
+    exception) message carrying the same request id, calling result() keeps
+    processing incoming messages until that happens.
+    """
+    def __init__(self, msg_dispatcher, machine, request_id, netns=None):
+        self._msg_dispatcher = msg_dispatcher
+        self._machine = machine
+        self._request_id = request_id
+        self._netns = netns
+
+        self._done = False
+        self._result = None
+        self._exception = None
+
+    @property
+    def machine(self):
+        return self._machine
+
+    @property
+    def request_id(self):
+        return self._request_id
+
+    @property
+    def netns(self):
+        return self._netns
+
+    def done(self):
+        return self._done
+
+    def set_result(self, result):
+        self._result = result
+        self._done = True
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done = True
+
+    def result(self):
+        if not self._done:
+            self._msg_dispatcher.wait_for_futures([self])
+
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        if not self._done:
+            self._msg_dispatcher.wait_for_futures([self])
+        return self._exception
 
 class MessageDispatcher(ConnectionHandler):
     def __init__(self, log_ctl):
         super(MessageDispatcher, self).__init__()
         self._log_ctl = log_ctl
         self._machines = dict()
+        self._request_ids = itertools.count()
+        self._pending_requests = {}
+        self._pending_lock = threading.Lock()
+
+        # futures can be waited on from multiple threads, e.g. when
+        # preparing machines concurrently, only one of them reads and
+        # processes incoming messages at a time and wakes up the others
+        self._send_lock = threading.Lock()
+        self._receive_cond = threading.Condition()
+        self._receiving = False
 
     def add_agent(self, machine, connection):
         self._machines[machine] = machine
         self.add_connection(machine, connection)
 
     def send_message(self, machine, data):
-        soc = self.get_connection(machine)
-        data = remote_device_to_deviceref(data)
+        return self.send_message_async(machine, data).result()
 
-        if send_data(soc, data) == False:
-            msg = "Connection error from agent %s" % machine.get_id()
-            raise ConnectionError(msg)
+    def send_message_async(self, machine, data):
+        soc = self.get_connection(machine)
+        dumps = functools.partial(device_refs_dumps,
+                                  device_classes=(RemoteDevice,),
+                                  netns=data.get("netns", None))
+
+        with self._send_lock:
+            request_id = next(self._request_ids)
+            if data["type"] == "to_netns":
+                data["data"]["request_id"] = request_id
+            else:
+                data["request_id"] = request_id
+
+            future = RpcFuture(self, machine, request_id, data.get("netns", None))
+            with self._pending_lock:
+                self._pending_requests[request_id] = future
+
+            if send_data(soc, data, dumps) == False:
+                with self._pending_lock:
+                    self._pending_requests.pop(request_id, None)
+                msg = "Connection error from agent %s" % machine.get_id()
+                raise ConnectionError(msg)
+
+        return future
+
+    def wait_for_futures(self, futures):
+        """Processes incoming messages until all of the futures are done"""
+        def done():
+            return all(future.done() for future in futures)
+
+        while not done():
+            self._receive_messages(done)
+
+    def _receive_messages(self, done, timeout=None):
+        """Processes one batch of incoming messages
+
+        Only one thread reads and processes the incoming messages at a time,
+        the others wait until it's finished with its batch and then re-check
+        their done() condition, so this returns after at most timeout seconds
+        either way.
+        """
+        with self._receive_cond:
+            if done():
+                return
+            if self._receiving:
+                self._receive_cond.wait(timeout)
+                return
+            self._receiving = True
 
-        result = None
-        while True:
+        try:
             connected_agents = list(self._connection_mapping.keys())
 
-            messages = self.check_connections()
+            messages = self.check_connections(timeout)
             for msg in messages:
-                if msg[1]["type"] == "result" and msg[0] == machine:
-                    if result is not None:
-                        msg = ("Multiple result messages from the same agent "
-                               "'{}'".format(machine.get_id()))
-                        raise ConnectionError(msg)
-                    result = msg[1]
-                else:
-                    self._process_message(msg)
+                self._process_message(msg)
 
             remaining_agents = list(self._connection_mapping.keys())
             if connected_agents != remaining_agents:
                 self._handle_disconnects(set(connected_agents)-
                                          set(remaining_agents))
-
-            if result is not None:
-                netns = data.get("netns", None)
-                return deviceref_to_remote_device(machine, result["result"], netns)
-
-    def wait_for_condition(self, condition_check, timeout=0):
-        res = True
-        prev_handler = signal.signal(signal.SIGALRM, _timeout_handler)
-
-        def condition_wrapper():
-            res = condition_check()
-            if res:
-                signal.alarm(0)
-                signal.signal(signal.SIGALRM, prev_handler)
-                logging.debug("Condition passed, disabling timeout alarm")
-            return res
-
-        try:
-            signal.alarm(timeout)
-
-            wait = True
-            while wait:
-                connected_agents = list(self._connection_mapping.keys())
-                messages = self.check_connections(timeout=1)
-                for msg in messages:
-                    try:
-                        self._process_message(msg)
-                        wait = wait and not condition_wrapper()
-                    except WaitTimeoutError as exc:
-                        logging.error("Waiting for condition timed out!")
-                        res = False
-                        wait = False
-
-                wait = wait and not condition_wrapper()
-
-                remaining_agents = list(self._connection_mapping.keys())
-                if connected_agents != remaining_agents:
-                    self._handle_disconnects(set(connected_agents)-
-                                             set(remaining_agents))
-        except WaitTimeoutError as exc:
-            logging.error("Waiting for condition timed out!")
-            res = False
         finally:
-            signal.alarm(0)
-            signal.signal(signal.SIGALRM, prev_handler)
+            with self._receive_cond:
+                self._receiving = False
+                self._receive_cond.notify_all()
+
+    def _pop_pending_request(self, machine, message):
+        request_id = message.get("request_id", None)
+        with self._pending_lock:
+            if request_id is None:
+                # agents that don't echo request ids process commands in
+                # order
+                request_id = self._oldest_pending_request(machine)
+                if request_id is None:
+                    return None
+
+            future = self._pending_requests.pop(request_id, None)
+            if future is not None and future.machine != machine:
+                self._pending_requests[request_id] = future
+                return None
+            return future
+
+    def _pop_oldest_pending_request(self, machine):
+        with self._pending_lock:
+            request_id = self._oldest_pending_request(machine)
+            if request_id is None:
+                return None
+            return self._pending_requests.pop(request_id)
+
+    def _oldest_pending_request(self, machine):
+        pending = [future.request_id
+                   for future in self._pending_requests.values()
+                   if future.machine == machine]
+        return min(pending, default=None)
 
-        return res
+    def wait_for_condition(self, condition_check, timeout=0):
+        """Processes incoming messages until condition_check() is true
+
+        Returns False if that doesn't happen in timeout seconds, 0 means no
+        timeout. Can be called from any thread.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+
+        # the messages satisfying the condition may have already been
+        # processed while waiting for a previous rpc call result
+        while not condition_check():
+            wait = 1
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    logging.error("Waiting for condition timed out!")
+                    return False
+            self._receive_messages(condition_check, wait)
+        logging.debug("Condition passed")
+        return True
 
     def handle_messages(self):
-        connected_agents = list(self._connection_mapping.keys())
-
-        messages = self.check_connections()
-
-        for msg in messages:
-            self._process_message(msg)
-
-        remaining_agents = list(self._connection_mapping.keys())
-        if connected_agents != remaining_agents:
-            self._handle_disconnects(set(connected_agents)-
-                                     set(remaining_agents))
+        self._receive_messages(lambda: False)
         return True
 
+    def _loads(self, data):
+        # deserialized in _process_message, the device references can only
+        # be translated after the preceding messages (e.g. dev_created) were
+        # processed
+        return data
+
     def _process_message(self, message):
+        machine = message[0]
+        message = (machine, device_refs_loads(message[1],
+                                              machine.dev_db_get_ifindex))
         if message[1]["type"] == "log":
             record = message[1]["record"]
             self._log_ctl.add_client_log(message[0].get_id(), record)
+        elif message[1]["type"] == "log_batch":
+            self._log_ctl.add_client_log(message[0].get_id(),
+                                         message[1]["records"])
         elif message[1]["type"] == "result":
-            msg = "Received result message from different agent %s" % message[0].get_id()
-            logging.debug(msg)
+            future = self._pop_pending_request(message[0], message[1])
+            if future is None:
+                msg = "Received unexpected result message from agent %s" % message[0].get_id()
+                logging.debug(msg)
+                return
+
+            future.set_result(message[1]["result"])
         elif message[1]["type"] == "dev_created":
             machine = self._machines[message[0]]
             try:
@@ -213,6 +266,11 @@ class MessageDispatcher(ConnectionHandler):
             except KeyError:
                 netns = None
             machine.device_delete(message[1], netns)
+        elif message[1]["type"] == "dev_updated":
+            machine = self._machines[message[0]]
+            netns = message[1].get("netns", None)
+            machine.device_updated(message[1]["ifindex"], message[1]["attrs"],
+                                   netns)
         elif message[1]["type"] == "dev_netns_changed":
             machine = self._machines[message[0]]
             try:
@@ -221,7 +279,19 @@ class MessageDispatcher(ConnectionHandler):
                 netns = None
             machine.device_netns_change(message[1], netns)
         elif message[1]["type"] == "exception":
-            raise message[1]["Exception"]
+            future = self._pop_pending_request(message[0], message[1])
+            if future is None:
+                # errors that can't be matched to a request (e.g. their
+                # request id is unknown) fail the oldest request of the
+                # same agent instead of the thread that happens to be
+                # receiving
+                future = self._pop_oldest_pending_request(message[0])
+
+            if future is None:
+                logging.error("Received unexpected exception from agent %s"
+                              % message[0].get_id())
+                raise message[1]["Exception"]
+            future.set_exception(message[1]["Exception"])
         elif message[1]["type"] == "job_finished":
             machine = self._machines[message[0]]
             machine.job_finished(message[1])
@@ -242,9 +312,30 @@ class MessageDispatcher(ConnectionHandler):
                                   for x in disconnected_agents]
             msg = "Agents " + str(list(disconnected_names)) + \
                   " hard-disconnected from the controller."
+            # only the receiving thread gets the exception, the threads
+            # waiting for the results of these agents are woken up by
+            # failing their requests
+            for agent in disconnected_agents:
+                self._fail_pending_requests(agent, ConnectionError(
+                    "Agent {} hard-disconnected from the controller.".format(
+                        agent.get_id())))
             raise ConnectionError(msg)
 
     def disconnect_agent(self, machine):
         soc = self.get_connection(machine)
         self.remove_connection(soc)
         del self._machines[machine]
+
+        self._fail_pending_requests(machine, ConnectionError(
+            "Agent {} disconnected".format(machine.get_id())))
+
+    def _fail_pending_requests(self, machine, exception):
+        with self._pending_lock:
+            disconnected = [future
+                            for future in self._pending_requests.values()
+                            if future.machine == machine]
+            for future in disconnected:
+                del self._pending_requests[future.request_id]
+
+        for future in disconnected:
+            future.set_exception(exception)
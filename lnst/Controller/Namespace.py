@@ -89,12 +89,20 @@ class Namespace(object):
     def copy_file_to_machine(
         self,
         local_path: str,
-        remote_path: Optional[str] = None
+        remote_path: Optional[str] = None,
+        compression: Optional[str] = None,
     ) -> str:
-        return self._machine.copy_file_to_machine(local_path, remote_path, self)
+        return self._machine.copy_file_to_machine(local_path, remote_path, self,
+                                                  compression=compression)
 
-    def copy_file_from_machine(self, remote_path: str, local_path: str):
-        self._machine.copy_file_from_machine(remote_path, local_path)
+    def copy_file_from_machine(
+        self,
+        remote_path: str,
+        local_path: str,
+        compression: Optional[str] = None,
+    ):
+        self._machine.copy_file_from_machine(remote_path, local_path, self,
+                                             compression=compression)
 
     def prepare_job(self, what, fail=False, json=False, desc=None,
                     job_level=ResultLevel.DEBUG):
@@ -130,6 +138,59 @@ class Namespace(object):
         job.start(bg, timeout)
         return job
     
+    def batch(self):
+        """Sends device configuration calls to the agent in bulk
+
+        To be used as a context manager:
+            with m1.batch():
+                for addr in addresses:
+                    m1.eth0.ip_add(addr)
+
+        Device method calls and device attribute assignments done inside of
+        the with block are collected and executed by the agent in one
+        message when the block ends. Their return value is None, the object
+        returned by the context manager has a 'results' list with the real
+        results once they were sent. Any other call to the agent, e.g.
+        reading a device attribute or running a Job, sends the collected
+        calls first so the order of operations doesn't change.
+
+        The batch covers all namespaces of the machine.
+        """
+        return self._machine.rpc_batch()
+
+    def create_devices(self, **devices):
+        """Creates several new devices with a single call to the agent
+
+        Equivalent to assigning each of the devices to the Namespace, e.g.:
+            m1.create_devices(**{
+                "vlan{}".format(i): VlanDevice(realdev=m1.eth0, vlan_id=i)
+                for i in range(1, 501)})
+
+        The agent allocates all names at once and creates the links with
+        one netlink batch, so this is much faster for large numbers of
+        devices. The devices can't refer to each other, e.g. a vlan can't
+        be created on top of a veth created in the same call. Virtual and
+        loopback devices are not supported.
+        """
+        for name, value in devices.items():
+            if not isinstance(value, RemoteDevice) or value.ifindex is not None:
+                raise HostError("'%s' is not a new device." % name)
+            if isinstance(value, (VirtualDevice, LoopbackDevice)):
+                raise HostError("Can't create '%s' in bulk." % name)
+            try:
+                if name in self._objects or getattr(self, name) is not None:
+                    raise HostError("Name '%s' already assigned." % name)
+            except AttributeError:
+                pass
+
+        for name, value in devices.items():
+            value._id = name
+            value._machine = self._machine
+            value.netns = self
+
+        self._machine.remote_devices_create(list(devices.values()), netns=self)
+        self._objects.update(devices)
+
     def wait_for_condition(self, condition: WaitForConditionModule):
         job = self.prepare_job(condition)
         job.start(bg=True)
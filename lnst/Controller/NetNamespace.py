@@ -18,9 +18,20 @@ class NetNamespace(Namespace):
 
     Created by the tester, should be assigned to a Host object which will
     perform the namespace creation. After that the tester uses it the same
-    way."""
-    def __init__(self, name):
+    way.
+
+    The backend selects how the agent serves the namespace: "fork" (default)
+    runs a forked copy of the agent in it, "thread" a thread of the agent
+    process which is much cheaper to create and to call when a recipe uses
+    many namespaces. Thread backed namespaces share /sys with the init
+    namespace and can't contain other namespaces."""
+    def __init__(self, name, backend="fork"):
         super(NetNamespace, self).__init__(None)
 
         self._name = name
+        self._backend = backend
         #self.jobs = None #TODO
+
+    @property
+    def backend(self):
+        return self._backend
@@ -57,6 +57,8 @@ class RecipeControl(object):
         msg_dispatcher.wait_for_condition(condition, timeout)
 
         host = Host(m)
-        self._controller._prepare_machine(m)
+        prepare_result = self._controller._prepare_machine(m)
+        if self._recipe.current_run:
+            self._recipe.current_run.add_result(prepare_result)
         m.start_recipe(self._recipe)
         return host
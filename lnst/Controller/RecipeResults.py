@@ -240,6 +240,10 @@ class DeviceAttrSetResult(DeviceConfigResult):
     def old_value(self):
         return self._old_value
 
+    @old_value.setter
+    def old_value(self, value):
+        self._old_value = value
+
     @property
     def description(self):
         return "Setting Device attribute {host}{netns}.{dev_id}.{attr} = {val}, previous value = {old_val}".format(
@@ -256,6 +260,37 @@ class DeviceAttrSetResult(DeviceConfigResult):
         )
 
 
+class MachinePrepareResult(BaseResult):
+    """Generated automatically when an agent machine was prepared for a
+    recipe run, stores how long the preparation took"""
+    def __init__(self, result, machine_id, duration):
+        super(MachinePrepareResult, self).__init__(result)
+        self._machine_id = machine_id
+        self._duration = duration
+
+    @property
+    def machine_id(self):
+        return self._machine_id
+
+    @property
+    def duration(self):
+        return self._duration
+
+    @property
+    def level(self):
+        return ResultLevel.NORMAL
+
+    @property
+    def description(self):
+        return "Preparing host {} took {:.2f} seconds".format(
+            self.machine_id, self.duration
+        )
+
+    @property
+    def data(self):
+        return {"machine_id": self.machine_id, "duration": self.duration}
+
+
 class Result(BaseResult):
     """Class intended to store aribitrary tester supplied data
 
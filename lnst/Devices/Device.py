@@ -12,8 +12,9 @@ olichtne@redhat.com (Ondrej Lichtner)
 """
 
 import re
+import errno
+import socket
 import ethtool
-import pyroute2
 import logging
 import pprint
 import time
@@ -24,6 +25,7 @@ from typing import Optional
 from lnst.Common.Logs import log_exc_traceback
 from lnst.Common.ExecCmd import exec_cmd, ExecCmdFail
 from lnst.Common.DeviceError import DeviceError, DeviceDeleted, DeviceDisabled
+from lnst.Common.DeviceError import DeviceNotFound
 from lnst.Common.DeviceError import DeviceConfigError, DeviceConfigValueError
 from lnst.Common.DeviceError import DeviceFeatureNotSupported
 from lnst.Common.IpAddress import ipaddress, AF_INET, BaseIpAddress
@@ -35,6 +37,7 @@ from pyroute2.netlink.rtnl import RTM_NEWADDR
 from pyroute2.netlink.rtnl import RTM_DELADDR
 
 TOGGLE_STATE_TIMEOUT = 15 + 3  # as a reserve
+ADDRESS_WAIT_TIMEOUT = 5
 
 class DeviceMeta(ABCMeta):
     def __instancecheck__(self, other):
@@ -104,6 +107,15 @@ class Device(object, metaclass=DeviceMeta):
     as a tester facing API.
     """
 
+    # if_data fields of _get_ethtool_if_data()
+    _ethtool_if_data = ("adaptive_rx_coalescing", "adaptive_tx_coalescing",
+                        "rx_pause", "tx_pause")
+
+    # attributes computed from the netlink state only, the agent pushes
+    # their changes so that the controller can serve them from a cache
+    _pushed_attrs = ("name", "hwaddr", "state", "mtu", "master", "ips",
+                     "link_header_type")
+
     def __init__(self, if_manager):
         self.ifindex = None
         self._nl_msg = None
@@ -172,20 +184,51 @@ class Device(object, metaclass=DeviceMeta):
         logging.debug("{}".format(pretty_attrs))
 
         ret_val = None
-        with pyroute2.IPRoute() as ipr:
-            try:
-                obj = getattr(ipr, obj_name)
-                if op_name is not None:
-                    ret_val = obj(op_name, *args, **kwargs)
-                else:
-                    ret_val = obj(*args, **kwargs)
-                self._if_manager.rescan_devices()
-            except Exception as e:
-                log_exc_traceback()
-                raise DeviceConfigError("Object {} operation {} on link {} failed: {}"
-                        .format(obj_name, op_name, self.name, str(e)))
+        try:
+            ipr = self._if_manager.get_iproute()
+            obj = getattr(ipr, obj_name)
+            if op_name is not None:
+                ret_val = obj(op_name, *args, **kwargs)
+            else:
+                ret_val = obj(*args, **kwargs)
+            self._if_manager.rescan_devices()
+        except Exception as e:
+            if isinstance(e, socket.error):
+                # reconnect on the next operation
+                self._if_manager.close_iproute()
+            log_exc_traceback()
+            raise DeviceConfigError("Object {} operation {} on link {} failed: {}"
+                    .format(obj_name, op_name, self.name, str(e)))
         return ret_val
 
+    def _ipr_batch_wrapper(self, obj_name, op_name, kwargs_list, ignore_errnos=[]):
+        """Performs several IPRoute operations in one netlink batch
+
+        All requests are sent at once and the ACKs are collected in one pass,
+        a DeviceConfigError listing the failed requests is raised afterwards.
+        Errors with a code from ignore_errnos are not considered failures.
+        """
+        logging.debug("Performing {} pyroute.IPRoute().{}({}, **kwargs) in a batch"
+                .format(len(kwargs_list), obj_name, op_name))
+        logging.debug("{}".format(pprint.pformat(kwargs_list)))
+
+        try:
+            errors = self._if_manager.ipr_batch(
+                [(obj_name, op_name, kwargs) for kwargs in kwargs_list])
+            self._if_manager.rescan_devices()
+        except Exception as e:
+            log_exc_traceback()
+            raise DeviceConfigError("Object {} operation {} on link {} failed: {}"
+                    .format(obj_name, op_name, self.name, str(e)))
+
+        failed = ["{}: {}".format(kwargs, error)
+                  for kwargs, error in zip(kwargs_list, errors)
+                  if error is not None and
+                     getattr(error, "code", None) not in ignore_errnos]
+        if failed:
+            raise DeviceConfigError("Object {} operation {} on link {} failed: {}"
+                    .format(obj_name, op_name, self.name, "; ".join(failed)))
+
     def _enable(self):
         """Enables the Device object"""
         self._enabled = True
@@ -292,7 +335,7 @@ class Device(object, metaclass=DeviceMeta):
             if addr in self._ip_addrs:
                 self._ip_addrs.remove(addr)
 
-    def _get_if_data(self):
+    def _get_if_data(self, ethtool_data=False):
         if_data = {"ifindex": self.ifindex,
                    "hwaddr": self.hwaddr,
                    "name": self.name,
@@ -303,6 +346,19 @@ class Device(object, metaclass=DeviceMeta):
                    "mtu": self.mtu,
                    "driver": self.driver,
                    "devlink": self._devlink}
+        if ethtool_data:
+            if_data.update(self._get_ethtool_if_data())
+        return if_data
+
+    def _get_ethtool_if_data(self):
+        """Returns the if_data fields that need ethtool calls
+
+        These aren't part of the default _get_if_data() output, that is sent
+        for every new link and should only contain the netlink data. The
+        values are available as device attributes, e.g.
+        adaptive_rx_coalescing, which are read when accessed.
+        """
+        if_data = {}
         try:
             ad_rx_coal, ad_tx_coal = self._read_adaptive_coalescing()
         except DeviceError:
@@ -319,6 +375,37 @@ class Device(object, metaclass=DeviceMeta):
 
         return if_data
 
+    def _get_pushed_state(self):
+        state = {}
+        for name in self._pushed_attrs:
+            try:
+                value = getattr(self, name)
+            except DeviceNotFound:
+                # the master was deleted before the notification releasing
+                # this device was processed
+                value = None
+            if isinstance(value, list):
+                value = list(value)
+            state[name] = value
+        return state
+
+    def _get_snapshot(self, names):
+        """Returns a dictionary with the values of the requested attributes
+
+        Attributes that fail to be read, e.g. because of an unsupported
+        feature, are logged and left out of the snapshot.
+        """
+        snapshot = {}
+        for name in names:
+            try:
+                snapshot[name] = getattr(self, name)
+            except DeviceFeatureNotSupported as e:
+                logging.debug(str(e))
+            except Exception as e:
+                logging.debug("Failed to read attribute {} of device {}: {}"
+                              .format(name, self.ifindex, e))
+        return snapshot
+
     def _vars(self):
         ret = {}
         for k in dir(self):
@@ -411,6 +498,16 @@ class Device(object, metaclass=DeviceMeta):
         msg = "Can't create a hardware ethernet device."
         raise DeviceError(msg)
 
+    def _create_request(self):
+        """Returns the IPRoute request creating the netdevice
+
+        Used by InterfaceManager.create_devices to create several devices
+        with one netlink batch, see InterfaceManager.ipr_batch. Device types
+        that can't be created by a single link request return None and are
+        created by _create().
+        """
+        return None
+
     def destroy(self):
         """Destroys the netdevice of the corresponding type
 
@@ -670,6 +767,7 @@ class Device(object, metaclass=DeviceMeta):
 
         Returns dictionary of interface statistics, IFLA_STATS
         """
+        self._if_manager.refresh_device(self.ifindex)
         return self._nl_msg.get_attr("IFLA_STATS")
 
     @property
@@ -678,6 +776,7 @@ class Device(object, metaclass=DeviceMeta):
 
         Returns dictionary of interface statistics, IFLA_STATS64
         """
+        self._if_manager.refresh_device(self.ifindex)
         return self._nl_msg.get_attr("IFLA_STATS64")
 
     @property
@@ -692,8 +791,13 @@ class Device(object, metaclass=DeviceMeta):
         return bus_info
 
     def ip_add_bulk(self, addresses: list[tuple[BaseIpAddress, Optional[BaseIpAddress]]], wait=True):
+        kwargs_list = []
         for addr, peer in addresses:
-            self._ip_add((addr, peer))
+            kwargs = self._ip_add_kwargs((addr, peer))
+            if kwargs is not None:
+                kwargs_list.append(kwargs)
+        if kwargs_list:
+            self._ipr_batch_wrapper("addr", "add", kwargs_list)
 
         if wait:
             self.wait_for_addresses(addresses)
@@ -710,30 +814,45 @@ class Device(object, metaclass=DeviceMeta):
         self.wait_for_addresses([(addr, peer)])
 
     def _ip_add(self, addresses: tuple[BaseIpAddress, Optional[BaseIpAddress]]):
+        kwargs = self._ip_add_kwargs(addresses)
+        if kwargs is not None:
+            self._ipr_wrapper("addr", "add", **kwargs)
+
+    def _ip_add_kwargs(self, addresses: tuple[BaseIpAddress, Optional[BaseIpAddress]]):
         addr, peer = addresses
         ip = ipaddress(addr)
-        if ip not in self.ips:
-            kwargs = dict(
-                index=self.ifindex,
-                local=str(ip),
-                address=str(ip),
-                mask=ip.prefixlen
-            )
-            if peer:
-                kwargs['address'] = str(ipaddress(peer))
+        if ip in self.ips:
+            return None
 
-            self._ipr_wrapper("addr", "add", **kwargs)
+        kwargs = dict(
+            index=self.ifindex,
+            local=str(ip),
+            address=str(ip),
+            mask=ip.prefixlen
+        )
+        if peer:
+            kwargs['address'] = str(ipaddress(peer))
+        return kwargs
+
+    def wait_for_addresses(self, addresses: list[tuple[BaseIpAddress, Optional[BaseIpAddress]]],
+                           timeout: float = ADDRESS_WAIT_TIMEOUT):
+        def condition():
+            return all([addr in self.ips for (addr, _) in addresses])
 
-    def wait_for_addresses(self, addresses: list[tuple[BaseIpAddress, Optional[BaseIpAddress]]]):
-        MAX_TRIES = 5
-        i = 1
-        while not all([addr in self.ips for (addr, _) in addresses]) and i <= MAX_TRIES:
-            logging.debug("Waiting for ip address to be added {} of 5".format(i))
-            time.sleep(1)
-            self._if_manager.rescan_devices()
+        if not self._if_manager.wait_for_condition(condition, timeout):
+            raise DeviceError("Failed to configure ip addresses {}".format(
+                ", ".join(str(ipaddress(addr)) for (addr, _) in addresses)))
+
+    def wait_for_tentative_ips(self, timeout: float = ADDRESS_WAIT_TIMEOUT):
+        """wait until none of the ip addresses is tentative
 
-        if not all([addr in self.ips for (addr, _) in addresses]):
-            raise DeviceError("Failed to configure ip addresses {}".format(str(ipaddress(addr)) for (addr, _) in addresses))
+        IPv6 addresses stay tentative until duplicate address detection
+        finishes.
+
+        Returns True when no address is tentative anymore, False on timeout.
+        """
+        return self._if_manager.wait_for_condition(
+            lambda: not any(ip.is_tentative for ip in self.ips), timeout)
 
     def ip_del(self, addr):
         """remove an ip address
@@ -748,7 +867,16 @@ class Device(object, metaclass=DeviceMeta):
 
     def ip_flush(self, scope=0):
         """flush all ip addresses of the device"""
-        self._ipr_wrapper("flush_addr", None, index=self.ifindex, scope=scope)
+        addrs = self._ipr_wrapper("get_addr", None, index=self.ifindex,
+                                  scope=scope)
+        self._ipr_batch_wrapper("addr", "del",
+                                [dict(index=self.ifindex,
+                                      address=addr.get_attr("IFA_ADDRESS"),
+                                      prefixlen=addr["prefixlen"])
+                                 for addr in addrs],
+                                # deleting a primary address can also remove
+                                # its secondaries
+                                ignore_errnos=[errno.EADDRNOTAVAIL])
 
     def ips_filter(self, **selectors):
         result = []
@@ -777,11 +905,18 @@ class Device(object, metaclass=DeviceMeta):
 
     def up_and_wait(self, timeout: int = TOGGLE_STATE_TIMEOUT):
         self.up()
-        wait_for_condition(lambda: "up" in self.state, timeout=timeout)
+        self._wait_for_state(lambda: "up" in self.state, timeout, "up")
 
     def down_and_wait(self, timeout: int = TOGGLE_STATE_TIMEOUT):
         self.down()
-        wait_for_condition(lambda: "up" not in self.state, timeout=timeout)
+        self._wait_for_state(lambda: "up" not in self.state, timeout,
+                             "down")
+
+    def _wait_for_state(self, condition, timeout, state):
+        if not self._if_manager.wait_for_condition(condition, timeout):
+            raise TimeoutError(
+                f"Timeout while waiting for device {self.name} to go {state}"
+            )
 
     #TODO looks like python ethtool module doesn't support these so we'll keep
     #exec_cmd for now...
@@ -43,6 +43,10 @@ class RemoteDevice(object):
         self._cache = {}
         self._cached = False
 
+        # values of the attributes pushed by the agent, see
+        # Machine.remote_device_getattr
+        self._attr_cache = {}
+
         self._inited = True
 
     def __deepcopy__(self, memo):
@@ -56,14 +60,35 @@ class RemoteDevice(object):
         newone._inited = deepcopy(self._inited, memo)
         return newone
 
-    def enable_readonly_cache(self):
+    def enable_readonly_cache(self, snapshot=None):
+        """Freezes the values of the device attributes
+
+        The values are fetched with a single dev_snapshot call, or taken
+        from snapshot when the caller already has them, e.g. from the
+        netns wide dev_snapshot_all call.
+        """
         if self._cached:
             return
-        self._cache = {}
-        for name, val in self:
-            self._cache[name] = val
+        if snapshot is None:
+            snapshot = self._machine.remote_device_snapshot(
+                self.ifindex, self._snapshot_attr_names(), self.netns)
+        self._cache = dict(snapshot)
         self._cached = True
 
+    def _snapshot_attr_names(self):
+        """Names of the public attributes that are read from the agent
+
+        Attributes that are implemented by RemoteDevice itself (e.g. peer)
+        are evaluated on the controller and don't need to be cached.
+        """
+        names = []
+        for x in dir(self._dev_cls):
+            if x[0] == '_' or hasattr(type(self), x) or x in self.__dict__:
+                continue
+            if not callable(getattr(self._dev_cls, x)):
+                names.append(x)
+        return names
+
     def disable_readonly_cache(self):
         self._cache = {}
         self._cached = False
@@ -54,6 +54,15 @@ class SoftDevice(Device):
         return self._nl_msg.get_nested("IFLA_LINKINFO", "IFLA_INFO_DATA",
                                        attr_name)
 
+    def _create_request(self):
+        if type(self)._create is not SoftDevice._create:
+            # e.g. OvsBridgeDevice, not created by a link request
+            return None
+
+        self._update_attr(self._link_type, "IFLA_LINKINFO", "IFLA_INFO_KIND")
+        return ("link", "add",
+                self._process_nested_nl_attrs(self._nl_link_update))
+
     def _create(self):
         self._update_attr(self._link_type, "IFLA_LINKINFO", "IFLA_INFO_KIND")
         try:
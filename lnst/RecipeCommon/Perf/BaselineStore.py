@@ -0,0 +1,227 @@
+"""
+Defines the BaselineStore class, a SQLite database of summaries of perf
+measurement results that later runs can use as their baselines.
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import json
+import time
+import enum
+import sqlite3
+import hashlib
+import dataclasses
+from dataclasses import dataclass
+from typing import Optional
+
+from lnst.Common.IpAddress import BaseIpAddress
+from lnst.Devices.RemoteDevice import RemoteDevice
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    description TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL REFERENCES results (key),
+    metric TEXT NOT NULL,
+    version TEXT,
+    timestamp REAL NOT NULL,
+    average REAL NOT NULL,
+    std_deviation REAL NOT NULL,
+    samples INTEGER NOT NULL,
+    unit TEXT
+);
+CREATE INDEX IF NOT EXISTS summaries_lookup
+    ON summaries (key, metric, timestamp DESC);
+"""
+
+MAX_DESCRIPTION_DEPTH = 8
+LOOKUP_CHUNK = 500
+
+
+@dataclass
+class MetricSummary:
+    average: float
+    std_deviation: float
+    samples: int
+    unit: Optional[str]
+    version: Optional[str]
+    timestamp: float
+
+
+def stable_description(value, depth=0):
+    """Converts value to a JSON serializable description
+
+    The description doesn't contain anything that changes between two runs
+    of the same recipe on the same machines, e.g. devices are described by
+    their names, not by their ifindexes or ids.
+    """
+    if depth > MAX_DESCRIPTION_DEPTH:
+        return type(value).__name__
+    depth += 1
+
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, enum.Enum):
+        return str(value)
+    if isinstance(value, BaseIpAddress):
+        return repr(value)
+    if isinstance(value, RemoteDevice):
+        return "{}({})".format(value._dev_cls.__name__, value.name)
+    if isinstance(value, (list, tuple)):
+        return [stable_description(i, depth) for i in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(json.dumps(stable_description(i, depth), sort_keys=True)
+                      for i in value)
+    if isinstance(value, dict):
+        return {json.dumps(stable_description(k, depth), sort_keys=True):
+                stable_description(v, depth) for k, v in value.items()}
+    if dataclasses.is_dataclass(value):
+        return {field.name: stable_description(getattr(value, field.name),
+                                               depth)
+                for field in dataclasses.fields(value)}
+
+    cls = type(value)
+    if cls.__str__ is not object.__str__ or cls.__repr__ is not object.__repr__:
+        return str(value)
+    if hasattr(value, "__dict__"):
+        return {"class": cls.__name__,
+                "attrs": {k: stable_description(v, depth)
+                          for k, v in vars(value).items()}}
+    return cls.__name__
+
+
+def baseline_description(recipe, recipe_conf, result):
+    """Describes what a measurement result was measured by
+
+    The description consists of the recipe and its parameters, the perf
+    recipe configuration, the measurement and the identification of the
+    result within the measurement (flow, host, cpu, ...).
+    """
+    result_id = {
+        attr: stable_description(getattr(result, attr))
+        for attr in ("flow", "host", "cpu", "device")
+        if hasattr(result, attr)
+    }
+    return {
+        "recipe": type(recipe).__name__,
+        "params": {name: stable_description(val)
+                   for name, val in recipe.params},
+        "recipe_conf": {
+            "measurements": [type(m).__name__
+                             for m in recipe_conf.measurements],
+            "iterations": recipe_conf.iterations,
+            "parent_recipe_config": stable_description(
+                recipe_conf.parent_recipe_config),
+        },
+        "measurement": type(result.measurement).__name__,
+        "result": result_id,
+        "metric_metadata": stable_description(result.metric_metadata),
+    }
+
+
+def baseline_key(description):
+    data = json.dumps(description, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class BaselineStore(object):
+    """SQLite database of perf result summaries
+
+    For each metric of a stored measurement result the average, standard
+    deviation, number of samples and unit are stored together with the
+    version of the measurement, keyed by baseline_key of the
+    baseline_description of the result. The summaries of a key are indexed
+    by the metric and time so that looking up the most recent ones doesn't
+    depend on the number of stored runs.
+    """
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def result_key(self, recipe, recipe_conf, result):
+        return baseline_key(baseline_description(recipe, recipe_conf, result))
+
+    def store_results(self, recipe, recipe_conf, results, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+
+        keys = []
+        rows = []
+        for result in results:
+            description = baseline_description(recipe, recipe_conf, result)
+            key = baseline_key(description)
+            keys.append((key, json.dumps(description, sort_keys=True)))
+            version = result.measurement.version
+            for metric in result.metrics:
+                summary = self._summarize(getattr(result, metric, None))
+                if summary is None:
+                    continue
+                rows.append((key, metric, None if version is None
+                             else str(version), timestamp) + summary)
+
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO results (key, description) "
+                "VALUES (?, ?)", keys)
+            self._conn.executemany(
+                "INSERT INTO summaries (key, metric, version, timestamp, "
+                "average, std_deviation, samples, unit) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    @staticmethod
+    def _summarize(perf_result):
+        if perf_result is None or not hasattr(perf_result, "average"):
+            return None
+        try:
+            samples = len(perf_result)
+        except TypeError:
+            samples = 1
+        return (float(perf_result.average),
+                float(perf_result.std_deviation),
+                samples, perf_result.unit)
+
+    def get_summaries(self, lookups, history=1):
+        """Returns the most recent summaries of the given results
+
+        lookups is a list of (key, version, metrics) tuples, version None
+        matches any version. Returns a dictionary {(key, version): {metric:
+        [summary, ...]}} with at most history summaries per metric, the most
+        recent first. The summaries are fetched by a single query (per
+        LOOKUP_CHUNK metrics) that reads only the selected rows of the index.
+        """
+        result = {}
+        by_stored_key = {}
+        wanted = []
+        for key, version, metrics in lookups:
+            stored_version = None if version is None else str(version)
+            result[(key, version)] = {}
+            by_stored_key[(key, stored_version)] = result[(key, version)]
+            wanted.extend((key, stored_version, metric) for metric in metrics)
+
+        for i in range(0, len(wanted), LOOKUP_CHUNK):
+            chunk = wanted[i:i + LOOKUP_CHUNK]
+            rows = self._conn.execute(
+                "WITH wanted (key, version, metric) AS (VALUES {}) "
+                "SELECT w.key, w.version, s.metric, s.average, "
+                "s.std_deviation, s.samples, s.unit, s.version, s.timestamp "
+                "FROM wanted AS w JOIN summaries AS s ON s.id IN ("
+                "  SELECT id FROM summaries"
+                "  WHERE key = w.key AND metric = w.metric"
+                "  AND (w.version IS NULL OR version = w.version)"
+                "  ORDER BY timestamp DESC LIMIT ?"
+                ") ORDER BY s.timestamp DESC".format(
+                    ", ".join(["(?, ?, ?)"] * len(chunk))),
+                [arg for row in chunk for arg in row] + [history])
+
+            for key, version, metric, *summary in rows:
+                metrics = by_stored_key[(key, version)]
+                metrics.setdefault(metric, []).append(MetricSummary(*summary))
+        return result
@@ -0,0 +1,149 @@
+"""
+Defines the ConfidenceTracker class used by the perf Recipe to stop
+repeating the measurements once their results are precise enough.
+
+Copyright 2026 Red Hat, Inc.
+Licensed under the GNU General Public License, version 2 as
+published by the Free Software Foundation; see COPYING for details.
+"""
+
+import math
+from statistics import fmean, stdev
+
+
+def t_central_probability(t, df):
+    """Probability that a Student's t distributed variable with df degrees
+    of freedom lies within (-t, t)
+
+    Uses the closed forms for integer degrees of freedom (Abramowitz and
+    Stegun 26.7.3 and 26.7.4).
+    """
+    theta = math.atan(abs(t) / math.sqrt(df))
+    cos2 = math.cos(theta) ** 2
+    if df % 2:
+        term = 0.0 if df == 1 else math.cos(theta)
+        total = term
+        for k in range(3, df - 1, 2):
+            term *= (k - 1) / k * cos2
+            total += term
+        return 2 / math.pi * (theta + math.sin(theta) * total)
+
+    term = total = 1.0
+    for k in range(2, df - 1, 2):
+        term *= (k - 1) / k * cos2
+        total += term
+    return math.sin(theta) * total
+
+
+def t_quantile(p, df):
+    """Quantile function of the Student's t-distribution
+
+    Inverts t_central_probability by bisection, df has to be an integer.
+    """
+    if p < 0.5:
+        return -t_quantile(1 - p, df)
+
+    central = 2 * p - 1
+    low, high = 0.0, 1.0
+    while t_central_probability(high, df) < central:
+        low, high = high, high * 2
+    for i in range(100):
+        mid = (low + high) / 2
+        if t_central_probability(mid, df) < central:
+            low = mid
+        else:
+            high = mid
+        if high - low <= 1e-12 * high:
+            break
+    return (low + high) / 2
+
+
+def relative_ci_width(values, confidence):
+    """Width of the confidence interval of the mean of values in percent
+    of the mean"""
+    if len(values) < 2:
+        return float("inf")
+
+    deviation = stdev(values)
+    if deviation == 0:
+        return 0.0
+
+    average = fmean(values)
+    if average == 0:
+        return float("inf")
+
+    half_width = (t_quantile((1 + confidence) / 2, len(values) - 1)
+                  * deviation / math.sqrt(len(values)))
+    return 2 * half_width / abs(average) * 100
+
+
+class ConfidenceTracker(object):
+    """Collects the averages of the metrics of each measurement iteration
+
+    The metrics are identified by the measurement, the position of the
+    result in the results of an iteration and the metric name. target is
+    the maximal relative confidence interval width in percent for all
+    metrics or a dictionary of the widths for the metric names, metrics
+    missing in it aren't tracked.
+
+    checks is the number of times target_reached() may be called to decide
+    whether to stop. Stopping on the first narrow enough interval makes the
+    final interval miss the mean more often than the confidence level says,
+    so the intervals are computed for confidence level
+    1 - (1 - confidence) / checks (Bonferroni correction), which keeps the
+    probability of the final interval missing the mean under 1 - confidence.
+    """
+    def __init__(self, target, confidence=0.95, checks=1):
+        self._target = target
+        self._confidence = confidence
+        self._checks = checks
+        self._values = {}
+
+    @property
+    def check_confidence(self):
+        """Confidence level of the intervals corrected for the checks"""
+        return 1 - (1 - self._confidence) / self._checks
+
+    def metric_target(self, metric):
+        if isinstance(self._target, dict):
+            return self._target.get(metric)
+        return self._target
+
+    def add_iteration(self, measurement, results):
+        for i, result in enumerate(results):
+            for metric in result.metrics:
+                if self.metric_target(metric) is None:
+                    continue
+
+                try:
+                    average = getattr(result, metric).average
+                except (AttributeError, IndexError, ValueError,
+                        ZeroDivisionError):
+                    continue
+                if not math.isfinite(average):
+                    continue
+
+                self._values.setdefault((measurement, i, metric), []).append(
+                    average)
+
+    @property
+    def widths(self):
+        """Dictionary of the current relative confidence interval widths"""
+        return {key: relative_ci_width(values, self.check_confidence)
+                for key, values in self._values.items()}
+
+    def target_reached(self):
+        widths = self.widths
+        return bool(widths) and all(
+            width <= self.metric_target(metric)
+            for (measurement, i, metric), width in widths.items())
+
+    def describe(self):
+        lines = []
+        for (measurement, i, metric), width in self.widths.items():
+            lines.append(
+                "{} result {} {}: {:.2f}% (target {}%, {} values)".format(
+                    measurement.__class__.__name__, i, metric, width,
+                    self.metric_target(metric),
+                    len(self._values[(measurement, i, metric)])))
+        return lines
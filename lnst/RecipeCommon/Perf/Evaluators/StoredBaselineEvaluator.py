@@ -0,0 +1,139 @@
+from typing import List, Optional
+
+from lnst.Common.Utils import std_deviation
+from lnst.Controller.Recipe import BaseRecipe
+from lnst.RecipeCommon.Perf.Recipe import RecipeConf as PerfRecipeConf
+from lnst.RecipeCommon.Perf.BaselineStore import BaselineStore
+from lnst.RecipeCommon.Perf.Measurements.Results import (
+    BaseMeasurementResults as PerfMeasurementResults,
+)
+from lnst.RecipeCommon.Perf.Evaluators.BaselineEvaluator import BaselineEvaluator
+
+
+class StoredBaselineMetric(object):
+    """Metric of a baseline computed from the summaries of previous runs
+
+    The average is the average of the run averages. The standard deviation
+    is computed from the run averages as well, or taken from the run when
+    there's only one.
+    """
+    def __init__(self, summaries):
+        self.summaries = summaries
+
+    @property
+    def runs(self):
+        return len(self.summaries)
+
+    @property
+    def average(self):
+        return sum(s.average for s in self.summaries) / len(self.summaries)
+
+    @property
+    def std_deviation(self):
+        if len(self.summaries) == 1:
+            return self.summaries[0].std_deviation
+        return std_deviation([s.average for s in self.summaries])
+
+    @property
+    def unit(self):
+        return self.summaries[0].unit
+
+
+class StoredBaseline(object):
+    """Baseline with the stored metrics of a measurement result as
+    StoredBaselineMetric attributes"""
+    def __init__(self, metrics):
+        self.metrics = list(metrics)
+        for metric, summaries in metrics.items():
+            setattr(self, metric, StoredBaselineMetric(summaries))
+
+
+class StoredBaselineEvaluator(BaselineEvaluator):
+    """Evaluates the results against the baselines from a BaselineStore
+
+    The baseline of a result is computed from the history most recent
+    stored runs of the same result (see BaselineStore), by default only
+    the runs of the same measurement version match. The baselines of all
+    results of a group are fetched with a single query.
+
+    The allowed difference of a metric is deviations times its baseline
+    standard deviation relative to its baseline average, but at least
+    min_threshold percent. With store_results the evaluated results are
+    stored as new baselines afterwards.
+    """
+    def __init__(
+        self,
+        store: BaselineStore,
+        metrics_to_evaluate: Optional[List[str]] = None,
+        history: int = 10,
+        deviations: float = 3.0,
+        min_threshold: float = 1.0,
+        match_version: bool = True,
+        store_results: bool = False,
+    ):
+        super().__init__(metrics_to_evaluate)
+        self._store = store
+        self._history = history
+        self._deviations = deviations
+        self._min_threshold = min_threshold
+        self._match_version = match_version
+        self._store_results = store_results
+
+    def evaluate_group_results(
+        self,
+        recipe: BaseRecipe,
+        recipe_conf: PerfRecipeConf,
+        results: List[PerfMeasurementResults],
+    ):
+        super().evaluate_group_results(recipe, recipe_conf, results)
+
+        if self._store_results:
+            self._store.store_results(recipe, recipe_conf, results)
+
+    def get_baselines(
+        self,
+        recipe: BaseRecipe,
+        recipe_conf: PerfRecipeConf,
+        results: List[PerfMeasurementResults],
+    ) -> List[Optional[StoredBaseline]]:
+        lookups = [
+            (
+                self._store.result_key(recipe, recipe_conf, result),
+                result.measurement.version if self._match_version else None,
+                result.metrics,
+            )
+            for result in results
+        ]
+        summaries = self._store.get_summaries(lookups, self._history)
+
+        baselines = []
+        for key, version, metrics in lookups:
+            metric_summaries = summaries[(key, version)]
+            baselines.append(
+                StoredBaseline(metric_summaries) if metric_summaries else None
+            )
+        return baselines
+
+    def get_baseline(
+        self,
+        recipe: BaseRecipe,
+        recipe_conf: PerfRecipeConf,
+        result: PerfMeasurementResults,
+    ) -> Optional[StoredBaseline]:
+        return self.get_baselines(recipe, recipe_conf, [result])[0]
+
+    def get_threshold(
+        self,
+        baseline: StoredBaseline,
+        metric_name: str,
+    ) -> Optional[float]:
+        if metric_name not in baseline.metrics:
+            return None
+
+        metric = getattr(baseline, metric_name)
+        average = metric.average
+        if average == 0:
+            return None
+
+        threshold = self._deviations * metric.std_deviation / abs(average) * 100
+        return max(self._min_threshold, round(threshold, 2))
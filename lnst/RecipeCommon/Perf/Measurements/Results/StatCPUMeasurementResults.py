@@ -1,4 +1,4 @@
-from lnst.RecipeCommon.Perf.Results import SequentialPerfResult
+from lnst.RecipeCommon.Perf.Results import ColumnarPerfResult
 from lnst.RecipeCommon.Perf.Results import ParallelPerfResult
 from lnst.RecipeCommon.Perf.Measurements.Results import CPUMeasurementResults
 
@@ -11,9 +11,12 @@ class StatCPUMeasurementResults(CPUMeasurementResults):
     def update_intervals(self, intervals):
         for key, interval in list(intervals.items()):
             if key not in self._data:
-                self._data[key] = SequentialPerfResult()
+                self._data[key] = ColumnarPerfResult()
             self._data[key].append(interval)
 
+    def set_intervals(self, cpu_state, result):
+        self._data[cpu_state] = result
+
     @property
     def utilization(self):
         return ParallelPerfResult([self._data["user"], self._data["nice"],
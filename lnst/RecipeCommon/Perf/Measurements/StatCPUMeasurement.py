@@ -1,7 +1,7 @@
 import signal
 
 from lnst.Controller.RecipeResults import ResultLevel
-from lnst.RecipeCommon.Perf.Results import PerfInterval
+from lnst.RecipeCommon.Perf.Results import PerfInterval, ColumnarPerfResult
 from lnst.RecipeCommon.Perf.Measurements.BaseCPUMeasurement import BaseCPUMeasurement
 from lnst.RecipeCommon.Perf.Measurements.Results import StatCPUMeasurementResults
 
@@ -9,9 +9,10 @@ from lnst.Tests.CPUStatMonitor import CPUStatMonitor
 
 
 class StatCPUMeasurement(BaseCPUMeasurement):
-    def __init__(self, hosts, recipe_conf=None):
+    def __init__(self, hosts, recipe_conf=None, interval=1000):
         super(StatCPUMeasurement, self).__init__(recipe_conf)
         self._hosts = hosts
+        self._interval = interval
         self._running_measurements = []
         self._finished_measurements = []
 
@@ -28,7 +29,7 @@ class StatCPUMeasurement(BaseCPUMeasurement):
         for host in sorted(self.hosts, key=lambda x: x.hostid):
             jobs.append(
                 host.run(
-                    CPUStatMonitor(interval=1000),
+                    CPUStatMonitor(interval=self._interval, compact=True),
                     bg=True,
                     job_level=ResultLevel.NORMAL,
                 )
@@ -57,6 +58,9 @@ class StatCPUMeasurement(BaseCPUMeasurement):
         return results
 
     def _process_job(self, job):
+        if "compact" in job.result:
+            return self._process_compact_job(job)
+
         host = job.host
         job_results = {}
         for sample in job.result["data"]:
@@ -75,6 +79,35 @@ class StatCPUMeasurement(BaseCPUMeasurement):
 
         return list(job_results.values())
 
+    def _process_compact_job(self, job):
+        data = job.result["compact"]
+        cpus = data["cpus"]
+        fields = data["fields"]
+        timestamps = data["timestamps"]
+        counters = data["counters"]
+        if not counters:
+            return []
+
+        starts = timestamps[:-1]
+        durations = [end - start for start, end in
+                     zip(timestamps[:-1], timestamps[1:])]
+        stride = len(cpus) * len(fields)
+
+        job_results = []
+        for i, cpu in enumerate(cpus):
+            cpu_results = StatCPUMeasurementResults(
+                measurement=self,
+                measurement_success=job.passed,
+                host=job.host,
+                cpu=cpu
+            )
+            for j, field in enumerate(fields):
+                values = counters[i * len(fields) + j::stride]
+                cpu_results.set_intervals(field, ColumnarPerfResult.from_columns(
+                    values, durations, starts, "time units"))
+            job_results.append(cpu_results)
+        return job_results
+
     def _parse_sample(self, sample):
         result = {}
         duration = sample["duration"]
@@ -1,6 +1,6 @@
 import logging
 from collections import OrderedDict
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Optional, Union
 
 from lnst.Common.LnstError import LnstError
 from lnst.Common.Logs import log_exc_traceback
@@ -10,6 +10,7 @@ from lnst.RecipeCommon.Perf.Measurements.BaseMeasurement import BaseMeasurement
 from lnst.RecipeCommon.Perf.Measurements.Results import BaseMeasurementResults
 from lnst.RecipeCommon.Perf.Measurements.IperfFlowMeasurement import FlowMeasurementResults
 from lnst.RecipeCommon.Perf.Results import EmptySlice
+from lnst.RecipeCommon.Perf.Confidence import ConfidenceTracker
 
 from lnst.RecipeCommon.Perf.PerfTestMixins import (
     BasePerfTestTweakMixin,
@@ -19,12 +20,32 @@ from lnst.RecipeCommon.BaseResultEvaluator import BaseResultEvaluator
 
 
 class RecipeConf(object):
+    """Configuration of a perf test
+
+    With ci_target the perf test is adaptive: iterations is the maximal
+    number of iterations and the test stops after min_iterations (at least
+    2) once the confidence interval (of ci_confidence level) of the mean
+    of each metric over the iterations is narrower than ci_target percent
+    of the mean. ci_target can be a dictionary of the targets of the metric
+    names, then only the listed metrics are considered.
+
+    Stopping at the first narrow enough interval makes the final interval
+    miss the mean more often than ci_confidence says, up to about twice as
+    often for the typical 95% level (see benchmarks/adaptive_iterations.py).
+    With ci_corrected the intervals are computed at a confidence level
+    corrected for the repeated checks, which keeps the miss rate under
+    1 - ci_confidence but often needs all the iterations.
+    """
     def __init__(
         self,
         measurements: List[BaseMeasurement],
         iterations: int,
         parent_recipe_config: Any = None,
         simulate_measurements: bool = False,
+        min_iterations: Optional[int] = None,
+        ci_target: Union[None, float, Dict[str, float]] = None,
+        ci_confidence: float = 0.95,
+        ci_corrected: bool = False,
     ):
         self._measurements = measurements
         self._evaluators = dict()
@@ -32,6 +53,22 @@ class RecipeConf(object):
         self._parent_recipe_config = parent_recipe_config
         self._simulate_measurements = simulate_measurements
 
+        if min_iterations is None:
+            min_iterations = 2 if ci_target else iterations
+        min_iterations = min(min_iterations, iterations)
+        if ci_target and min_iterations < 2:
+            raise LnstError(
+                "Adaptive perf tests need at least 2 iterations"
+            )
+        if not 0 < ci_confidence < 1:
+            raise LnstError(
+                "Confidence level must be between 0 and 1"
+            )
+        self._min_iterations = min_iterations
+        self._ci_target = ci_target
+        self._ci_confidence = ci_confidence
+        self._ci_corrected = ci_corrected
+
     @property
     def measurements(self):
         return self._measurements
@@ -60,21 +97,62 @@ class RecipeConf(object):
     def iterations(self):
         return self._iterations
 
+    @property
+    def min_iterations(self):
+        return self._min_iterations
+
+    @property
+    def ci_target(self):
+        return self._ci_target
+
+    @property
+    def ci_confidence(self):
+        return self._ci_confidence
+
+    @property
+    def ci_corrected(self):
+        return self._ci_corrected
+
+    @property
+    def ci_checks(self):
+        """number of stopping checks the confidence level is corrected for"""
+        if not self._ci_corrected:
+            return 1
+        return self._iterations - self._min_iterations + 1
+
+    @property
+    def adaptive(self):
+        return bool(self._ci_target)
+
     @property
     def parent_recipe_config(self):
         return self._parent_recipe_config
 
 
 class RecipeResults(object):
+    """Results of the measurements of a perf test
+
+    For adaptive perf tests the confidence attribute describes the stopping,
+    see Recipe.perf_test_adaptive. Unless the RecipeConf uses ci_corrected,
+    the intervals the test stopped on miss the true mean more often than
+    their confidence level says.
+    """
     def __init__(self, recipe_conf: RecipeConf):
         self._recipe_conf = recipe_conf
         self._results = OrderedDict()
         self._aggregated_results = OrderedDict()
+        self.confidence = None
 
     @property
     def recipe_conf(self) -> RecipeConf:
         return self._recipe_conf
 
+    @property
+    def iterations(self) -> int:
+        return max(
+            (len(results) for results in self._results.values()), default=0
+        )
+
     @property
     def results(self) -> Dict[BaseMeasurement, List[BaseMeasurementResults]]:
         return self._results
@@ -117,7 +195,7 @@ class RecipeResults(object):
     @property
     def time_aligned_results(self) -> "RecipeResults":
         timestamps = []
-        for i in range(self.recipe_conf.iterations):
+        for i in range(self.iterations):
             iteration_results_group = [
                 measurement_iteration_result
                 for measurement_results in self.results.values()
@@ -128,6 +206,7 @@ class RecipeResults(object):
             timestamps.append(real_times)
 
         aligned_recipe_results = RecipeResults(self._recipe_conf)
+        aligned_recipe_results.confidence = self.confidence
         for measurement, measurement_results in self.results.items():
             for i, measurement_iteration in enumerate(measurement_results):
                 aligned_measurement_results = []
@@ -158,13 +237,63 @@ class Recipe(
         self.describe_perf_test_tweak(recipe_conf)
 
         try:
-            for i in range(recipe_conf.iterations):
-                self.perf_test_iteration(recipe_conf, results)
+            if recipe_conf.adaptive:
+                self.perf_test_adaptive(recipe_conf, results)
+            else:
+                for i in range(recipe_conf.iterations):
+                    self.perf_test_iteration(recipe_conf, results)
         finally:
             self.remove_perf_test_tweak(recipe_conf)
 
         return results
 
+    def perf_test_adaptive(
+        self, recipe_conf: RecipeConf, results: RecipeResults
+    ):
+        tracker = ConfidenceTracker(
+            recipe_conf.ci_target,
+            recipe_conf.ci_confidence,
+            recipe_conf.ci_checks,
+        )
+        for i in range(recipe_conf.iterations):
+            self.perf_test_iteration(recipe_conf, results)
+            for measurement, measurement_results in results.results.items():
+                tracker.add_iteration(measurement, measurement_results[-1])
+
+            if i + 1 >= recipe_conf.min_iterations and tracker.target_reached():
+                break
+
+        target_reached = tracker.target_reached()
+        results.confidence = {
+            "iterations": results.iterations,
+            "max_iterations": recipe_conf.iterations,
+            "target_reached": target_reached,
+            "confidence": recipe_conf.ci_confidence,
+            "check_confidence": tracker.check_confidence,
+            "widths": {
+                "{} result {} {}".format(
+                    measurement.__class__.__name__, i, metric
+                ): width
+                for (measurement, i, metric), width in tracker.widths.items()
+            },
+        }
+        description = [
+            "Perf test {} the {:g}% confidence interval target after {} of "
+            "at most {} iterations:".format(
+                "reached" if target_reached else "didn't reach",
+                tracker.check_confidence * 100,
+                results.iterations,
+                recipe_conf.iterations,
+            )
+        ] + tracker.describe()
+        # not reaching the target only costs the iterations, the results
+        # are still evaluated as usual
+        self.add_result(
+            ResultType.PASS if target_reached else ResultType.WARNING,
+            "\n".join(description),
+            data=results.confidence,
+        )
+
     def perf_test_iteration(
         self, recipe_conf: RecipeConf, results: RecipeResults
     ):
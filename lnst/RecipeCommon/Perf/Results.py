@@ -1,3 +1,7 @@
+import math
+import operator
+from array import array
+from bisect import bisect_left, bisect_right
 from lnst.Common.LnstError import LnstError
 from lnst.Common.Utils import std_deviation
 
@@ -117,8 +121,10 @@ class PerfList(list):
 
     def _validate_item_type(self, item):
         if (not isinstance(item, PerfInterval) and
-            not isinstance(item, PerfList)):
-            raise LnstError("{} only accepts PerfInterval or PerfList objects."
+            not isinstance(item, PerfList) and
+            not isinstance(item, ColumnarPerfResult)):
+            raise LnstError("{} only accepts PerfInterval, PerfList or "
+                            "ColumnarPerfResult objects."
                             .format(self.__class__.__name__))
 
     def append(self, item):
@@ -228,6 +234,187 @@ class ParallelPerfResult(PerfList, PerfResult):
     def end_timestamp(self):
         return max([i.end_timestamp for i in self])
 
+class ColumnarPerfResult(PerfResult):
+    """Sequence of intervals stored in columns
+
+    Behaves like a SequentialPerfResult of PerfInterval objects but keeps
+    the values, durations, start and end timestamps of the intervals in
+    arrays of floats instead of creating an object for every interval,
+    indexing and iterating creates the PerfInterval objects on demand.
+    The statistics are computed over the whole columns and time_slice
+    finds the intervals by bisecting the timestamp columns as long as the
+    intervals are added in the order of both their start and end
+    timestamps (which is the case for samples of a single measurement),
+    otherwise it checks each interval.
+    """
+    def __init__(self, iterable=[], unit=None):
+        self._unit = unit
+        self._values = array("d")
+        self._durations = array("d")
+        self._starts = array("d")
+        self._ends = array("d")
+        self._ordered = True
+        self.extend(iterable)
+
+    @classmethod
+    def from_columns(cls, values, durations, timestamps, unit):
+        """Creates the result from the values, durations and start
+        timestamps of the intervals"""
+        values = array("d", values)
+        durations = array("d", durations)
+        starts = array("d", timestamps)
+        ends = array("d", map(operator.add, starts, durations))
+        if not len(values) == len(durations) == len(starts):
+            raise LnstError("{} columns must have the same length."
+                            .format(cls.__name__))
+        return cls(unit=unit)._from_columns(values, durations, starts, ends,
+                                            _is_sorted(starts, ends))
+
+    def add_interval(self, value, duration, timestamp):
+        """Adds an interval without creating the PerfInterval object"""
+        end = timestamp + duration
+        if self._starts and (timestamp < self._starts[-1] or
+                             end < self._ends[-1]):
+            self._ordered = False
+        self._values.append(value)
+        self._durations.append(duration)
+        self._starts.append(timestamp)
+        self._ends.append(end)
+
+    def append(self, item):
+        if not isinstance(item, PerfInterval):
+            raise LnstError("{} only accepts PerfInterval objects."
+                            .format(self.__class__.__name__))
+
+        if self._unit is None:
+            self._unit = item.unit
+        elif item.unit != self._unit:
+            raise LnstError("{} items must have the same unit."
+                            .format(self.__class__.__name__))
+
+        self.add_interval(item.value, item.duration, item.start_timestamp)
+
+    def extend(self, iterable):
+        for item in iterable:
+            self.append(item)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            starts = self._starts[i]
+            ends = self._ends[i]
+            ordered = ((self._ordered and (i.step or 1) > 0) or
+                       _is_sorted(starts, ends))
+            return self._from_columns(self._values[i], self._durations[i],
+                                      starts, ends, ordered)
+        return PerfInterval(self._values[i], self._durations[i], self._unit,
+                            self._starts[i])
+
+    def __iter__(self):
+        for value, duration, start in zip(self._values, self._durations,
+                                          self._starts):
+            yield PerfInterval(value, duration, self._unit, start)
+
+    def _from_columns(self, values, durations, starts, ends, ordered):
+        result = self.__class__(unit=self._unit)
+        result._values = values
+        result._durations = durations
+        result._starts = starts
+        result._ends = ends
+        result._ordered = ordered
+        return result
+
+    @property
+    def value(self):
+        return sum(self._values)
+
+    @property
+    def duration(self):
+        return sum(self._durations)
+
+    @property
+    def unit(self):
+        return self._unit
+
+    @property
+    def start_timestamp(self):
+        return self._starts[0]
+
+    @property
+    def end_timestamp(self):
+        return self._ends[-1]
+
+    @property
+    def std_deviation(self):
+        n = len(self)
+        if n <= 1:
+            return 0.0
+
+        try:
+            averages = list(map(operator.truediv, self._values,
+                                self._durations))
+        except ZeroDivisionError:
+            return std_deviation([i.average for i in self])
+
+        mean = math.fsum(averages) / n
+        deviations = [x - mean for x in averages]
+        return math.sqrt(math.sumprod(deviations, deviations) / (n - 1))
+
+    def time_slice(self, start, end):
+        if not self._ordered:
+            return self._time_slice_unordered(start, end)
+
+        # the intervals overlapping the slice are the ones ending after its
+        # start and starting before its end, only the first and the last
+        # few of them can be cut by its boundaries
+        first = bisect_right(self._ends, start)
+        last = bisect_left(self._starts, end)
+        if first >= last:
+            raise EmptySlice(
+                "current start, end {} {}; request start, end {}, {}".format(
+                    self.start_timestamp if len(self) else None,
+                    self.end_timestamp if len(self) else None,
+                    start, end,
+                )
+            )
+
+        result = self._from_columns(
+            self._values[first:last], self._durations[first:last],
+            self._starts[first:last], self._ends[first:last], True)
+
+        cut = set(range(bisect_left(result._starts, start)))
+        cut.update(range(bisect_right(result._ends, end), len(result)))
+        for i in cut:
+            new_start = max(result._starts[i], start)
+            new_end = min(result._ends[i], end)
+            new_duration = new_end - new_start
+            result._values[i] *= new_duration / result._durations[i]
+            result._durations[i] = new_duration
+            result._starts[i] = new_start
+            result._ends[i] = new_end
+        return result
+
+    def _time_slice_unordered(self, start, end):
+        result = self.__class__(unit=self._unit)
+        for item in self:
+            try:
+                result.append(item.time_slice(start, end))
+            except EmptySlice:
+                continue
+        if len(result) == 0:
+            raise EmptySlice(
+                "current start, end {} {}; request start, end {}, {}".format(
+                    self.start_timestamp, self.end_timestamp, start, end,
+                )
+            )
+        return result
+
+def _is_sorted(starts, ends):
+    return all(map(operator.le, starts, starts[1:])) and \
+        all(map(operator.le, ends, ends[1:]))
+
 def result_averages_difference(a, b):
     if a is None or b is None:
         return None
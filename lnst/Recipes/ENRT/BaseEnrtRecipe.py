@@ -1,4 +1,6 @@
+import time
 import pprint
+import logging
 import copy
 from contextlib import contextmanager
 from typing import Literal, Optional
@@ -179,6 +181,31 @@ class BaseEnrtRecipe(
         to generate cumulative results which can be statistically analyzed.
     :type perf_iterations: :any:`IntParam` (default 5)
 
+    :param perf_ci_target:
+        Parameter used by the :any:`generate_perf_configurations` generator.
+        Makes the performance tests adaptive, each measurement is repeated
+        until the confidence interval of the mean of every measured metric is
+        narrower than this percentage of the mean, at most
+        **perf_iterations** times. The 95% confidence intervals the tests
+        stop on miss the true mean more often than 5% of the time, up to
+        about 10% when the target is reached after a varying number of
+        repetitions, unless **perf_ci_corrected** is set.
+    :type perf_ci_target: :any:`FloatParam` (default None)
+
+    :param perf_ci_corrected:
+        Parameter used by the :any:`generate_perf_configurations` generator.
+        Corrects the confidence level of the adaptive performance tests for
+        the repeated checks of **perf_ci_target**, so the final intervals
+        miss the mean at most 5% of the time. The corrected intervals are
+        much wider, so the tests often run all **perf_iterations**.
+    :type perf_ci_corrected: :any:`BoolParam` (default False)
+
+    :param perf_min_iterations:
+        Parameter used by the :any:`generate_perf_configurations` generator.
+        Minimal number of repetitions of the adaptive performance tests, see
+        **perf_ci_target**.
+    :type perf_min_iterations: :any:`IntParam` (default 2)
+
     :param perf_test_simulation:
         Parameter that will switch the performance testing into a simulation
         mode only - no measurements will actually be started and they'll simply
@@ -197,6 +224,9 @@ class BaseEnrtRecipe(
 
     # generic perf test params
     perf_iterations = IntParam(default=5)
+    perf_ci_target = FloatParam()
+    perf_min_iterations = IntParam(default=2)
+    perf_ci_corrected = BoolParam(default=False)
     perf_test_simulation = BoolParam(default=False)
 
     def test(self):
@@ -463,6 +493,9 @@ class BaseEnrtRecipe(
                 iterations=self.params.perf_iterations,
                 parent_recipe_config=copy.deepcopy(config),
                 simulate_measurements=self.params.perf_test_simulation,
+                min_iterations=self.params.perf_min_iterations,
+                ci_target=self.params.get("perf_ci_target", None),
+                ci_corrected=self.params.perf_ci_corrected,
             )
             self.register_perf_evaluators(perf_conf)
 
@@ -525,13 +558,14 @@ class BaseEnrtRecipe(
         """
         return [NonzeroFlowEvaluator()]
 
-    def wait_tentative_ips(self, devices):
-        def condition():
-            return all(
-                [not ip.is_tentative for dev in devices for ip in dev.ips]
-            )
-
-        self.ctl.wait_for_condition(condition, timeout=5)
+    def wait_tentative_ips(self, devices, timeout=5):
+        deadline = time.monotonic() + timeout
+        for dev in devices:
+            # the agents wait for the address notifications themselves
+            remaining = max(deadline - time.monotonic(), 0)
+            if dev.wait_for_tentative_ips(timeout=remaining) is False:
+                logging.error("Waiting for tentative ips of {} timed out!"
+                              .format(dev.name))
 
     def _create_reverse_ping(self, pconf):
         return PingConf(
@@ -67,14 +67,15 @@ class LongLivedConnectionsMixin(BasePerfTestTweakMixin):
         host1.eth0.down()
         host2.eth0.down()
         for host in [host1, host2]:
-            for _ in range(self.servers_count):
-                ipv4 = next(ipv4_addr)
-                ipv6 = next(ipv6_addr)
-
-                host.eth0.ip_add(ipv4)
-                host.eth0.ip_add(ipv6)
-                config.long_lived_ips[host]["ipv4"].append(ipv4)
-                config.long_lived_ips[host]["ipv6"].append(ipv6)
+            with host.batch():
+                for _ in range(self.servers_count):
+                    ipv4 = next(ipv4_addr)
+                    ipv6 = next(ipv6_addr)
+
+                    host.eth0.ip_add(ipv4)
+                    host.eth0.ip_add(ipv6)
+                    config.long_lived_ips[host]["ipv4"].append(ipv4)
+                    config.long_lived_ips[host]["ipv6"].append(ipv6)
 
         host1.eth0.up()
         host2.eth0.up()
@@ -1,20 +1,119 @@
 import re
 import time
 import signal
+import operator
+from array import array
 from time import sleep
-from lnst.Common.Parameters import IntParam
+from lnst.Common.Parameters import IntParam, BoolParam
 from lnst.Tests.BaseTestModule import BaseTestModule, InterruptException
 
 def sigint_handler(signum, frame):
     raise InterruptException()
 
+CPU_STAT_FIELDS = ["user", "nice", "system", "idle", "iowait", "irq",
+                   "softirq", "steal", "guest", "guest_nice"]
+
+class CompactCPUStats(object):
+    """Collects the differences of the cpu counters of /proc/stat samples
+
+    See the compact mode of CPUStatMonitor for the format of the result.
+    """
+    def __init__(self):
+        self._timestamps = array("d")
+        self._counters = array("q")
+        self._cpus = None
+        self._fields = None
+        self._prev = None
+
+    def add_sample(self, timestamp, data):
+        """Adds the /proc/stat content data read at timestamp, returns its
+        cpu lines"""
+        lines = self._cpu_lines(data)
+        if self._cpus is None:
+            self._cpus = [l.split(None, 1)[0].decode() for l in lines]
+            self._fields = CPU_STAT_FIELDS[:len(lines[0].split()) - 1]
+
+        cur = self._parse_counters(lines)
+        self._timestamps.append(timestamp)
+        if self._prev is not None:
+            self._counters.extend(map(operator.sub, cur, self._prev))
+        self._prev = cur
+        return lines
+
+    def result(self):
+        # the differences fit 32 bits unless the intervals are very long
+        try:
+            counters = array("i", self._counters)
+        except OverflowError:
+            counters = self._counters
+
+        return {
+            "cpus": self._cpus,
+            "fields": self._fields,
+            "timestamps": self._timestamps,
+            "counters": counters,
+        }
+
+    @staticmethod
+    def _cpu_lines(data):
+        # the cpu lines are at the beginning of /proc/stat
+        lines = data.split(b"\n", data.count(b"cpu"))
+        end = 0
+        while end < len(lines) and lines[end].startswith(b"cpu"):
+            end += 1
+        return lines[:end]
+
+    def _parse_counters(self, lines):
+        field_count = len(self._fields)
+        if len(lines) == len(self._cpus):
+            counters = []
+            for line in lines:
+                counters.extend(map(int, line.split()[1:field_count + 1]))
+            return counters
+
+        # a cpu went offline or online, the counters are matched by the
+        # cpu names, the missing cpus keep their previous counters
+        by_cpu = {}
+        for line in lines:
+            parts = line.split()
+            by_cpu[parts[0].decode()] = [int(i) for i in
+                                         parts[1:field_count + 1]]
+        counters = []
+        for i, cpu in enumerate(self._cpus):
+            if cpu in by_cpu:
+                counters.extend(by_cpu[cpu])
+            else:
+                counters.extend(
+                    self._prev[i * field_count:(i + 1) * field_count])
+        return counters
+
 class CPUStatMonitor(BaseTestModule):
+    """Samples the cpu lines of /proc/stat
+
+    By default the result contains the raw text of the samples in
+    "raw_data" and the per cpu differences between the consecutive
+    samples as dictionaries in "data".
+
+    With compact set only the "compact" entry is returned, a dictionary
+    with the "cpus" and "fields" names, the "timestamps" of the samples
+    (array of floats) and the "counters" (array of integers) holding the
+    differences of each field of each cpu between the consecutive
+    samples, i.e. the value of field f of cpu c in the interval
+    following sample s is at index
+    (s * len(cpus) + c) * len(fields) + f. The raw text is added only when
+    raw_data is set as well.
+    """
     #number of miliseconds to sleep between each sample
     interval = IntParam(default=1000)
+    compact = BoolParam(default=False)
+    raw_data = BoolParam(default=False)
 
     def run(self):
         self._res_data = {}
 
+        if self.params.compact:
+            return self._run_compact()
+
         raw_samples = []
         old_handler = None
         try:
@@ -42,6 +141,35 @@ class CPUStatMonitor(BaseTestModule):
 
         return True
 
+    def _run_compact(self):
+        stats = CompactCPUStats()
+        raw_samples = []
+        old_handler = None
+        try:
+            old_handler = signal.signal(signal.SIGINT, sigint_handler)
+            with open("/proc/stat", "rb", buffering=0) as stat:
+                while True:
+                    timestamp = time.time()
+                    lines = stats.add_sample(timestamp, stat.read())
+                    stat.seek(0)
+                    if self.params.raw_data:
+                        raw_samples.append({
+                            "timestamp": timestamp,
+                            "stat": b"".join(l + b"\n" for l in lines).decode()
+                            })
+                    sleep(self.params.interval / float(1000))
+        except InterruptException:
+            pass
+        finally:
+            if old_handler is not None:
+                signal.signal(signal.SIGINT, old_handler)
+
+        self._res_data["compact"] = stats.result()
+        if self.params.raw_data:
+            self._res_data["raw_data"] = raw_samples
+
+        return True
+
     def _process_samples(self, samples):
         result = []
         prev_sample = samples[0]
@@ -12,18 +12,163 @@ sdobron@redhat.com (Samuel Dobron)
 """
 
 
+import os
 import time
+import struct
+import socket
 import signal
 import logging
 
 from lnst.Tests.BaseTestModule import BaseTestModule, InterruptException
+from lnst.Tests.BaseTestModule import TestModuleError
 from lnst.Common.Parameters import DeviceParam, FloatParam, ListParam
+from lnst.Common.Parameters import ChoiceParam, StrParam
+
+RTM_GETSTATS = 94
+NLMSG_ERROR = 2
+NLM_F_REQUEST = 1
+IFLA_STATS_LINK_64 = 1
+
+# struct rtnl_link_stats64, newer kernels may append more fields, older ones
+# don't report the last ones, e.g. rx_otherhost_dropped was added in 5.19
+LINK_STATS64_FIELDS = [
+    "rx_packets", "tx_packets", "rx_bytes", "tx_bytes", "rx_errors",
+    "tx_errors", "rx_dropped", "tx_dropped", "multicast", "collisions",
+    "rx_length_errors", "rx_over_errors", "rx_crc_errors", "rx_frame_errors",
+    "rx_fifo_errors", "rx_missed_errors", "tx_aborted_errors",
+    "tx_carrier_errors", "tx_fifo_errors", "tx_heartbeat_errors",
+    "tx_window_errors", "rx_compressed", "tx_compressed", "rx_nohandler",
+    "rx_otherhost_dropped",
+]
 
 
 def sigint_handler(signum, frame):
     raise InterruptException()
 
 
+class NetlinkStatsReader(object):
+    """Reads the IFLA_STATS_LINK_64 statistics of the given devices
+
+    Sends a RTM_GETSTATS request filtered to a single ifindex for each of
+    the devices, so only the requested statistics are dumped by the kernel.
+    Stats missing from the structure reported by an older kernel are read
+    as 0, the same way the kernel reports counters a driver doesn't keep.
+    """
+    def __init__(self, ifindexes, stats):
+        self._ifindexes = ifindexes
+        self._stats = [LINK_STATS64_FIELDS.index(stat) for stat in stats]
+        self._stat_names = stats
+        self._missing_logged = False
+        self._seq = 0
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                   socket.NETLINK_ROUTE)
+        self._sock.bind((0, 0))
+
+    def read(self):
+        """Returns the list of the stats values of each device
+
+        The replies are matched to the requests by their sequence numbers,
+        all of them are received before a failed request raises so that they
+        aren't read by the next call. Replies to the requests of an earlier
+        interrupted call are skipped.
+        """
+        pending = {}
+        for i, ifindex in enumerate(self._ifindexes):
+            self._seq += 1
+            pending[self._seq] = i
+            # nlmsghdr followed by struct if_stats_msg
+            self._sock.send(struct.pack("=IHHIIBBHII", 28, RTM_GETSTATS,
+                                        NLM_F_REQUEST, self._seq, 0,
+                                        socket.AF_UNSPEC, 0, 0, ifindex,
+                                        1 << (IFLA_STATS_LINK_64 - 1)))
+
+        results = [None] * len(self._ifindexes)
+        error = None
+        while pending:
+            for seq, msg in self._split_messages(self._sock.recv(65536)):
+                i = pending.pop(seq, None)
+                if i is None:
+                    continue
+                try:
+                    results[i] = self._parse_reply(msg)
+                except TestModuleError as e:
+                    error = error or e
+        if error is not None:
+            raise error
+        return results
+
+    def _split_messages(self, data):
+        """Yields the (sequence number, message) pairs of a recv buffer"""
+        offset = 0
+        while offset + 16 <= len(data):
+            length, seq = struct.unpack_from("=I4xI", data, offset)
+            if length < 16:
+                raise TestModuleError("Malformed netlink message")
+            yield seq, data[offset:offset + length]
+            offset += (length + 3) & ~3
+
+    def _parse_reply(self, data):
+        length, msg_type = struct.unpack_from("=IH", data)
+        if msg_type == NLMSG_ERROR:
+            error = -struct.unpack_from("=i", data, 16)[0]
+            raise TestModuleError("RTM_GETSTATS request failed: {}".format(
+                os.strerror(error)))
+
+        offset = 28
+        while offset < length:
+            attr_len, attr_type = struct.unpack_from("=HH", data, offset)
+            if attr_type == IFLA_STATS_LINK_64:
+                values = struct.unpack_from(
+                    "={}Q".format((attr_len - 4) // 8), data, offset + 4)
+                if not self._missing_logged and max(self._stats) >= len(values):
+                    self._missing_logged = True
+                    logging.warning(
+                        "The kernel doesn't report the stats {}, reading "
+                        "them as 0".format(", ".join(
+                            name for name, i in zip(self._stat_names,
+                                                    self._stats)
+                            if i >= len(values))))
+                return [values[i] if i < len(values) else 0
+                        for i in self._stats]
+            offset += (attr_len + 3) & ~3
+        raise TestModuleError("RTM_GETSTATS reply without IFLA_STATS_LINK_64")
+
+    def close(self):
+        self._sock.close()
+
+
+class SysfsStatsReader(object):
+    """Reads the statistics of the given devices from sysfs
+
+    The /sys/class/net/<dev>/statistics/ files are opened once and read with
+    pread. /sys has to be mounted in the network namespace of the devices.
+    """
+    def __init__(self, names, stats):
+        self._fds = []
+        for name in names:
+            fds = []
+            for stat in stats:
+                path = "/sys/class/net/{}/statistics/{}".format(name, stat)
+                try:
+                    fds.append(os.open(path, os.O_RDONLY))
+                except OSError as e:
+                    self.close()
+                    raise TestModuleError("Can't open {}: {}".format(
+                        path, os.strerror(e.errno)))
+            self._fds.append(fds)
+
+    def read(self):
+        """Returns the list of the stats values of each device"""
+        return [[int(os.pread(fd, 32, 0)) for fd in fds]
+                for fds in self._fds]
+
+    def close(self):
+        for fds in self._fds:
+            for fd in fds:
+                os.close(fd)
+        self._fds = []
+
+
 class InterfaceStatsMonitor(BaseTestModule):
     """
     Test module for gathering interface statistics on a device.
@@ -35,44 +180,87 @@ class InterfaceStatsMonitor(BaseTestModule):
     Only standard netlink stats are supported. Vendor specific
     stats are not supported as these are not exported via netlink.
     If you need them, use ethtool instead.
+
+    Either :attr:`device` or :attr:`devices` has to be set. The result is
+    the list of samples of the device, with :attr:`devices` it's
+    a dictionary of the lists of samples keyed by the device names. The
+    stats are read by a RTM_GETSTATS request for each device or, with
+    :attr:`source` set to "sysfs", from the statistics files of the devices
+    in /sys. The samples are scheduled and their durations are measured
+    with CLOCK_MONOTONIC, the timestamps are converted to the wall clock
+    time so they can be compared with the other results.
     """
 
-    device = DeviceParam(mandatory=True)
+    device = DeviceParam()
+    devices = ListParam(type=DeviceParam())
     interval = FloatParam(default=1.0)
     stats = ListParam(default=["rx_bytes", "tx_bytes", "rx_packets", "tx_packets"])
+    source = ChoiceParam(type=StrParam, choices={"netlink", "sysfs"},
+                         default="netlink")
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._res_data = []
 
+        if ("device" in self.params) == ("devices" in self.params):
+            raise TestModuleError(
+                "Exactly one of the parameters device and devices has to be set!")
+
+        for stat in self.params.stats:
+            if stat not in LINK_STATS64_FIELDS:
+                raise TestModuleError("Unknown interface stat {}".format(stat))
+
     def run(self):
+        if "device" in self.params:
+            devices = [self.params.device]
+        else:
+            devices = self.params.devices
+        names = [dev.name for dev in devices]
+        stats = self.params.stats
+
         logging.info(
-            f"Gathering stats on device {self.params.device.name} until interrupted"
+            f"Gathering stats on devices {', '.join(names)} until interrupted"
         )
 
-        raw_samples = []
+        if self.params.source == "sysfs":
+            reader = SysfsStatsReader(names, stats)
+        else:
+            reader = NetlinkStatsReader([dev.ifindex for dev in devices], stats)
+
+        raw_samples = [[] for dev in devices]
         old_handler = None
         try:
             old_handler = signal.signal(signal.SIGINT, sigint_handler)
+            clock_offset = time.time() - time.monotonic()
+            next_sample = time.monotonic()
             while True:
-                self.params.device._if_manager.rescan_devices()
-                # ^ needs to rescan devices to update netlink msg
-                # where stats are fetched from
-
-                res = self.params.device.link_stats64
+                now = time.monotonic()
+                values = reader.read()
 
-                sample = {"timestamp": time.time()}
-                for stat in self.params.stats:
-                    sample |= {stat: res[stat]}
+                timestamp = now + clock_offset
+                for dev_samples, dev_values in zip(raw_samples, values):
+                    sample = {"timestamp": timestamp}
+                    sample |= zip(stats, dev_values)
+                    dev_samples.append(sample)
 
-                raw_samples.append(sample)
-                time.sleep(self.params.interval)
+                # the samples are scheduled on a fixed grid so that the
+                # time spent reading doesn't accumulate
+                next_sample += self.params.interval
+                delay = next_sample - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_sample = time.monotonic()
         except InterruptException:
             pass
         finally:
             if old_handler is not None:
                 signal.signal(signal.SIGINT, old_handler)
+            reader.close()
 
-        self._res_data = raw_samples
+        if "device" in self.params:
+            self._res_data = raw_samples[0]
+        else:
+            self._res_data = dict(zip(names, raw_samples))
 
         return True
@@ -1,13 +1,18 @@
 import time
-import select
+import errno
+import signal
 import socket
 import logging
 import resource
+import selectors
 import threading
+import multiprocessing
 
 from .BaseTestModule import BaseTestModule
 from lnst.Common.Parameters import IntParam, IpParam
 
+IP_BIND_ADDRESS_NO_PORT = 0x18
+
 
 class BaseLongLivedTestModule(BaseTestModule):
     server_ip = IpParam(mandatory=True)
@@ -49,88 +54,208 @@ class BaseLongLivedTestModule(BaseTestModule):
 
 
 class LongLivedServer(BaseLongLivedTestModule):
+    """
+    Accepts and holds connections_count TCP connections.
+
+    The listening socket and the accepted connections are watched through
+    a selectors (epoll) event loop so the number of connections isn't
+    limited by select()'s FD_SETSIZE. With workers > 1 the server runs that
+    many processes, each with its own listening socket bound to the same
+    port with SO_REUSEPORT, so that the kernel spreads the incoming
+    connections (and the per process file descriptors) between them.
+    """
+    workers = IntParam(default=1)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._running = False
-        self._connections = []
+        self._connections_total = 0
 
-        self._polling_thread = None
-        self._listening_thread = None
+        self._serving_thread = None
+        self._worker_processes = []
+        self._stop_event = None
+        self._counts_queue = None
 
     def _start(self):
         self._running = True
-        self._listening_thread = threading.Thread(target=self._listen)
-        self._listening_thread.start()
 
-        self._polling_thread = threading.Thread(target=self._poll_connections)
-        self._polling_thread.start()
+        if self.params.workers <= 1:
+            self._serving_thread = threading.Thread(
+                target=self._serve, args=(lambda: not self._running,)
+            )
+            self._serving_thread.start()
+            return
+
+        # fork explicitly, the module instance isn't meant to be pickled
+        ctx = multiprocessing.get_context("fork")
+        self._stop_event = ctx.Event()
+        self._counts_queue = ctx.Queue()
+        for _ in range(self.params.workers):
+            process = ctx.Process(target=self._serve_worker)
+            process.start()
+            self._worker_processes.append(process)
 
     def _stop(self):
         logging.info("Stopping LongLivedServer server")
         self._running = False
 
-        self._listening_thread.join()
-        self._polling_thread.join()
-
-        self._result = (
-            True if len(self._connections) == self.params.connections_count else False
-        )
-
-        for conn in self._connections:
-            conn.close()
-
-    def _listen(self):
-        with socket.socket(
-            self.params.server_ip.family, socket.SOCK_STREAM
-        ) as server_socket:
-            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server_socket.bind((str(self.params.server_ip), self.params.server_port))
-            server_socket.listen(65536)
-
-            logging.info(
-                f"TCP server started on {self.params.server_ip}:{self.params.server_port}"
+        if self._serving_thread is not None:
+            self._serving_thread.join()
+        else:
+            self._stop_event.set()
+            self._connections_total = sum(
+                self._counts_queue.get() for _ in self._worker_processes
             )
-            while self._running:
-                try:
-                    ready, _, _ = select.select([server_socket], [], [], 1)
-                except ValueError:
-                    continue
-
-                if not ready:
-                    time.sleep(1)  # prevent active polling
-                    continue
-
-                for conn in ready:
-                    client_socket, client_address = server_socket.accept()
-                    client_socket.setblocking(False)
-
-                    self._connections.append(client_socket)
-
-    def _poll_connections(self):
-        while self._running:  # no need to lock due to GIL
-            if not self._connections:
-                time.sleep(1)
-                continue
+            for process in self._worker_processes:
+                process.join()
+
+        logging.info(f"LongLivedServer accepted {self._connections_total} connections")
+        self._res_data = {"connections": self._connections_total}
+        self._result = self._connections_total == self.params.connections_count
+
+    def _serve_worker(self):
+        # the parent process handles the interrupt and stops the workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self._serve(self._stop_event.is_set)
+        self._counts_queue.put(self._connections_total)
+
+    def _serve(self, should_stop):
+        server_socket = socket.socket(self.params.server_ip.family, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.params.workers > 1:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((str(self.params.server_ip), self.params.server_port))
+        server_socket.listen(65536)
+        server_socket.setblocking(False)
+
+        logging.info(
+            f"TCP server started on {self.params.server_ip}:{self.params.server_port}"
+        )
 
+        connections = {}
+        selector = selectors.DefaultSelector()
+        selector.register(server_socket, selectors.EVENT_READ)
+        try:
+            while not should_stop():
+                for key, _ in selector.select(timeout=1):
+                    if key.fileobj is server_socket:
+                        self._accept(server_socket, selector, connections)
+                    else:
+                        self._check_closed(key.fileobj, selector, connections)
+        finally:
+            selector.close()
+            server_socket.close()
+            for conn in connections.values():
+                conn.close()
+
+    def _accept(self, server_socket, selector, connections):
+        while True:
             try:
-                ready, _, _ = select.select(self._connections, [], [], 1)
-            except ValueError:
-                continue
+                client_socket, _ = server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if e.errno in [errno.EMFILE, errno.ENFILE]:
+                    logging.error(f"Can't accept more connections: {e}")
+                    time.sleep(1)  # the listening socket stays readable
+                    return
+                raise
+
+            client_socket.setblocking(False)
+            connections[client_socket.fileno()] = client_socket
+            selector.register(client_socket, selectors.EVENT_READ)
+            self._connections_total += 1
+
+    def _check_closed(self, conn, selector, connections):
+        # clients don't send any data, readable means closed by the peer
+        try:
+            data = conn.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            selector.unregister(conn)
+            del connections[conn.fileno()]
+            conn.close()
 
 
 class LongLivedClient(BaseLongLivedTestModule):
+    """
+    Opens connections_count TCP connections to the LongLivedServer.
+
+    The connections are established concurrently using non-blocking
+    connect() calls, at most max_pending of them at once, optionally limited
+    to connect_rate new connections per second (0 means no limit). The
+    achieved connection setup rate is logged and reported in the result
+    data.
+    """
     client_ip = IpParam(mandatory=True)
+    connect_rate = IntParam(default=0)
+    max_pending = IntParam(default=1024)
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._connections = []
 
     def _start(self):
-        for _ in range(self.params.connections_count):
-            conn = self._start_connection()
-            self._connections.append(conn)
-
-        logging.info(f"All connections established by {self}")
+        count = self.params.connections_count
+        rate = self.params.connect_rate
+        failed = 0
+        started = 0
+        pending = {}
+
+        selector = selectors.DefaultSelector()
+        start_time = time.monotonic()
+        try:
+            while started < count or pending:
+                now = time.monotonic()
+                while (started < count and len(pending) < self.params.max_pending
+                       and (not rate or start_time + started / rate <= now)):
+                    started += 1
+                    try:
+                        sck = self._start_connection()
+                    except OSError as e:
+                        logging.error(f"Connection attempt failed: {e}")
+                        failed += 1
+                        continue
+                    pending[sck.fileno()] = sck
+                    selector.register(sck, selectors.EVENT_WRITE)
+
+                timeout = 1
+                if rate and started < count:
+                    timeout = max(start_time + started / rate - now, 0)
+
+                for key, _ in selector.select(timeout=timeout):
+                    sck = key.fileobj
+                    selector.unregister(sck)
+                    del pending[sck.fileno()]
+
+                    error = sck.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if error:
+                        logging.error(
+                            f"Connection attempt failed: {errno.errorcode.get(error, error)}"
+                        )
+                        sck.close()
+                        failed += 1
+                    else:
+                        self._connections.append(sck)
+        finally:
+            selector.close()
+
+        duration = time.monotonic() - start_time
+        setup_rate = len(self._connections) / duration if duration else 0
+        self._res_data = {
+            "connections": len(self._connections),
+            "failed": failed,
+            "setup_duration": duration,
+            "setup_rate": setup_rate,
+        }
+        logging.info(
+            f"{len(self._connections)} connections established by {self} "
+            f"in {duration:.2f}s ({setup_rate:.0f} connections/s), {failed} failed"
+        )
 
     def _stop(self):
         self._result = (
@@ -144,10 +269,17 @@ class LongLivedClient(BaseLongLivedTestModule):
 
     def _start_connection(self):
         sck = socket.socket(self.params.server_ip.family, socket.SOCK_STREAM)
-        sck.setsockopt(socket.IPPROTO_IP, 0x18, 1)
-        sck.bind(
-            (str(self.params.client_ip), 0)
-        )  # needs to be binded to specific IP to respect flow IPs
-        sck.connect((str(self.params.server_ip), self.params.server_port))
+        try:
+            sck.setsockopt(socket.IPPROTO_IP, IP_BIND_ADDRESS_NO_PORT, 1)
+            sck.bind(
+                (str(self.params.client_ip), 0)
+            )  # needs to be binded to specific IP to respect flow IPs
+            sck.setblocking(False)
+            error = sck.connect_ex((str(self.params.server_ip), self.params.server_port))
+            if error not in [0, errno.EINPROGRESS]:
+                raise OSError(error, errno.errorcode.get(error, str(error)))
+        except OSError:
+            sck.close()
+            raise
 
         return sck
@@ -0,0 +1,76 @@
+import os
+import sys
+import hashlib
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock
+
+from lnst.Common.LnstError import LnstError
+from lnst.Common.ResourceCache import ResourceCache
+from lnst.Agent.Agent import RemoteMethods
+
+
+class MulticallTest(TestCase):
+    def setUp(self):
+        self.methods = RemoteMethods.__new__(RemoteMethods)
+        self.methods.echo = Mock(side_effect=lambda value: value)
+        self.methods.fail = Mock(side_effect=LnstError("failed"))
+
+    def test_results_in_order(self):
+        results = self.methods.multicall([("echo", [1], {}),
+                                          ("echo", [], {"value": 2})])
+        self.assertEqual(results, [{"result": 1}, {"result": 2}])
+
+    def test_continues_after_error(self):
+        results = self.methods.multicall([("echo", [1], {}),
+                                          ("fail", [], {}),
+                                          ("echo", [3], {})])
+        self.assertEqual(results[0], {"result": 1})
+        self.assertIsInstance(results[1]["exception"], LnstError)
+        self.assertEqual(results[2], {"result": 3})
+
+    def test_stop_on_error(self):
+        results = self.methods.multicall([("fail", [], {}),
+                                          ("echo", [2], {})],
+                                         stop_on_error=True)
+        self.assertEqual(len(results), 1)
+        self.methods.echo.assert_not_called()
+
+    def test_unsupported_methods(self):
+        for name in ["missing", "_private", "multicall"]:
+            results = self.methods.multicall([(name, [], {})])
+            self.assertIsInstance(results[0]["exception"], LnstError)
+
+
+class LoadCachedModulesTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.methods = RemoteMethods.__new__(RemoteMethods)
+        self.methods._cache = ResourceCache(
+            os.path.join(self.tmpdir.name, "cache"), 0, max_size=150)
+        self.methods._dynamic_modules = {}
+
+    def module_data(self, value):
+        data = "value = {}\n".format(value).encode()
+        return data + b"#" * (99 - len(data)) + b"\n"
+
+    def test_new_resources_dont_evict_used_modules(self):
+        path = os.path.join(self.tmpdir.name, "lnst_test_cached_a")
+        with open(path, "wb") as f:
+            f.write(self.module_data(1))
+        cached = self.methods._cache.add_file_entry(path, "lnst_test_cached_a")
+        data = self.module_data(2)
+        new = hashlib.sha256(data).hexdigest()
+
+        manifest = {"lnst_test_cached_a": cached, "lnst_test_cached_b": new}
+        self.assertEqual(self.methods.missing_resources(manifest),
+                         ["lnst_test_cached_b"])
+        for name in manifest:
+            self.addCleanup(sys.modules.pop, name, None)
+        self.methods.load_cached_modules(
+            list(manifest.items()), resources={"lnst_test_cached_b": data})
+
+        modules = self.methods._dynamic_modules
+        self.assertEqual(modules["lnst_test_cached_a"].value, 1)
+        self.assertEqual(modules["lnst_test_cached_b"].value, 2)
@@ -0,0 +1,373 @@
+import os
+import time
+import errno
+from unittest import TestCase, skipUnless
+from unittest.mock import Mock, patch
+
+from pyroute2 import IPRoute
+from pyroute2.netlink import NLMSG_ERROR
+from pyroute2.netlink.exceptions import NetlinkError
+from pyroute2.netlink.rtnl import RTM_NEWLINK, RTM_DELLINK, RTM_NEWADDR
+from pyroute2.netlink.rtnl.ifinfmsg import ifinfmsg
+
+from lnst.Common.DeviceError import DeviceError, DeviceNotFound
+from lnst.Devices import device_classes
+from lnst.Devices.Device import Device
+from lnst.Agent.InterfaceManager import InterfaceManager, PF_BRIDGE, NL_HEADER
+
+from tests.Agent.NetnsExecutor_test import run_forked
+
+
+class FakeDevice(object):
+    def __init__(self, if_manager):
+        self.disabled = False
+
+    def _init_netlink(self, nl_msg):
+        self._nl_msg = nl_msg
+        self.ifindex = nl_msg['index']
+
+    def _update_netlink(self, nl_msg):
+        if nl_msg['header']['type'] == RTM_NEWLINK:
+            self._nl_msg = nl_msg
+
+    def _get_if_data(self):
+        return {"ifindex": self.ifindex}
+
+    def _get_pushed_state(self):
+        return {"name": self._nl_msg.get_attr("IFLA_IFNAME")}
+
+    def _disable(self):
+        self.disabled = True
+
+
+def link_msg(msg_type, index, name, hwaddr="52:54:00:00:00:01", family=0,
+             attrs=()):
+    msg = ifinfmsg()
+    msg['header'] = {'type': msg_type}
+    msg['index'] = index
+    msg['family'] = family
+    msg['ifi_type'] = 1
+    msg['attrs'] = [("IFLA_IFNAME", name), ("IFLA_ADDRESS", hwaddr)]
+    msg['attrs'].extend(attrs)
+    return msg
+
+
+def interface_manager():
+    if_manager = InterfaceManager(Mock())
+    if_manager.add_device_class("Device", FakeDevice)
+    if_manager.add_device_class("LoopbackDevice", FakeDevice)
+    return if_manager
+
+
+def agent_interface_manager():
+    """an InterfaceManager with the device classes the agent uses, synced
+    with the current netns"""
+    if_manager = InterfaceManager(Mock())
+    for name, cls in device_classes:
+        if_manager.add_device_class(name, cls)
+    if_manager.resync_devices()
+    return if_manager
+
+
+class DeviceIndexTest(TestCase):
+    def setUp(self):
+        self.if_manager = interface_manager()
+        self.sent = self.if_manager._server_handler.send_data_to_ctl
+
+    def handle(self, msg):
+        self.if_manager._handle_netlink_msg(msg)
+
+    def sent_types(self):
+        return [call.args[0]["type"] for call in self.sent.call_args_list]
+
+    def test_new_link(self):
+        self.handle(link_msg(RTM_NEWLINK, 100, "test0"))
+
+        dev = self.if_manager._devices[100]
+        self.assertTrue(dev.disabled)
+        self.assertIs(self.if_manager._devices[
+            self.if_manager._name_index["test0"]], dev)
+        self.assertEqual(list(self.if_manager._hwaddr_index[
+            "52:54:00:00:00:01"]), [100])
+        self.assertEqual(self.sent_types(), ["dev_updated", "dev_created"])
+
+    def test_rename_and_hwaddr_change(self):
+        self.handle(link_msg(RTM_NEWLINK, 100, "test0"))
+        self.sent.reset_mock()
+        self.handle(link_msg(RTM_NEWLINK, 100, "test1", "52:54:00:00:00:02"))
+
+        self.assertNotIn("test0", self.if_manager._name_index)
+        self.assertEqual(self.if_manager._name_index["test1"], 100)
+        self.assertNotIn("52:54:00:00:00:01", self.if_manager._hwaddr_index)
+        self.assertIn(100, self.if_manager._hwaddr_index["52:54:00:00:00:02"])
+        self.sent.assert_called_once_with({"type": "dev_updated",
+                                           "ifindex": 100,
+                                           "attrs": {"name": "test1"}})
+
+    def test_unchanged_state_not_pushed(self):
+        self.handle(link_msg(RTM_NEWLINK, 100, "test0"))
+        self.sent.reset_mock()
+        self.handle(link_msg(RTM_NEWLINK, 100, "test0"))
+        self.sent.assert_not_called()
+
+    def test_shared_hwaddr(self):
+        self.handle(link_msg(RTM_NEWLINK, 100, "test0"))
+        self.handle(link_msg(RTM_NEWLINK, 101, "test1"))
+        self.handle(link_msg(RTM_DELLINK, 100, "test0"))
+
+        self.assertEqual(list(self.if_manager._hwaddr_index[
+            "52:54:00:00:00:01"]), [101])
+
+    def test_del_link(self):
+        self.handle(link_msg(RTM_NEWLINK, 100, "test0"))
+        dev = self.if_manager._devices[100]
+        self.handle(link_msg(RTM_DELLINK, 100, "test0"))
+
+        self.assertTrue(dev._deleted)
+        self.assertNotIn(100, self.if_manager._devices)
+        self.assertNotIn("test0", self.if_manager._name_index)
+        self.assertNotIn(100, self.if_manager._pushed_state)
+        self.assertEqual(self.sent.call_args.args[0],
+                         {"type": "dev_deleted", "ifindex": 100})
+
+    def test_netns_move(self):
+        self.handle(link_msg(RTM_NEWLINK, 100, "test0"))
+        self.handle(link_msg(RTM_DELLINK, 100, "test0",
+                             attrs=[("IFLA_NEW_NETNSID", 1),
+                                    ("IFLA_NEW_IFINDEX", 5)]))
+
+        self.assertEqual(self.sent.call_args.args[0],
+                         {"type": "dev_netns_changed", "ifindex": 100,
+                          "new_ifindex": 5})
+
+    def test_bridge_messages_ignored(self):
+        self.handle(link_msg(RTM_NEWLINK, 100, "test0"))
+        self.handle(link_msg(RTM_NEWLINK, 100, "port0", family=PF_BRIDGE))
+        self.handle(link_msg(RTM_DELLINK, 100, "port0", family=PF_BRIDGE))
+
+        self.assertEqual(self.if_manager._name_index["test0"], 100)
+        self.assertIn(100, self.if_manager._devices)
+
+
+class FakeRequestSocket(object):
+    """acknowledges the requests of a batch in reverse order, the requests
+    at the positions in failing get an EEXIST error"""
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.sent = []
+        self.replies = []
+
+    def sendto(self, data, address):
+        offset = 0
+        while offset < len(data):
+            header = NL_HEADER.unpack_from(data, offset)
+            self.sent.append(header)
+            offset += (header[0] + 3) & ~3
+
+        # an unrelated notification and a stale ACK are skipped
+        self.replies = [{'header': {'type': RTM_NEWADDR,
+                                    'sequence_number': 0}},
+                        {'header': {'type': NLMSG_ERROR,
+                                    'sequence_number': self.sent[0][3] - 1,
+                                    'error': NetlinkError(errno.EINVAL)}}]
+        for i, header in reversed(list(enumerate(self.sent))):
+            error = NetlinkError(errno.EEXIST) if i in self.failing else None
+            self.replies.append({'header': {'type': NLMSG_ERROR,
+                                            'sequence_number': header[3],
+                                            'error': error}})
+
+    def get(self):
+        replies, self.replies = self.replies, []
+        return replies
+
+
+class IprBatchTest(TestCase):
+    def setUp(self):
+        self.if_manager = interface_manager()
+
+    def batch(self, requests, nl_socket):
+        with patch.object(self.if_manager, "_get_request_socket",
+                          return_value=nl_socket), \
+             patch("lnst.Agent.InterfaceManager.select.select",
+                   return_value=([nl_socket], [], [])):
+            return self.if_manager.ipr_batch(requests)
+
+    def test_renumbering(self):
+        requests = [("addr", "add", {"index": 1,
+                                     "address": "192.0.2.{}".format(i),
+                                     "prefixlen": 24}) for i in range(20)]
+        nl_socket = FakeRequestSocket(failing=[3, 17])
+        errors = self.batch(requests, nl_socket)
+
+        seqs = [header[3] for header in nl_socket.sent]
+        self.assertEqual(len(seqs), 20)
+        self.assertEqual(len(set(seqs)), 20)
+        self.assertEqual([i for i, error in enumerate(errors)
+                          if error is not None], [3, 17])
+        self.assertEqual(errors[3].code, errno.EEXIST)
+
+        # the next batch doesn't reuse the sequence numbers
+        nl_socket = FakeRequestSocket()
+        self.assertEqual(self.batch(requests[:2], nl_socket), [None, None])
+        self.assertFalse({header[3] for header in nl_socket.sent} & set(seqs))
+
+    def test_empty(self):
+        self.assertEqual(self.if_manager.ipr_batch([]), [])
+
+    @skipUnless(os.geteuid() == 0, "creating network namespaces needs root")
+    def test_kernel_acks(self):
+        def namespace():
+            os.unshare(os.CLONE_NEWNET)
+            requests = [("addr", "add", {"index": 1, "address": address,
+                                         "prefixlen": 24})
+                        for address in ["192.0.2.1", "192.0.2.2",
+                                        "192.0.2.1", "192.0.2.3"]]
+            errors = self.if_manager.ipr_batch(requests)
+            if [error is None for error in errors] != [True, True, False,
+                                                       True]:
+                return 1
+            return 0 if errors[2].code == errno.EEXIST else 1
+
+        self.assertEqual(run_forked(namespace), 0)
+
+
+@skipUnless(os.geteuid() == 0, "creating network namespaces needs root")
+class WaitForConditionTest(TestCase):
+    def test_wait_for_link_up(self):
+        def namespace():
+            os.unshare(os.CLONE_NEWNET)
+            if_manager = interface_manager()
+            if_manager.resync_devices()
+            lo = if_manager.get_device_by_name("lo")
+
+            def is_up():
+                return bool(lo._nl_msg['flags'] & 1)
+
+            if is_up():
+                return 1
+            with IPRoute() as ipr:
+                ipr.link("set", index=lo.ifindex, state="up")
+            return 0 if if_manager.wait_for_condition(is_up, 5) else 1
+
+        self.assertEqual(run_forked(namespace), 0)
+
+    def test_timeout(self):
+        if_manager = interface_manager()
+        start = time.monotonic()
+        self.assertFalse(if_manager.wait_for_condition(lambda: False, 0.2))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertTrue(if_manager.wait_for_condition(lambda: True, 0))
+
+
+@skipUnless(os.geteuid() == 0, "creating network namespaces needs root")
+class ForkedProcessTest(TestCase):
+    def test_forked_process_keeps_parent_index(self):
+        def namespace():
+            os.unshare(os.CLONE_NEWNET)
+            if_manager = interface_manager()
+            if_manager.resync_devices()
+            parent_socket = if_manager.get_nl_socket()
+
+            def job():
+                with IPRoute() as ipr:
+                    ipr.link("add", ifname="veth0", kind="veth",
+                             peer="veth1")
+                if_manager._server_handler.send_data_to_ctl.reset_mock()
+                if_manager.get_device_by_name("veth0")
+                if if_manager.get_nl_socket() is parent_socket:
+                    return 1
+                # the job's view isn't reported to the controller
+                if if_manager._server_handler.send_data_to_ctl.called:
+                    return 1
+                return 0
+
+            if run_forked(job) != 0:
+                return 1
+            # the notifications of the job's changes are still delivered to
+            # the parent
+            try:
+                if_manager.get_device_by_name("veth0")
+            except DeviceNotFound:
+                return 1
+            if if_manager.get_nl_socket() is not parent_socket:
+                return 1
+            return 0
+
+        self.assertEqual(run_forked(namespace, timeout=20), 0)
+
+
+@skipUnless(os.geteuid() == 0, "creating network namespaces needs root")
+class IfDataTest(TestCase):
+    def test_no_ethtool_calls(self):
+        ethtool_data = {"adaptive_rx_coalescing": None,
+                        "adaptive_tx_coalescing": None,
+                        "rx_pause": False, "tx_pause": False}
+
+        def namespace():
+            os.unshare(os.CLONE_NEWNET)
+            with patch.object(Device, "_get_ethtool_if_data",
+                              return_value=ethtool_data) as ethtool_if_data:
+                if_manager = agent_interface_manager()
+                with IPRoute() as ipr:
+                    ipr.link("add", ifname="veth0", kind="veth",
+                             peer="veth1")
+                dev = if_manager.get_device_by_params({"name": "veth0"})
+                if_data = dev._get_if_data()
+                if set(ethtool_data) & set(if_data):
+                    return 1
+                # dev_created messages of the initial sync and of the veths
+                if ethtool_if_data.called:
+                    return 1
+
+                if if_manager.get_device_by_params(
+                        {"name": "veth1", "rx_pause": False}) is None:
+                    return 1
+                if not ethtool_if_data.called:
+                    return 1
+                return 0 if dev._get_if_data(True)["tx_pause"] is False else 1
+
+        self.assertEqual(run_forked(namespace), 0)
+
+
+@skipUnless(os.geteuid() == 0, "creating network namespaces needs root")
+class CreateDevicesTest(TestCase):
+    def test_create_devices(self):
+        def namespace():
+            os.unshare(os.CLONE_NEWNET)
+            if_manager = agent_interface_manager()
+            devices = if_manager.create_devices(
+                [("VethDevice", [], {}), ("VethDevice", [], {}),
+                 ("BridgeDevice", [], {}), ("BridgeDevice", [], {"name": "br9"})])
+
+            names = [dev.name for dev in devices]
+            if len(set(names)) != 4 or names[3] != "br9":
+                return 1
+            for dev in devices:
+                if if_manager.get_device(dev.ifindex) is not dev:
+                    return 1
+            names = {dev.name for dev in if_manager.get_devices()}
+            peers = {"peer_" + name for name in names & {"lveth0", "lveth1"}}
+            return 0 if len(peers) == 2 and peers <= names else 1
+
+        self.assertEqual(run_forked(namespace), 0)
+
+    def test_failed_creation(self):
+        def namespace():
+            os.unshare(os.CLONE_NEWNET)
+            if_manager = agent_interface_manager()
+            try:
+                if_manager.create_devices(
+                    [("BridgeDevice", [], {"name": "dup"}),
+                     ("BridgeDevice", [], {"name": "dup"}),
+                     ("BridgeDevice", [], {"name": "br9"})])
+            except DeviceError as e:
+                if "1 of 3" not in str(e):
+                    return 1
+            else:
+                return 1
+            # the other devices were created anyway
+            if_manager.get_device_by_name("dup")
+            if_manager.get_device_by_name("br9")
+            return 0
+
+        self.assertEqual(run_forked(namespace), 0)
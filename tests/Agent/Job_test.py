@@ -0,0 +1,100 @@
+import os
+import sys
+import types
+import signal
+from unittest import TestCase
+from unittest.mock import Mock
+
+from lnst.Agent.Job import JobWorkerPool
+
+from tests.Agent.NetnsExecutor_test import run_forked
+
+
+def shell_job(command="true"):
+    return {"type": "shell", "job_id": 1, "command": command, "json": False}
+
+
+def run_job(worker, what):
+    worker.start_job(what["job_id"], what)
+    if not worker.parent_pipe.poll(10):
+        raise TimeoutError("the worker didn't finish the job")
+    return worker.parent_pipe.recv()
+
+
+class JobWorkerPoolTest(TestCase):
+    def setUp(self):
+        self.pool = JobWorkerPool(Mock(), 2)
+        self.addCleanup(self.pool.set_size, 0)
+
+    def pids(self):
+        return {worker.pid for worker in self.pool._idle + self.pool._busy}
+
+    def test_worker_reuse(self):
+        worker = self.pool.acquire(shell_job())
+        result = run_job(worker, shell_job())
+        self.assertEqual(result["type"], "job_finished")
+        self.assertTrue(result["result"]["passed"])
+        self.pool.release(worker)
+
+        self.assertIs(self.pool.acquire(shell_job()), worker)
+        self.assertFalse(run_job(worker, shell_job("false"))["result"]["passed"])
+        self.pool.release(worker)
+
+    def test_exhausted(self):
+        workers = [self.pool.acquire(shell_job()) for i in range(2)]
+        self.assertIsNone(self.pool.acquire(shell_job()))
+        for worker in workers:
+            self.pool.release(worker)
+        self.assertEqual(len(self.pool._idle), 2)
+
+    def test_killed_worker_replaced(self):
+        worker = self.pool.acquire(shell_job())
+        os.killpg(worker.pid, signal.SIGKILL)
+        worker.killed = True
+        self.pool.release(worker)
+
+        self.assertNotIn(worker.pid, self.pids())
+        self.assertEqual(len(self.pool._idle), 2)
+
+    def test_module_loaded_after_fork(self):
+        module = types.ModuleType("lnst_test_job_module")
+        module.TestModule = type("TestModule", (object,),
+                                 {"__module__": module.__name__})
+        sys.modules[module.__name__] = module
+        self.addCleanup(sys.modules.pop, module.__name__)
+
+        old_pids = self.pids()
+        worker = self.pool.acquire({"type": "module",
+                                    "module": module.TestModule()})
+        self.assertNotIn(worker.pid, old_pids)
+        self.pool.release(worker)
+
+    def test_set_size(self):
+        self.pool.set_size(1)
+        self.assertEqual(len(self.pool._idle), 1)
+        self.pool.set_size(3)
+        self.assertEqual(len(self.pool._idle), 3)
+        self.pool.set_size(0)
+        self.assertIsNone(self.pool.acquire(shell_job()))
+
+    def test_reset_after_fork(self):
+        parent_pids = self.pids()
+
+        def child():
+            self.pool.reset_after_fork()
+            pids = self.pids()
+            if len(pids) != 2 or pids & parent_pids:
+                return 1
+            worker = self.pool.acquire(shell_job())
+            passed = run_job(worker, shell_job())["result"]["passed"]
+            self.pool.release(worker)
+            self.pool.set_size(0)
+            return 0 if passed else 1
+
+        self.assertEqual(run_forked(child, timeout=20), 0)
+
+        # the workers of the parent are left alone
+        self.assertEqual(self.pids(), parent_pids)
+        worker = self.pool.acquire(shell_job())
+        self.assertTrue(run_job(worker, shell_job())["result"]["passed"])
+        self.pool.release(worker)
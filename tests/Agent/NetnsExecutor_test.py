@@ -0,0 +1,125 @@
+import os
+import time
+import signal
+import warnings
+from unittest import TestCase, skipUnless
+from unittest.mock import Mock
+
+from lnst.Agent.Agent import RemoteMethods
+from lnst.Agent.Job import JobContext
+from lnst.Agent.NetnsExecutor import NetnsExecutor, NetnsExecutorError
+
+
+def run_forked(func, timeout=5):
+    """runs func in a forked process, returns its exit code or None if it
+    didn't finish in time"""
+    with warnings.catch_warnings():
+        # the executor threads are exactly what's being tested
+        warnings.simplefilter("ignore", DeprecationWarning)
+        pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(func())
+        except BaseException:
+            os._exit(2)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        finished, status = os.waitpid(pid, os.WNOHANG)
+        if finished:
+            return os.waitstatus_to_exitcode(status)
+        time.sleep(0.01)
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    return None
+
+
+def netns_inode():
+    return os.stat("/proc/thread-self/ns/net").st_ino
+
+
+@skipUnless(os.geteuid() == 0, "creating network namespaces needs root")
+class NetnsExecutorTest(TestCase):
+    def setUp(self):
+        self.executor = NetnsExecutor("lnst-test-{}".format(os.getpid()))
+        self.addCleanup(self.executor.close)
+
+    def test_call_runs_in_namespace(self):
+        self.assertNotEqual(self.executor.call(netns_inode), netns_inode())
+        self.assertEqual(self.executor.call(lambda a, b=0: a + b, 1, b=2), 3)
+        self.assertRaises(ZeroDivisionError, self.executor.call,
+                          lambda: 1 / 0)
+
+    def test_close_removes_namespace(self):
+        path = b"/var/run/netns/" + self.executor.name.encode()
+        self.assertTrue(os.path.exists(path))
+        self.executor.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_call_from_forked_process(self):
+        def child():
+            try:
+                self.executor.call(netns_inode)
+            except NetnsExecutorError:
+                # the parent's namespace is left alone
+                self.executor.close()
+                return 0
+            return 1
+
+        self.assertEqual(run_forked(child), 0)
+        self.assertNotEqual(self.executor.call(netns_inode), netns_inode())
+
+
+class ResetAfterForkTest(TestCase):
+    def setUp(self):
+        self.methods = RemoteMethods.__new__(RemoteMethods)
+        self.executor = Mock()
+        self.pipe = Mock()
+        self.methods._net_namespaces = {
+            "tns": {"executor": self.executor, "methods": Mock()},
+            "fns": {"pid": 1, "pipe": self.pipe},
+        }
+        self.worker_pool = Mock()
+        self.methods._job_context = JobContext(self.worker_pool)
+        self.methods._job_context.add_job(Mock(get_id=lambda: 1))
+
+    def test_inherited_namespaces_are_dropped(self):
+        net_namespaces = self.methods._net_namespaces
+        self.methods._reset_after_fork()
+
+        self.assertEqual(net_namespaces, {})
+        self.assertEqual(self.executor.method_calls, [])
+        self.pipe.close.assert_called_once_with()
+        # the cleanup of the forked agent has nothing left to delete
+        self.assertFalse(self.methods.del_namespace("tns"))
+        self.assertFalse(self.methods.del_namespace("fns"))
+
+    def test_inherited_jobs_are_dropped(self):
+        self.methods._reset_after_fork()
+
+        self.assertIsNone(self.methods._job_context.get_job(1))
+        self.worker_pool.reset_after_fork.assert_called_once_with()
+
+
+@skipUnless(os.geteuid() == 0, "creating network namespaces needs root")
+class MixedNamespaceBackendsTest(TestCase):
+    def test_forked_cleanup_after_thread_namespace(self):
+        """a namespace agent forked after a thread backed namespace was
+        created cleans up without touching it"""
+        executor = NetnsExecutor("lnst-test-{}".format(os.getpid()))
+        self.addCleanup(executor.close)
+
+        methods = RemoteMethods.__new__(RemoteMethods)
+        methods._net_namespaces = {
+            "tns": {"executor": executor, "methods": Mock()}}
+        methods._job_context = JobContext(Mock())
+
+        def forked_agent():
+            methods._reset_after_fork()
+            for netns in list(methods._net_namespaces.keys()):
+                methods.del_namespace(netns)
+            return 0
+
+        self.assertEqual(run_forked(forked_agent), 0)
+        self.assertIn("tns", methods._net_namespaces)
+        self.assertNotEqual(executor.call(netns_inode), netns_inode())
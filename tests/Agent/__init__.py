@@ -0,0 +1,13 @@
+import sys
+
+# lnst.Agent.Agent replaces these packages with the namespaces of the
+# modules the controller sends to the agent, the other tests need the
+# originals
+_agent_packages = ["lnst.Devices", "lnst.Tests", "lnst.RecipeCommon"]
+_saved_packages = {name: sys.modules.get(name) for name in _agent_packages}
+import lnst.Agent.Agent
+for name, module in _saved_packages.items():
+    if module is None:
+        sys.modules.pop(name, None)
+    else:
+        sys.modules[name] = module
@@ -0,0 +1,38 @@
+import pickle
+from unittest import TestCase
+
+from lnst.Common.DeviceRef import DeviceRef
+from lnst.Common.DeviceRef import device_refs_dumps, device_refs_loads
+
+
+class FakeDevice(object):
+    def __init__(self, ifindex):
+        self.ifindex = ifindex
+
+
+class DeviceRefPicklerTest(TestCase):
+    def test_devices_are_resolved(self):
+        dev = FakeDevice(3)
+        msg = {"result": [dev, (dev, 1.5)], "params": {"dev": DeviceRef(7)}}
+        data = device_refs_dumps(msg, (FakeDevice,), netns="ns1")
+
+        refs = []
+        def get_device(ifindex, netns):
+            refs.append((ifindex, netns))
+            return "dev%d" % ifindex
+
+        res = device_refs_loads(data, get_device)
+        self.assertEqual(res, {"result": ["dev3", ("dev3", 1.5)],
+                               "params": {"dev": "dev7"}})
+        # the same device is resolved once, it's memoized by the pickler
+        self.assertEqual(sorted(refs), [(3, "ns1"), (7, "ns1")])
+
+    def test_plain_loads_returns_device_refs(self):
+        data = device_refs_dumps([FakeDevice(5)], (FakeDevice,))
+        res = pickle.loads(data)
+        self.assertIsInstance(res[0], DeviceRef)
+        self.assertEqual(res[0].ifindex, 5)
+
+    def test_messages_without_devices(self):
+        msg = {"type": "log", "record": {"msg": "x", "args": (1, 2.0)}}
+        self.assertEqual(device_refs_loads(device_refs_dumps(msg), None), msg)
@@ -0,0 +1,62 @@
+import logging
+from multiprocessing import Pipe
+from unittest import TestCase
+
+from lnst.Common.LoggingHandler import BatchingTransmitHandler
+
+
+class BatchingTransmitHandlerTest(TestCase):
+    def setUp(self):
+        self.reader, writer = Pipe(duplex=False)
+        self.logger = logging.getLogger("batching_test")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.handler = BatchingTransmitHandler(writer, batch_size=3,
+                                               flush_interval=60)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def received(self):
+        msgs = []
+        while self.reader.poll():
+            msgs.append(self.reader.recv())
+        return msgs
+
+    def test_batch_size(self):
+        for i in range(4):
+            self.logger.debug("msg %d", i)
+        msgs = self.received()
+        self.assertEqual(len(msgs), 1)
+        self.assertEqual(msgs[0]["type"], "log_batch")
+        self.assertEqual([r["msg"] for r in msgs[0]["records"]],
+                         ["msg 0", "msg 1", "msg 2"])
+
+        self.handler.flush()
+        self.assertEqual([r["msg"] for r in self.received()[0]["records"]],
+                         ["msg 3"])
+
+    def test_warning_is_sent_immediately(self):
+        self.logger.debug("debug")
+        self.logger.warning("warning")
+        msgs = self.received()
+        self.assertEqual(len(msgs), 1)
+        self.assertEqual([r["msg"] for r in msgs[0]["records"]],
+                         ["debug", "warning"])
+
+    def test_rate_limit(self):
+        self.handler._rate_limit = 2
+        for i in range(5):
+            self.logger.info("msg %d", i)
+        self.logger.error("error")
+        self.assertEqual(self.handler.dropped, 3)
+
+        # the dropped records are reported once the second is over
+        self.handler._window_start -= 1
+        self.handler.flush()
+        records = [r for m in self.received() for r in m["records"]]
+        self.assertEqual([r["msg"] for r in records[:3]],
+                         ["msg 0", "msg 1", "error"])
+        self.assertEqual(records[3]["levelno"], logging.WARNING)
+        self.assertIn("Dropped 3 log records", records[3]["msg"])
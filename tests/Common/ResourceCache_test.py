@@ -0,0 +1,83 @@
+import os
+import json
+import tempfile
+from unittest import TestCase
+
+from lnst.Common.ResourceCache import ResourceCache, ResourceCacheError
+
+
+class ResourceCacheTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, "cache")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _add(self, cache, data, name):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return cache.add_file_entry(path, name)
+
+    def test_index_persists(self):
+        cache = ResourceCache(self.root, 0)
+        entry_hash = self._add(cache, b"foo", "foo")
+        cache.save()
+
+        cache = ResourceCache(self.root, 0)
+        self.assertTrue(cache.query(entry_hash))
+        self.assertFalse(cache.query("0" * 64))
+        self.assertEqual(cache.get_stats()["hits"], 1)
+        self.assertEqual(cache.get_stats()["misses"], 1)
+        with open(cache.get_path(entry_hash), "rb") as f:
+            self.assertEqual(f.read(), b"foo")
+
+    def test_lru_eviction(self):
+        cache = ResourceCache(self.root, 0, max_size=20)
+        first = self._add(cache, b"a" * 8, "a")
+        second = self._add(cache, b"b" * 8, "b")
+        cache.renew_entry(first)
+        third = self._add(cache, b"c" * 8, "c")
+
+        self.assertTrue(cache.query(first))
+        self.assertFalse(cache.query(second))
+        self.assertTrue(cache.query(third))
+        self.assertFalse(os.path.exists(os.path.join(self.root, second)))
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+        self.assertEqual(cache.get_stats()["size"], 16)
+
+    def test_kept_entries_not_evicted(self):
+        cache = ResourceCache(self.root, 0, max_size=150)
+        first = self._add(cache, b"a" * 100, "a")
+        path = os.path.join(self.tmpdir.name, "b")
+        with open(path, "wb") as f:
+            f.write(b"b" * 100)
+        second = cache.add_file_entry(path, "b", keep={first})
+
+        # over the limit until the next addition, nothing else to evict
+        self.assertTrue(cache.query(first))
+        self.assertTrue(cache.query(second))
+        self.assertEqual(cache.get_stats()["size"], 200)
+        cache.renew_entry(first)
+
+    def test_renew_missing_entry(self):
+        cache = ResourceCache(self.root, 0)
+        with self.assertRaises(ResourceCacheError):
+            cache.renew_entry("0" * 64)
+
+    def test_old_index_update(self):
+        os.makedirs(self.root)
+        entry_path = os.path.join(self.root, "a" * 64)
+        with open(entry_path, "w") as f:
+            f.write("data")
+        with open(os.path.join(self.root, "index"), "w") as f:
+            json.dump({"index_version": 1,
+                       "entries": {"a" * 64: {"name": "a", "path": entry_path,
+                                              "last_used": 0, "digest": "a" * 64,
+                                              "type": "file"}}}, f)
+
+        cache = ResourceCache(self.root, 0)
+        self.assertEqual(cache.get_stats()["size"], 4)
+        with open(cache.index_path) as f:
+            self.assertEqual(json.load(f)["index_version"], 2)
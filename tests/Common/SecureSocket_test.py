@@ -0,0 +1,195 @@
+import os
+import socket
+import tempfile
+import threading
+from unittest import TestCase, skipIf
+
+from lnst.Agent.AgentSecSocket import AgentSecSocket
+from lnst.Controller.CtlSecSocket import CtlSecSocket
+from lnst.Common.SecureSocket import SecSocketException
+from lnst.Common.SecureSocket import SecureSocket, FRAMING_ASCII, FRAMING_BINARY
+from lnst.Common.SecureSocket import RECORD_LEGACY, RECORD_AES_GCM, RECORD_CHACHA20_POLY1305
+
+
+class SecureSocketFramingTest(TestCase):
+    def setUp(self):
+        left, right = socket.socketpair()
+        self.sender = SecureSocket(left)
+        self.receiver = SecureSocket(right)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def _roundtrip(self, framing):
+        self.sender._set_framing(framing)
+        self.receiver._set_framing(framing)
+
+        msgs = [{"type": "result", "result": b"x" * size} for size in (0, 1, 4096, 60000)]
+        for msg in msgs:
+            self.sender.send_msg(msg)
+            self.assertEqual(self.receiver.recv_msg(), msg)
+
+    def test_ascii_roundtrip(self):
+        self._roundtrip(FRAMING_ASCII)
+
+    def test_binary_roundtrip(self):
+        self._roundtrip(FRAMING_BINARY)
+
+    def test_select_framing(self):
+        self.assertEqual(self.sender._select_framing(None), FRAMING_ASCII)
+        self.assertEqual(self.sender._select_framing([None]), FRAMING_ASCII)
+        self.assertEqual(self.sender._select_framing(["foo", FRAMING_BINARY]), FRAMING_BINARY)
+
+
+try:
+    import cryptography
+except ImportError:
+    cryptography = None
+
+
+@skipIf(cryptography is None, "Library 'cryptography' missing")
+class SecureSocketRecordProtocolTest(TestCase):
+    def setUp(self):
+        left, right = socket.socketpair()
+        self.sender = SecureSocket(left)
+        self.receiver = SecureSocket(right)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def _set_keys(self, record_protocol):
+        spec = {"enc_key": os.urandom(32), "mac_key": os.urandom(64), "seq_num": 0}
+        self.sender._set_record_protocol(record_protocol)
+        self.receiver._set_record_protocol(record_protocol)
+        self.sender._current_write_spec = dict(spec)
+        self.receiver._current_read_spec = dict(spec)
+
+    def _roundtrip(self, record_protocol):
+        self._set_keys(record_protocol)
+        for size in (0, 1, 16, 4096):
+            msg = {"type": "result", "result": os.urandom(size)}
+            self.sender.send_msg(msg)
+            self.assertEqual(self.receiver.recv_msg(), msg)
+
+    def test_legacy_roundtrip(self):
+        self._roundtrip(RECORD_LEGACY)
+
+    def test_aes_gcm_roundtrip(self):
+        self._roundtrip(RECORD_AES_GCM)
+
+    def test_chacha20_roundtrip(self):
+        self._roundtrip(RECORD_CHACHA20_POLY1305)
+
+    def test_aead_rejects_tampered_record(self):
+        self._set_keys(RECORD_AES_GCM)
+        record = bytearray(self.sender._protect_data(b"payload"))
+        record[0] ^= 0xff
+        self.assertIsNone(self.receiver._uprotect_data(record))
+
+    def test_aead_rejects_replayed_record(self):
+        self._set_keys(RECORD_AES_GCM)
+        record = self.sender._protect_data(b"payload")
+        self.assertEqual(self.receiver._uprotect_data(record), b"payload")
+        self.assertIsNone(self.receiver._uprotect_data(record))
+
+
+@skipIf(cryptography is None, "Library 'cryptography' missing")
+class SecureSocketHandshakeTest(TestCase):
+    def setUp(self):
+        left, right = socket.socketpair()
+        self.ctl = CtlSecSocket(left)
+        self.agent = AgentSecSocket(right)
+
+    def tearDown(self):
+        self.ctl.close()
+        self.agent.close()
+
+    def _handshake(self, ctl_params, agent_params):
+        errors = []
+
+        def agent_handshake():
+            try:
+                self.agent.handshake(agent_params)
+            except Exception as e:
+                errors.append(e)
+                self.agent.shutdown(socket.SHUT_RDWR)
+
+        agent_thread = threading.Thread(target=agent_handshake)
+        agent_thread.start()
+        try:
+            self.ctl.handshake(ctl_params)
+        except Exception:
+            self.ctl.shutdown(socket.SHUT_RDWR)
+            raise
+        finally:
+            agent_thread.join()
+        if errors:
+            raise errors[0]
+
+    def _check_channel(self):
+        self.assertEqual(self.ctl.record_protocol, RECORD_AES_GCM)
+        self.assertEqual(self.agent.record_protocol, RECORD_AES_GCM)
+
+        for msg in ({"type": "command", "data": os.urandom(1000)},
+                    {"type": "result", "result": "ok"}):
+            self.ctl.send_msg(msg)
+            self.assertEqual(self.agent.recv_msg(), msg)
+            self.agent.send_msg(msg)
+            self.assertEqual(self.ctl.recv_msg(), msg)
+
+        self.assertIsNotNone(self.ctl._current_write_spec["enc_key"])
+        self.assertEqual(self.ctl._current_write_spec["enc_key"],
+                         self.agent._current_read_spec["enc_key"])
+        self.assertEqual(self.agent._current_write_spec["enc_key"],
+                         self.ctl._current_read_spec["enc_key"])
+
+    def test_no_auth(self):
+        self._handshake({"auth_type": "no-auth"}, {"auth_types": "no-auth"})
+        self._check_channel()
+
+    def test_password(self):
+        self._handshake({"auth_type": "password", "auth_passwd": "secret"},
+                        {"auth_types": "password", "auth_password": "secret"})
+        self._check_channel()
+
+    def test_wrong_password(self):
+        with self.assertRaises(SecSocketException):
+            self._handshake(
+                {"auth_type": "password", "auth_passwd": "secret"},
+                {"auth_types": "password", "auth_password": "other"})
+
+    def test_pubkey(self):
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        def write_key(path):
+            key = rsa.generate_private_key(public_exponent=65537,
+                                           key_size=2048)
+            with open(path + ".pem", "wb") as f:
+                f.write(key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.TraditionalOpenSSL,
+                    serialization.NoEncryption()))
+            with open(path, "wb") as f:
+                f.write(key.public_key().public_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PublicFormat.SubjectPublicKeyInfo))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.mkdir(os.path.join(tmpdir, "ctl_keys"))
+            ctl_key = os.path.join(tmpdir, "ctl_keys", "ctl")
+            agent_key = os.path.join(tmpdir, "agent")
+            write_key(ctl_key)
+            write_key(agent_key)
+            os.rename(ctl_key + ".pem", os.path.join(tmpdir, "ctl.pem"))
+
+            self._handshake({"auth_type": "pubkey", "identity": "ctl",
+                             "privkey": os.path.join(tmpdir, "ctl.pem"),
+                             "pubkey_path": agent_key},
+                            {"auth_types": "pubkey",
+                             "privkey": agent_key + ".pem",
+                             "ctl_pubkeys": os.path.join(tmpdir,
+                                                         "ctl_keys")})
+        self._check_channel()
@@ -0,0 +1,186 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from lnst.Common.LnstError import LnstError
+from lnst.Controller.Machine import Machine
+from lnst.Controller.RecipeResults import ResultType
+
+
+class AgentMock(object):
+    """answers the messages sent by the machine, the multicall calls of the
+    methods in failing fail"""
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.messages = []
+
+    def send_message(self, machine, msg):
+        self.messages.append(msg)
+        data = msg.get("data", msg)
+        if data["method_name"] != "multicall":
+            return "done"
+
+        calls, = data["args"]
+        results = []
+        for method_name, args, kwargs in calls:
+            if method_name in self.failing:
+                results.append({"exception": LnstError(method_name)})
+                break
+            results.append({"result": (method_name, args)})
+        return results
+
+
+class RpcBatchTest(TestCase):
+    def setUp(self):
+        self.agent = AgentMock()
+        self.machine = Machine("machine", "localhost", self.agent,
+                               Mock(get_option=Mock(return_value=False)),
+                               security={})
+        self.netns = Mock()
+        self.netns.name = "ns1"
+        self.machine._namespaces = {"ns1": self.netns}
+
+    def test_batch(self):
+        with self.machine.rpc_batch() as batch:
+            batch.add("dev_method", (1, "up", [], {}))
+            batch.add("dev_setattr", (1, "mtu", 1400))
+            batch.add("dev_method", (2, "up", [], {}), netns=self.netns)
+            self.assertEqual(self.agent.messages, [])
+
+        # one multicall per namespace
+        self.assertEqual(len(self.agent.messages), 2)
+        self.assertEqual(self.agent.messages[0]["type"], "command")
+        self.assertEqual(self.agent.messages[1]["type"], "to_netns")
+        self.assertEqual(self.agent.messages[1]["netns"], "ns1")
+        self.assertEqual(batch.results,
+                         [("dev_method", (1, "up", [], {})),
+                          ("dev_setattr", (1, "mtu", 1400)),
+                          ("dev_method", (2, "up", [], {}))])
+        self.assertIsNone(self.machine._rpc_batch)
+
+    def test_other_calls_flush_first(self):
+        with self.machine.rpc_batch() as batch:
+            batch.add("dev_method", (1, "up", [], {}))
+            self.machine.rpc_call("get_devices")
+
+            self.assertEqual(
+                [msg["method_name"] for msg in self.agent.messages],
+                ["multicall", "get_devices"])
+        self.assertEqual(len(self.agent.messages), 2)
+
+    def test_nested_batches(self):
+        with self.machine.rpc_batch() as batch:
+            with self.machine.rpc_batch() as inner:
+                self.assertIs(inner, batch)
+                batch.add("dev_method", (1, "up", [], {}))
+            self.assertEqual(self.agent.messages, [])
+        self.assertEqual(len(self.agent.messages), 1)
+
+    def test_failed_call(self):
+        self.agent.failing = ["dev_setattr"]
+        recipe_results = [Mock(result=ResultType.PASS) for i in range(3)]
+        with self.assertRaises(LnstError):
+            with self.machine.rpc_batch() as batch:
+                batch.add("dev_method", (1, "up", [], {}),
+                          recipe_result=recipe_results[0])
+                batch.add("dev_setattr", (1, "mtu", 1400),
+                          recipe_result=recipe_results[1])
+                batch.add("dev_method", (1, "down", [], {}),
+                          recipe_result=recipe_results[2])
+
+        self.assertEqual([res.result for res in recipe_results],
+                         [ResultType.PASS, ResultType.FAIL, ResultType.PASS])
+        self.assertEqual(len(batch.results), 1)
+
+    def test_setattrs_in_one_multicall(self):
+        devices = {ifindex: Mock() for ifindex in range(1, 4)}
+        self.machine._device_database = {None: devices}
+        self.machine._recipe = Mock()
+        with self.machine.rpc_batch() as batch:
+            for ifindex in devices:
+                self.machine.remote_device_setattr(ifindex, "mtu", 1400, None)
+            self.assertEqual(self.agent.messages, [])
+
+        self.assertEqual(len(self.agent.messages), 1)
+        calls, = self.agent.messages[0]["args"]
+        self.assertEqual([method_name for method_name, args, kwargs in calls],
+                         ["dev_getattr", "dev_setattr"] * 3)
+        self.assertEqual(batch.results,
+                         [("dev_setattr", (ifindex, "mtu", 1400))
+                          for ifindex in devices])
+        # the old values are the results of the dev_getattr calls
+        add_result = self.machine._recipe.current_run.add_result
+        self.assertEqual([call.args[0].old_value
+                          for call in add_result.call_args_list],
+                         [("dev_getattr", (ifindex, "mtu"))
+                          for ifindex in devices])
+        self.assertIsNone(self.machine._rpc_batch)
+
+
+class DeviceAgentMock(object):
+    """keeps the mtu of the devices, a dev_method call "set_mtu" changes it
+    and pushes the update before its result like the agent does"""
+    def __init__(self, machine, mtus):
+        self.machine = machine
+        self.mtus = mtus
+        self.methods = []
+
+    def send_message(self, machine, msg):
+        self.methods.append(msg["method_name"])
+        if msg["method_name"] == "dev_getattr":
+            ifindex, attr_name = msg["args"]
+            return self.mtus[ifindex]
+
+        ifindex, method_name, args, kwargs = msg["args"]
+        self.mtus[ifindex], = args
+        self.machine.device_updated(ifindex, {"mtu": args[0]})
+
+
+class DeviceCacheTest(TestCase):
+    def setUp(self):
+        self.machine = Machine("machine", "localhost", None,
+                               Mock(get_option=Mock(return_value=False)),
+                               security={})
+        self.agent = DeviceAgentMock(self.machine, {1: 1500, 2: 9000})
+        self.machine._msg_dispatcher = self.agent
+        self.initns = Mock()
+        self.machine._initns = self.initns
+        self.devices = {}
+        for ifindex in [1, 2]:
+            dev = Mock(_attr_cache={})
+            dev._dev_cls._pushed_attrs = ("mtu",)
+            self.devices[ifindex] = dev
+        self.machine._device_database = {self.initns: self.devices}
+
+    def read_mtu(self, ifindex):
+        return self.machine.remote_device_getattr(ifindex, "mtu", self.initns)
+
+    def test_reads_after_calls_hit(self):
+        self.assertEqual(self.read_mtu(1), 1500)
+        self.assertEqual(self.read_mtu(2), 9000)
+        self.machine.remote_device_method(1, "set_mtu", [1400], {},
+                                          self.initns)
+        self.assertEqual(self.read_mtu(1), 1400)
+        self.assertEqual(self.read_mtu(2), 9000)
+
+        self.assertEqual(self.agent.methods,
+                         ["dev_getattr", "dev_getattr", "dev_method"])
+        stats = self.machine.get_device_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+        self.assertEqual(stats["invalidations"], 0)
+
+    def test_invalidate_one_device(self):
+        self.read_mtu(1)
+        self.read_mtu(2)
+        self.machine.invalidate_device_cache(self.devices[1])
+        self.assertEqual(self.devices[1]._attr_cache, {})
+        self.assertEqual(self.devices[2]._attr_cache, {"mtu": 9000})
+
+        self.machine.invalidate_device_cache()
+        self.assertEqual(self.devices[2]._attr_cache, {})
+
+    def test_strict(self):
+        self.machine.device_cache_strict = True
+        self.read_mtu(1)
+        self.read_mtu(1)
+        self.assertEqual(self.agent.methods, ["dev_getattr", "dev_getattr"])
+        self.assertEqual(self.machine.get_device_cache_stats()["uncached"], 2)
@@ -0,0 +1,151 @@
+import time
+import socket
+import threading
+from unittest import TestCase
+from unittest.mock import Mock
+
+from lnst.Common.LnstError import LnstError
+from lnst.Common.SecureSocket import SecureSocket
+from lnst.Controller.MessageDispatcher import MessageDispatcher, ConnectionError
+
+
+class MachineMock(Mock):
+    def get_id(self):
+        return self.machine_id
+
+    def get_mapped(self):
+        return True
+
+
+class MessageDispatcherPipeliningTest(TestCase):
+    def setUp(self):
+        ctl_soc, agent_soc = socket.socketpair()
+        self.agent = SecureSocket(agent_soc)
+        self.machine = MachineMock(machine_id="machine")
+        self.dispatcher = MessageDispatcher(Mock())
+        self.dispatcher.add_agent(self.machine, SecureSocket(ctl_soc))
+
+    def tearDown(self):
+        self.agent.close()
+
+    def _command(self, name):
+        return {"type": "command", "method_name": name, "args": (), "kwargs": {}}
+
+    def test_out_of_order_results(self):
+        first = self.dispatcher.send_message_async(self.machine, self._command("first"))
+        second = self.dispatcher.send_message_async(self.machine, self._command("second"))
+        requests = [self.agent.recv_msg(), self.agent.recv_msg()]
+
+        for request in reversed(requests):
+            self.agent.send_msg({"type": "result",
+                                 "result": request["method_name"],
+                                 "request_id": request["request_id"]})
+
+        self.assertEqual(second.result(), "second")
+        self.assertTrue(first.done())
+        self.assertEqual(first.result(), "first")
+
+    def test_exception_is_attributed_to_request(self):
+        failing = self.dispatcher.send_message_async(self.machine, self._command("fail"))
+        passing = self.dispatcher.send_message_async(self.machine, self._command("pass"))
+        fail_request, pass_request = self.agent.recv_msg(), self.agent.recv_msg()
+
+        self.agent.send_msg({"type": "exception",
+                             "Exception": LnstError("failed"),
+                             "request_id": fail_request["request_id"]})
+        self.agent.send_msg({"type": "result", "result": True,
+                             "request_id": pass_request["request_id"]})
+
+        self.assertEqual(passing.result(), True)
+        self.assertRaises(LnstError, failing.result)
+
+    def test_results_without_request_id(self):
+        first = self.dispatcher.send_message_async(self.machine, self._command("first"))
+        second = self.dispatcher.send_message_async(self.machine, self._command("second"))
+
+        self.agent.send_msg({"type": "result", "result": 1})
+        self.agent.send_msg({"type": "result", "result": 2})
+
+        self.assertEqual([first.result(), second.result()], [1, 2])
+
+    def test_unmatched_exception_fails_own_machine(self):
+        ctl_soc, agent_soc = socket.socketpair()
+        other_agent = SecureSocket(agent_soc)
+        other_machine = MachineMock(machine_id="other")
+        self.dispatcher.add_agent(other_machine, SecureSocket(ctl_soc))
+        self.addCleanup(other_agent.close)
+
+        own = self.dispatcher.send_message_async(self.machine, self._command("own"))
+        other = self.dispatcher.send_message_async(other_machine, self._command("other"))
+        self.agent.recv_msg()
+        other_request = other_agent.recv_msg()
+
+        self.agent.send_msg({"type": "exception",
+                             "Exception": LnstError("failed"),
+                             "request_id": 12345})
+        other_agent.send_msg({"type": "result", "result": True,
+                              "request_id": other_request["request_id"]})
+
+        self.assertEqual(other.result(), True)
+        self.assertRaises(LnstError, own.result)
+
+    def test_wait_for_condition_timeout_off_main_thread(self):
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            self.dispatcher.wait_for_condition(lambda: False, timeout=0.2)))
+        start = time.monotonic()
+        thread.start()
+        thread.join(5)
+        self.assertEqual(results, [False])
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_wait_for_condition_while_waiting_for_future(self):
+        future = self.dispatcher.send_message_async(self.machine, self._command("first"))
+        request = self.agent.recv_msg()
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            self.dispatcher.wait_for_condition(future.done, timeout=5)))
+        thread.start()
+
+        self.agent.send_msg({"type": "result", "result": 1,
+                             "request_id": request["request_id"]})
+        self.assertEqual(future.result(), 1)
+        thread.join(5)
+        self.assertEqual(results, [True])
+
+    def test_disconnect_fails_requests_waited_on_by_other_threads(self):
+        ctl_soc, agent_soc = socket.socketpair()
+        other_agent = SecureSocket(agent_soc)
+        other_machine = MachineMock(machine_id="other")
+        self.dispatcher.add_agent(other_machine, SecureSocket(ctl_soc))
+
+        own = self.dispatcher.send_message_async(self.machine, self._command("own"))
+        other = self.dispatcher.send_message_async(other_machine, self._command("other"))
+        request = self.agent.recv_msg()
+        other_agent.recv_msg()
+
+        outcomes = {}
+        def wait(name, future):
+            try:
+                outcomes[name] = future.result()
+            except Exception as e:
+                outcomes[name] = e
+
+        # the thread waiting for the live agent reads the messages, the
+        # other one only waits for it
+        own_thread = threading.Thread(target=wait, args=("own", own))
+        own_thread.start()
+        time.sleep(0.1)
+        other_thread = threading.Thread(target=wait, args=("other", other))
+        other_thread.start()
+        time.sleep(0.1)
+
+        other_agent.close()
+        other_thread.join(5)
+        self.assertFalse(other_thread.is_alive())
+        self.assertIsInstance(outcomes["other"], ConnectionError)
+
+        self.agent.send_msg({"type": "result", "result": 1,
+                             "request_id": request["request_id"]})
+        own_thread.join(5)
+        self.assertFalse(own_thread.is_alive())
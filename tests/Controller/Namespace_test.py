@@ -0,0 +1,23 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from lnst.Controller.NetNamespace import NetNamespace
+
+
+class NamespaceCopyTest(TestCase):
+    def setUp(self):
+        self.machine = Mock()
+        self.netns = NetNamespace("ns1")
+        self.netns._machine = self.machine
+
+    def test_copy_to_netns(self):
+        self.netns.copy_file_to_machine("/tmp/local", "/tmp/remote",
+                                        compression="gzip")
+        self.machine.copy_file_to_machine.assert_called_once_with(
+            "/tmp/local", "/tmp/remote", self.netns, compression="gzip")
+
+    def test_copy_from_netns(self):
+        self.netns.copy_file_from_machine("/tmp/remote", "/tmp/local",
+                                          compression="gzip")
+        self.machine.copy_file_from_machine.assert_called_once_with(
+            "/tmp/remote", "/tmp/local", self.netns, compression="gzip")
@@ -0,0 +1,151 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from lnst.Common.LnstError import LnstError
+from lnst.Controller.RecipeResults import ResultType
+from lnst.RecipeCommon.Perf.Confidence import t_quantile, relative_ci_width
+from lnst.RecipeCommon.Perf.Confidence import t_central_probability
+from lnst.RecipeCommon.Perf.Confidence import ConfidenceTracker
+from lnst.RecipeCommon.Perf.Measurements.Results import CPUMeasurementResults
+from lnst.RecipeCommon.Perf.Recipe import Recipe as PerfRecipe
+from lnst.RecipeCommon.Perf.Recipe import RecipeConf as PerfRecipeConf
+from lnst.RecipeCommon.Perf.Results import PerfInterval, SequentialPerfResult
+
+
+def cpu_result(measurement, average):
+    result = CPUMeasurementResults(measurement, True, Mock(), "cpu0")
+    result.utilization = SequentialPerfResult(
+        [PerfInterval(average, 1, "time units", i) for i in range(10)])
+    return result
+
+
+class AdaptiveRecipe(PerfRecipe):
+    def __init__(self, averages):
+        self.averages = list(averages)
+        self.results = []
+
+    def add_result(self, result, description="", data=None):
+        self.results.append((result, description, data))
+
+    def apply_perf_test_tweak(self, recipe_conf):
+        pass
+
+    def remove_perf_test_tweak(self, recipe_conf):
+        pass
+
+    def describe_perf_test_tweak(self, recipe_conf):
+        pass
+
+    def perf_test_iteration(self, recipe_conf, results):
+        for measurement in recipe_conf.measurements:
+            results.add_measurement_results(
+                measurement, [cpu_result(measurement, self.averages.pop(0))])
+
+
+class TQuantileTest(TestCase):
+    def test_known_values(self):
+        for p, df, expected in [(0.975, 1, 12.706), (0.975, 2, 4.303),
+                                (0.975, 3, 3.182), (0.975, 10, 2.228),
+                                (0.975, 30, 2.042), (0.95, 5, 2.015),
+                                (0.995, 9, 3.250), (0.99975, 4, 10.306),
+                                (0.9995, 19, 3.883), (0.025, 4, -2.776)]:
+            self.assertAlmostEqual(t_quantile(p, df), expected, delta=0.001)
+
+    def test_central_probability(self):
+        self.assertEqual(t_central_probability(0, 3), 0)
+        for df in range(1, 12):
+            self.assertAlmostEqual(
+                t_central_probability(t_quantile(0.99, df), df), 0.98)
+
+    def test_relative_ci_width(self):
+        self.assertEqual(relative_ci_width([10], 0.95), float("inf"))
+        self.assertEqual(relative_ci_width([10, 10, 10], 0.95), 0)
+        # stdev 1, half width 4.303 / sqrt(3) around 10
+        self.assertAlmostEqual(relative_ci_width([9, 10, 11], 0.95),
+                               2 * 4.303 / 3**0.5 * 10, places=1)
+
+
+class ConfidenceTrackerTest(TestCase):
+    def test_target(self):
+        measurement = Mock()
+        tracker = ConfidenceTracker(5.0)
+        self.assertFalse(tracker.target_reached())
+        tracker.add_iteration(measurement, [cpu_result(measurement, 50)])
+        self.assertFalse(tracker.target_reached())
+        tracker.add_iteration(measurement, [cpu_result(measurement, 51)])
+        self.assertFalse(tracker.target_reached())
+        tracker.add_iteration(measurement, [cpu_result(measurement, 50.5)])
+        self.assertTrue(tracker.target_reached())
+
+    def test_corrected_for_checks(self):
+        measurement = Mock()
+        tracker = ConfidenceTracker(5.0)
+        corrected = ConfidenceTracker(5.0, checks=4)
+        self.assertAlmostEqual(corrected.check_confidence, 1 - 0.05 / 4)
+        for average in [50, 51, 50.5]:
+            tracker.add_iteration(measurement, [cpu_result(measurement, average)])
+            corrected.add_iteration(measurement,
+                                    [cpu_result(measurement, average)])
+
+        key = (measurement, 0, "utilization")
+        self.assertGreater(corrected.widths[key], tracker.widths[key])
+        self.assertTrue(tracker.target_reached())
+        self.assertFalse(corrected.target_reached())
+
+    def test_untracked_metrics(self):
+        measurement = Mock()
+        tracker = ConfidenceTracker({"other": 5.0})
+        tracker.add_iteration(measurement, [cpu_result(measurement, 50)])
+        self.assertEqual(tracker.widths, {})
+        self.assertFalse(tracker.target_reached())
+
+
+class AdaptivePerfTestTest(TestCase):
+    def test_stops_early(self):
+        measurement = Mock()
+        recipe = AdaptiveRecipe([50, 51, 50.5, 50, 50])
+        recipe_conf = PerfRecipeConf([measurement], 5, min_iterations=2,
+                                     ci_target=5.0)
+        results = recipe.perf_test(recipe_conf)
+
+        self.assertEqual(results.iterations, 3)
+        result, description, data = recipe.results[-1]
+        self.assertEqual(result, ResultType.PASS)
+        self.assertEqual(data["iterations"], 3)
+        self.assertEqual(data["max_iterations"], 5)
+        self.assertTrue(data["target_reached"])
+
+    def test_corrected(self):
+        measurement = Mock()
+        recipe = AdaptiveRecipe([50, 51, 50.5, 50, 50])
+        recipe_conf = PerfRecipeConf([measurement], 5, min_iterations=2,
+                                     ci_target=5.0, ci_corrected=True)
+        self.assertEqual(recipe_conf.ci_checks, 4)
+        results = recipe.perf_test(recipe_conf)
+
+        self.assertEqual(results.iterations, 5)
+        self.assertAlmostEqual(results.confidence["check_confidence"],
+                               1 - 0.05 / 4)
+
+    def test_max_iterations(self):
+        measurement = Mock()
+        recipe = AdaptiveRecipe([10, 50, 90, 10, 90])
+        recipe_conf = PerfRecipeConf([measurement], 5, ci_target=5.0)
+        results = recipe.perf_test(recipe_conf)
+
+        self.assertEqual(results.iterations, 5)
+        self.assertEqual(recipe.results[-1][0], ResultType.WARNING)
+        self.assertFalse(results.confidence["target_reached"])
+
+    def test_not_adaptive(self):
+        measurement = Mock()
+        recipe = AdaptiveRecipe([50] * 5)
+        results = recipe.perf_test(PerfRecipeConf([measurement], 5))
+        self.assertEqual(results.iterations, 5)
+        self.assertEqual(recipe.results, [])
+
+    def test_min_iterations(self):
+        with self.assertRaises(LnstError):
+            PerfRecipeConf([Mock()], 5, min_iterations=1, ci_target=5.0)
+        with self.assertRaises(LnstError):
+            PerfRecipeConf([Mock()], 1, ci_target=5.0)
@@ -0,0 +1,92 @@
+from unittest import TestCase
+from unittest.mock import Mock
+
+from lnst.Common.Parameters import Parameters
+from lnst.Controller.RecipeResults import ResultType
+from lnst.RecipeCommon.Perf.BaselineStore import BaselineStore
+from lnst.RecipeCommon.Perf.Evaluators.StoredBaselineEvaluator import StoredBaselineEvaluator
+from lnst.RecipeCommon.Perf.Measurements.Results import CPUMeasurementResults
+from lnst.RecipeCommon.Perf.Recipe import RecipeConf as PerfRecipeConf
+from lnst.RecipeCommon.Perf.Results import PerfInterval, SequentialPerfResult
+
+
+class RecipeMock(Mock):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.params = Parameters()
+        self.params.perf_iterations = 5
+        self.results = []
+
+    def add_custom_result(self, result):
+        self.results.append(result)
+
+
+HOST = Mock(hostid="host1")
+
+
+def cpu_result(measurement, cpu, average):
+    result = CPUMeasurementResults(measurement, True, HOST, cpu)
+    result.utilization = SequentialPerfResult(
+        [PerfInterval(average + i % 2, 1, "time units", 100 + i)
+         for i in range(10)])
+    return result
+
+
+class StoredBaselineEvaluatorTest(TestCase):
+    def setUp(self):
+        self.store = BaselineStore(":memory:")
+        self.recipe = RecipeMock()
+        self.measurement = Mock(version="1")
+        self.recipe_conf = PerfRecipeConf([self.measurement], 5)
+
+    def tearDown(self):
+        self.store.close()
+
+    def store_runs(self, averages, cpu="cpu0"):
+        for i, average in enumerate(averages):
+            self.store.store_results(
+                self.recipe, self.recipe_conf,
+                [cpu_result(self.measurement, cpu, average)], timestamp=i)
+
+    def evaluate(self, result, **kwargs):
+        evaluator = StoredBaselineEvaluator(self.store, **kwargs)
+        evaluator.evaluate_results(self.recipe, self.recipe_conf, [result])
+        return self.recipe.results[-1].comparisons[0]
+
+    def test_no_baseline(self):
+        self.store_runs([50], cpu="cpu1")
+        comparison = self.evaluate(cpu_result(self.measurement, "cpu0", 50))
+        self.assertEqual(comparison.comparison_result, ResultType.FAIL)
+        self.assertEqual(comparison.text, "No baseline found")
+
+    def test_recent_runs_are_used(self):
+        self.store_runs([10, 10, 50, 52, 48])
+        baseline = StoredBaselineEvaluator(self.store, history=3).get_baseline(
+            self.recipe, self.recipe_conf,
+            cpu_result(self.measurement, "cpu0", 50))
+        self.assertEqual(baseline.utilization.runs, 3)
+        self.assertEqual([s.timestamp for s in baseline.utilization.summaries],
+                         [4, 3, 2])
+        self.assertAlmostEqual(baseline.utilization.average, 50.5)
+
+        comparison = self.evaluate(cpu_result(self.measurement, "cpu0", 50),
+                                   history=3)
+        self.assertEqual(comparison.comparison_result, ResultType.PASS)
+        comparison = self.evaluate(cpu_result(self.measurement, "cpu0", 60),
+                                   history=3)
+        self.assertEqual(comparison.comparison_result, ResultType.FAIL)
+
+    def test_version_mismatch(self):
+        self.store_runs([50])
+        self.measurement.version = "2"
+        result = cpu_result(self.measurement, "cpu0", 50)
+        self.assertEqual(self.evaluate(result).text, "No baseline found")
+        self.assertEqual(
+            self.evaluate(result, match_version=False).comparison_result,
+            ResultType.PASS)
+
+    def test_store_results(self):
+        result = cpu_result(self.measurement, "cpu0", 50)
+        self.evaluate(result, store_results=True)
+        self.assertEqual(
+            self.evaluate(result).comparison_result, ResultType.PASS)
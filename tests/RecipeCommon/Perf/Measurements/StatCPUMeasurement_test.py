@@ -0,0 +1,68 @@
+from unittest import TestCase
+
+from lnst.Tests.CPUStatMonitor import CPUStatMonitor, CompactCPUStats
+from lnst.RecipeCommon.Perf.Measurements.StatCPUMeasurement import StatCPUMeasurement
+
+STATS = [
+    "cpu  100 0 50 1000 5 1 2 0 0 0\n"
+    "cpu0 60 0 30 500 3 1 1 0 0 0\n"
+    "cpu1 40 0 20 500 2 0 1 0 0 0\n"
+    "intr 1234 0 0\nctxt 5678\n",
+    "cpu  180 2 90 1100 5 1 6 0 0 0\n"
+    "cpu0 100 1 50 550 3 1 3 0 0 0\n"
+    "cpu1 80 1 40 550 2 0 3 0 0 0\n"
+    "intr 1300 0 0\nctxt 5700\n",
+    "cpu  200 2 100 1300 6 1 6 0 0 0\n"
+    "cpu0 110 1 55 650 3 1 3 0 0 0\n"
+    "cpu1 90 1 45 650 3 0 3 0 0 0\n"
+    "intr 1400 0 0\nctxt 5800\n",
+]
+
+
+class FakeJob(object):
+    host = None
+    passed = True
+
+    def __init__(self, result):
+        self.result = result
+
+
+class StatCPUMeasurementTest(TestCase):
+    def test_compact_results_match_default_results(self):
+        raw_samples = [{"timestamp": 100.0 + i * 0.5, "stat": stat}
+                       for i, stat in enumerate(STATS)]
+        default_job = FakeJob(
+            {"data": CPUStatMonitor()._process_samples(raw_samples)})
+
+        stats = CompactCPUStats()
+        for sample in raw_samples:
+            stats.add_sample(sample["timestamp"], sample["stat"].encode())
+        compact_job = FakeJob({"compact": stats.result()})
+
+        measurement = StatCPUMeasurement([])
+        default_results = measurement._process_job(default_job)
+        compact_results = measurement._process_job(compact_job)
+
+        self.assertEqual([r.cpu for r in compact_results],
+                         ["cpu", "cpu0", "cpu1"])
+        self.assertEqual([r.cpu for r in compact_results],
+                         [r.cpu for r in default_results])
+        for compact, default in zip(compact_results, default_results):
+            self.assertEqual(compact.utilization.value,
+                             default.utilization.value)
+            self.assertEqual(compact.utilization.duration,
+                             default.utilization.duration)
+            self.assertAlmostEqual(compact.utilization.std_deviation,
+                                   default.utilization.std_deviation)
+            self.assertEqual(compact.start_timestamp,
+                             default.start_timestamp)
+            self.assertEqual(compact.end_timestamp, default.end_timestamp)
+
+    def test_compact_counters_of_offline_cpu(self):
+        stats = CompactCPUStats()
+        stats.add_sample(100.0, STATS[0].encode())
+        offline = "".join(l + "\n" for l in STATS[1].splitlines()
+                          if not l.startswith("cpu1"))
+        stats.add_sample(101.0, offline.encode())
+        result = stats.result()
+        self.assertEqual(list(result["counters"][20:30]), [0] * 10)
@@ -0,0 +1,74 @@
+from unittest import TestCase
+
+from lnst.Common.LnstError import LnstError
+from lnst.RecipeCommon.Perf.Results import PerfInterval, EmptySlice
+from lnst.RecipeCommon.Perf.Results import SequentialPerfResult
+from lnst.RecipeCommon.Perf.Results import ParallelPerfResult
+from lnst.RecipeCommon.Perf.Results import ColumnarPerfResult
+
+
+def intervals(count=10, start=100.0):
+    return [PerfInterval(i * 10 + 5, 1.0 + (i % 3) * 0.5, "bits",
+                         start + i * 2) for i in range(count)]
+
+
+class ColumnarPerfResultTest(TestCase):
+    def assertSameResult(self, columnar, sequential):
+        self.assertEqual(len(columnar), len(sequential))
+        self.assertAlmostEqual(columnar.value, sequential.value)
+        self.assertAlmostEqual(columnar.duration, sequential.duration)
+        self.assertAlmostEqual(columnar.average, sequential.average)
+        self.assertAlmostEqual(columnar.std_deviation,
+                               sequential.std_deviation)
+        self.assertEqual(columnar.start_timestamp,
+                         sequential.start_timestamp)
+        self.assertEqual(columnar.end_timestamp, sequential.end_timestamp)
+        self.assertEqual(columnar.unit, sequential.unit)
+        for a, b in zip(columnar, sequential):
+            self.assertAlmostEqual(a.value, b.value)
+            self.assertEqual(a.duration, b.duration)
+            self.assertEqual(a.start_timestamp, b.start_timestamp)
+
+    def test_matches_sequential_result(self):
+        items = intervals()
+        self.assertSameResult(ColumnarPerfResult(items),
+                              SequentialPerfResult(items))
+
+    def test_time_slice_matches_sequential_result(self):
+        items = intervals()
+        columnar = ColumnarPerfResult(items)
+        sequential = SequentialPerfResult(items)
+        for start, end in [(100.5, 110.2), (99, 200), (103, 105),
+                           (104.5, 104.7), (101.5, 102.5)]:
+            self.assertSameResult(columnar.time_slice(start, end),
+                                  sequential.time_slice(start, end))
+
+        with self.assertRaises(EmptySlice):
+            columnar.time_slice(101.5, 102)
+
+    def test_time_slice_of_unordered_intervals(self):
+        items = intervals()
+        items[2], items[5] = items[5], items[2]
+        columnar = ColumnarPerfResult(items)
+        self.assertSameResult(columnar.time_slice(100.5, 110.2),
+                              SequentialPerfResult(items).time_slice(
+                                  100.5, 110.2))
+
+    def test_indexing(self):
+        columnar = ColumnarPerfResult(intervals())
+        self.assertIsInstance(columnar[-1], PerfInterval)
+        self.assertEqual(columnar[-1].start_timestamp, 118.0)
+        self.assertSameResult(columnar[2:5],
+                              SequentialPerfResult(intervals()[2:5]))
+
+    def test_nested_in_parallel_result(self):
+        a = ColumnarPerfResult(intervals())
+        b = ColumnarPerfResult(intervals(start=101.0))
+        parallel = ParallelPerfResult([a, b])
+        self.assertEqual(parallel.value, a.value + b.value)
+        self.assertEqual(parallel.start_timestamp, 100.0)
+
+    def test_unit_mismatch(self):
+        columnar = ColumnarPerfResult(intervals())
+        with self.assertRaises(LnstError):
+            columnar.append(PerfInterval(1, 1, "packets", 200))
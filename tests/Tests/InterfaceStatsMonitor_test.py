@@ -0,0 +1,109 @@
+import struct
+from unittest import TestCase
+
+from lnst.Tests.BaseTestModule import TestModuleError as ModuleError
+from lnst.Tests.InterfaceStatsMonitor import NetlinkStatsReader
+from lnst.Tests.InterfaceStatsMonitor import LINK_STATS64_FIELDS
+from lnst.Tests.InterfaceStatsMonitor import IFLA_STATS_LINK_64, RTM_GETSTATS
+from lnst.Tests.InterfaceStatsMonitor import NLMSG_ERROR
+
+
+def stats_reply(values, attrs=(), seq=1):
+    """RTM_GETSTATS reply with the values of struct rtnl_link_stats64
+    preceded by the given (type, payload) attributes"""
+    payload = b""
+    for attr_type, attr_data in list(attrs) + [
+            (IFLA_STATS_LINK_64, struct.pack("={}Q".format(len(values)),
+                                             *values))]:
+        payload += struct.pack("=HH", 4 + len(attr_data), attr_type)
+        payload += attr_data + b"\0" * (-len(attr_data) % 4)
+    return struct.pack("=IHHIIBBHII", 28 + len(payload), RTM_GETSTATS, 0, seq,
+                       0, 0, 0, 0, 1, 0) + payload
+
+
+def error_reply(seq=1, error=-19):
+    return struct.pack("=IHHIIi", 20, NLMSG_ERROR, 0, seq, 0, error)
+
+
+class SocketMock(object):
+    """returns the given recv buffers in order"""
+    def __init__(self, buffers):
+        self.buffers = list(buffers)
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def recv(self, size):
+        return self.buffers.pop(0)
+
+    def close(self):
+        pass
+
+
+class NetlinkStatsReaderTest(TestCase):
+    def reader(self, stats):
+        reader = NetlinkStatsReader([1], stats)
+        self.addCleanup(reader.close)
+        return reader
+
+    def test_parse(self):
+        reader = self.reader(["rx_bytes", "tx_packets", "rx_nohandler"])
+        values = list(range(100, 100 + len(LINK_STATS64_FIELDS)))
+        self.assertEqual(reader._parse_reply(stats_reply(values)),
+                         [102, 101, 123])
+
+    def test_other_attributes_skipped(self):
+        reader = self.reader(["rx_packets"])
+        reply = stats_reply([7] * len(LINK_STATS64_FIELDS),
+                            attrs=[(2, b"\1\2\3")])
+        self.assertEqual(reader._parse_reply(reply), [7])
+
+    def test_short_struct(self):
+        # kernels before 5.19 don't report rx_otherhost_dropped, before 4.6
+        # rx_nohandler is missing as well
+        reader = self.reader(["rx_packets", "rx_nohandler",
+                              "rx_otherhost_dropped"])
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(reader._parse_reply(stats_reply([5] * 24)),
+                             [5, 5, 0])
+        self.assertEqual(reader._parse_reply(stats_reply([5] * 23)),
+                         [5, 0, 0])
+
+    def test_error(self):
+        reader = self.reader(["rx_packets"])
+        with self.assertRaises(ModuleError):
+            reader._parse_reply(error_reply())
+
+    def mocked_reader(self, ifindexes, buffers):
+        reader = NetlinkStatsReader(ifindexes, ["rx_packets"])
+        reader.close()
+        reader._sock = SocketMock(buffers)
+        return reader
+
+    def test_replies_in_one_buffer(self):
+        reader = self.mocked_reader([1, 2], [
+            stats_reply([2] * 24, seq=2) + stats_reply([1] * 24, seq=1)])
+        self.assertEqual(reader.read(), [[1], [2]])
+
+    def test_stale_reply_skipped(self):
+        reader = self.mocked_reader([1], [stats_reply([7] * 24, seq=0),
+                                          stats_reply([1] * 24, seq=1)])
+        self.assertEqual(reader.read(), [[1]])
+
+    def test_failed_request_drains_replies(self):
+        reader = self.mocked_reader([1, 2, 3], [
+            error_reply(seq=1), stats_reply([2] * 24, seq=2),
+            stats_reply([3] * 24, seq=3),
+            stats_reply([5] * 24, seq=5), stats_reply([4] * 24, seq=4),
+            stats_reply([6] * 24, seq=6)])
+        with self.assertRaises(ModuleError):
+            reader.read()
+        self.assertEqual(len(reader._sock.buffers), 3)
+        self.assertEqual(reader.read(), [[4], [5], [6]])
+
+    def test_read(self):
+        # the loopback device of the current namespace
+        reader = self.reader(["rx_packets", "tx_packets"])
+        values, = reader.read()
+        self.assertEqual(len(values), 2)